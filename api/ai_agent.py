@@ -1,6 +1,6 @@
 # --- Conteúdo do arquivo: api/ai_agent.py ---
 
-import requests
+import http_client
 
 import json
 
@@ -10,7 +10,19 @@ import unicodedata
 
 import logging
 
-from config import CLOUDFLARE_ACCOUNT_ID, CLOUDFLARE_API_TOKEN, CLOUDFLARE_AI_MODEL
+import time
+
+from config import CLOUDFLARE_ACCOUNT_ID, CLOUDFLARE_API_TOKEN, CLOUDFLARE_AI_MODEL, CLOUDFLARE_API_BASE, CLOUDFLARE_TIMEOUT_SEC
+
+from config import LLM_BREAKER_FAILURES, LLM_BREAKER_P95_MS, LLM_BREAKER_WINDOW, LLM_BREAKER_OPEN_SEC, INTENT_LATENCY_BUDGET_MS, INTENT_CLASSIFIER_DEGRADED_THRESHOLD
+
+from circuit_breaker import CircuitBreaker
+
+import intent_cache
+
+import intent_classifier
+
+import metrics
 
 
 
@@ -122,21 +134,43 @@ EMOJI_MAP = {
 
 
 
+GREETING_KEYWORDS = {"oi", "ola", "bom dia", "boa tarde", "boa noite"}
+
+
+
+# Intenções por palavra contida na mensagem, em ordem de prioridade (a primeira que casar vence).
+
+INTENT_KEYWORDS = [
+
+    ("thanking", ["obrigado", "obg", "valeu", "agradecido", "show de bola"]),
+
+    ("course_info", ["curso", "aula", "aprender"]),
+
+    ("cancel", ["cancelar", "desmarcar", "imprevisto"]),
+
+    ("get_info", ["valor", "preco", "quanto"]),
+
+    ("ask_availability", ["horario", "agenda", "só tem esses horários"]),
+
+]
+
+
+
 # --- Normalização de texto ---
 
 def normalize_text(text: str) -> str:
 
     text = text.lower().strip()
 
-    text = unicodedata.normalize('NFKD', text).encode('ASCII', 'ignore').decode('ASCII')
+    if not text.isascii():
 
-    for emoji, replacement in EMOJI_MAP.items():
+        text = unicodedata.normalize('NFKD', text).encode('ASCII', 'ignore').decode('ASCII')
 
-        text = text.replace(emoji, f" {replacement} ")
+    # A conversão para ASCII já descarta os emojis, então trocar os de EMOJI_MAP depois dela
 
-    text = re.sub(r'\s+', ' ', text)
+    # nunca tinha efeito; o laço foi retirado sem mudar o resultado.
 
-    return text.strip()
+    return ' '.join(text.split())
 
 
 
@@ -166,41 +200,67 @@ def local_intent_check(message: str):
 
     # Greeting simples
 
-    if msg_norm in {"oi", "ola", "bom dia", "boa tarde", "boa noite"}:
+    if msg_norm in GREETING_KEYWORDS:
 
         return {"intent": "greeting"}
 
-    # Agradecimento
+    # Agradecimento, curso / aula, cancelamento, pedido de preço e disponibilidade, nessa ordem.
 
-    if any(word in msg_norm for word in ["obrigado", "obg", "valeu", "agradecido", "show de bola"]):
+    # (Pedido de preço exige "curso" fora da frase, o que já é garantido por curso vir antes.)
 
-        return {"intent": "thanking"}
+    for intent, words in INTENT_KEYWORDS:
 
-    # Curso / aula
+        if any(word in msg_norm for word in words):
 
-    if any(word in msg_norm for word in ["curso", "aula", "aprender"]):
+            return {"intent": intent}
 
-        return {"intent": "course_info"}
+    return None
 
-    # Cancelamento
 
-    if any(word in msg_norm for word in ["cancelar", "desmarcar", "imprevisto"]):
 
-        return {"intent": "cancel"}
+# --- Matcher compilado (uma normalização, uma passada) ---
 
-    # Pedido de preço
+# Só entram palavras que sobrevivem à normalização: a mensagem normalizada não tem acentos
 
-    if any(word in msg_norm for word in ["valor", "preco", "quanto"]) and "curso" not in msg_norm:
+# nem emojis (a conversão para ASCII remove ambos), então "não", "tá" ou "👍" nunca casavam.
 
-        return {"intent": "get_info"}
+def _build_local_matcher():
 
-    # Disponibilidade
+    def reachable(words):
 
-    if any(word in msg_norm for word in ["horario", "agenda", "só tem esses horários"]):
+        return [word for word in words if normalize_text(word) == word]
 
-        return {"intent": "ask_availability"}
 
-    return None
+
+    exact = {}
+
+    for words, result in ((YES_KEYWORDS, {"intent": "confirmation", "confirmation": "yes"}),
+
+                          (NO_KEYWORDS, {"intent": "confirmation", "confirmation": "no"}),
+
+                          (GREETING_KEYWORDS, {"intent": "greeting"})):
+
+        for word in reachable(words):
+
+            exact.setdefault(word, result)
+
+
+
+    # Um lookahead por intenção, alternados na ordem de prioridade: o primeiro ramo que casar vence.
+
+    branches = [
+
+        f"(?=.*?(?:{'|'.join(re.escape(word) for word in reachable(words))}))(?P<{intent}>)"
+
+        for intent, words in INTENT_KEYWORDS if reachable(words)
+
+    ]
+
+    return exact, re.compile(f"(?:{'|'.join(branches)})", re.DOTALL)
+
+
+
+_LOCAL_EXACT, _LOCAL_PATTERN = _build_local_matcher()
 
 
 
@@ -208,29 +268,61 @@ def local_intent_check(message: str):
 
 def detect_local_intent(message: str):
 
-    local_conf = local_confirmation_check(message)
+    # Equivale a local_confirmation_check seguido de local_intent_check (ver tools/bench_intent_matcher.py).
+
+    msg_norm = normalize_text(message)
+
+    exact = _LOCAL_EXACT.get(msg_norm)
 
-    if local_conf:
+    if exact:
 
-        return local_conf
+        return dict(exact)
 
-    return local_intent_check(message)
+    match = _LOCAL_PATTERN.match(msg_norm)
+
+    return {"intent": match.lastgroup} if match else None
 
 
 
 # --- Chamada para Cloudflare AI ---
 
-def call_cloudflare_ai(messages):
+# Disjuntor da IA: com a Cloudflare fora do ar ou lenta, as mensagens deixam de esperar por ela
+
+# e são respondidas só pelas regras locais, cache e classificador até a chamada de teste passar.
+
+llm_breaker = CircuitBreaker('cloudflare_ai', LLM_BREAKER_FAILURES, LLM_BREAKER_P95_MS, LLM_BREAKER_WINDOW, LLM_BREAKER_OPEN_SEC)
+
+
+
+@metrics.timed(metrics.LLM_SECONDS)
+
+def _query_cloudflare_ai(messages, deadline=None):
+
+    """JSON extraído da resposta da IA, ou None se a chamada falhar (falhas não vão para o cache)."""
+
+    start = time.perf_counter()
 
     try:
 
-        api_url = f"https://api.cloudflare.com/client/v4/accounts/{CLOUDFLARE_ACCOUNT_ID}/ai/run/{CLOUDFLARE_AI_MODEL}"
+        api_url = f"{CLOUDFLARE_API_BASE}/accounts/{CLOUDFLARE_ACCOUNT_ID}/ai/run/{CLOUDFLARE_AI_MODEL}"
 
         headers = {"Authorization": f"Bearer {CLOUDFLARE_API_TOKEN}"}
 
-        response = requests.post(api_url, headers=headers, json={"messages": messages}, timeout=10)
+        # Inferência não tem efeito colateral: pode ser repetida em caso de falha de rede ou 5xx.
+
+        response = http_client.post(api_url, timeout=CLOUDFLARE_TIMEOUT_SEC, idempotent=True, deadline=deadline, headers=headers, json={"messages": messages})
 
-        response.raise_for_status()
+    except Exception as e:
+
+        llm_breaker.record_failure(time.perf_counter() - start)
+
+        logging.warning(f"!!! ERRO AO CHAMAR API CLOUDFLARE: {e}")
+
+        return None
+
+    llm_breaker.record_success(time.perf_counter() - start)
+
+    try:
 
         result = response.json()
 
@@ -248,15 +340,29 @@ def call_cloudflare_ai(messages):
 
     except Exception as e:
 
-        logging.warning(f"!!! ERRO AO CHAMAR API CLOUDFLARE: {e}")
+        logging.warning(f"!!! ERRO AO LER RESPOSTA DA CLOUDFLARE: {e}")
+
+    return None
+
+
+
+def call_cloudflare_ai(messages, deadline=None):
 
-    return {"intent": "unknown"}
+    return _query_cloudflare_ai(messages, deadline) or {"intent": "unknown"}
 
 
 
 # --- Função principal de extração de intenção ---
 
-def extract_intent(user_message: str, history: list = None):
+@metrics.timed(metrics.INTENT_SECONDS)
+
+def extract_intent(user_message: str, history: list = None, deadline: float = None):
+
+    # 'deadline' (time.monotonic()) é o limite para a extração; por padrão, INTENT_LATENCY_BUDGET_MS a partir de agora
+
+    if deadline is None:
+
+        deadline = time.monotonic() + INTENT_LATENCY_BUDGET_MS / 1000
 
     # 1. Tenta detectar localmente
 
@@ -264,20 +370,86 @@ def extract_intent(user_message: str, history: list = None):
 
     if local_intent:
 
+        metrics.INTENT_SOURCE.inc('local')
+
         return local_intent, []
 
 
 
-    # 2. Se não detectado localmente, chama API Cloudflare
+    # 2. Mesma mensagem com o mesmo contexto e o mesmo prompt já respondida pela IA
 
-    messages = [{"role": "system", "content": SYSTEM_INSTRUCTION}]
+    history_window = history[-3:] if history else []
+
+    msg_norm = normalize_text(user_message)
+
+    version = intent_cache.prompt_version(SYSTEM_INSTRUCTION)
+
+    cache_key = intent_cache.make_key(msg_norm, history_window, version)
+
+    cached = intent_cache.get(cache_key, version)
+
+    if cached is not None:
+
+        metrics.INTENT_SOURCE.inc('cache')
+
+        return cached, []
+
+
+
+    # 3. Classificador local treinado com as respostas da IA (só responde com confiança alta)
 
-    if history:
+    classified = intent_classifier.classify(msg_norm)
 
-        messages.extend(history[-3:])
+    if classified is not None:
+
+        metrics.INTENT_SOURCE.inc('classifier')
+
+        return classified, []
+
+
+
+    # 4. IA indisponível (disjuntor aberto): aceita o classificador com confiança menor, senão 'unknown' na hora
+
+    if not llm_breaker.allow():
+
+        degraded = intent_classifier.classify(msg_norm, threshold=INTENT_CLASSIFIER_DEGRADED_THRESHOLD)
+
+        if degraded is not None:
+
+            metrics.INTENT_SOURCE.inc('classifier_degraded')
+
+            return degraded, []
+
+        metrics.INTENT_SOURCE.inc('breaker_open')
+
+        logging.info("Disjuntor da IA aberto: mensagem sem regra local segue como 'unknown'.")
+
+        return {"intent": "unknown"}, []
+
+
+
+    # 5. Se não detectado localmente, chama API Cloudflare dentro do orçamento de latência
+
+    messages = [{"role": "system", "content": SYSTEM_INSTRUCTION}]
+
+    messages.extend(history_window)
 
     messages.append({"role": "user", "content": user_message})
 
 
 
-    return call_cloudflare_ai(messages), []
+    result = _query_cloudflare_ai(messages, deadline)
+
+    if result is None:
+
+        metrics.INTENT_SOURCE.inc('llm_failed')
+
+        return {"intent": "unknown"}, []
+
+    metrics.INTENT_SOURCE.inc('llm')
+
+    intent_cache.put(cache_key, version, result)
+
+    intent_classifier.log_label(user_message, result, bool(history_window))
+
+    return result, []
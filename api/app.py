@@ -2,7 +2,7 @@ import logging
 
 import os
 
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response
 
 from waitress import serve
 
@@ -22,7 +22,23 @@ from handlers import menu_handler, scheduling_handler, cancellation_handler
 
 from services.reminder_service import start_reminder_scheduler
 
-from message_queue import queue_message, start_queue_worker
+from services import availability_grid
+
+from message_queue import queue_message, start_queue_worker, get_queue_stats
+
+import inbound_queue
+
+import intent_cache
+
+import http_client
+
+import metrics
+
+import tracing
+
+import date_parser
+
+from config import INGEST_MODE
 
 from message_manager import load_messages, get_message
 
@@ -58,7 +74,62 @@ ESCAPE_INTENTS = ['get_info', 'course_info', 'human_transfer']
 
 MENU_COMMANDS = {'menu', 'início', 'inicio', 'oi', 'olá', 'ola'}
 
+# Mensagens tratadas sempre sozinhas, nunca juntadas com as vizinhas numa rajada (ver inbound_queue.py).
+
+STANDALONE_COMMANDS = {'menu', 'início', 'inicio', '#pausarbot', '#reativarbot'}
+
+# Estados em que cada mensagem é uma resposta própria (sim/não, nome, horário, observação):
+# nesses, mensagens seguidas são processadas uma a uma, sem junção.
+
+NO_MERGE_STATES = {
+
+    'AWAITING_CANCEL_CONFIRM', 'AWAITING_CANCEL_TOO_CLOSE_CONFIRM', 'AWAITING_POLICY_CONFIRM',
+
+    'AWAITING_REMINDER_CONFIRMATION', 'AWAITING_TRANSFER_CONFIRM',
+
+    'AWAITING_NAME', 'AWAITING_TIME', 'AWAITING_OBS',
+
+}
+
+
+
+def local_date_time_intent(state, message):
+
+    """
+
+    Intenção montada localmente quando a mensagem é só uma data em AWAITING_DATE ("dia 5",
+
+    "sexta que vem") ou só um horário em AWAITING_TIME ("10h", "3 da tarde", "1330").
+
+    Retorna None nos outros casos, e a mensagem segue para ai_agent.extract_intent.
+
+    """
+
+    if state not in ("AWAITING_DATE", "AWAITING_TIME"):
+
+        return None
+
+    parsed = date_parser.parse(message)
+
+    if state == "AWAITING_DATE" and parsed.date is not None and parsed.only_date_time:
+
+        metrics.INTENT_SOURCE.inc('date_parser')
+
+        return {"intent": "schedule", "date_str": message}
+
+    time_str = parsed.time or parsed.bare_time
+
+    if state == "AWAITING_TIME" and time_str and parsed.date is None and all(value.isdigit() for value in parsed.leftover):
 
+        metrics.INTENT_SOURCE.inc('date_parser')
+
+        return {"intent": "schedule", "time_str": time_str}
+
+    return None
+
+
+
+@metrics.timed(metrics.PROCESS_MESSAGE_SECONDS)
 
 def process_message(user_id, raw_message):
 
@@ -78,7 +149,15 @@ def process_message(user_id, raw_message):
 
     updated_history = history + [{"role": "user", "content": raw_message_clean}]
 
-    extracted_intent, _ = ai_agent.extract_intent(raw_message_clean, history)
+    database_manager.append_turn(user_id, "user", raw_message_clean)
+
+    # Resposta que é só a data (ou o horário) que o passo pediu: o date_parser já basta, sem a IA
+
+    extracted_intent = local_date_time_intent(state, raw_message_clean)
+
+    if extracted_intent is None:
+
+        extracted_intent, _ = ai_agent.extract_intent(raw_message_clean, history)
 
     intent = extracted_intent.get("intent")
 
@@ -102,7 +181,9 @@ def process_message(user_id, raw_message):
 
             database_manager.set_user_state_and_history(user_id, "INITIAL", {}, [])
 
-            return process_message(user_id, raw_message)
+            # Mesmo turno reprocessado do zero: chama a versão sem o @metrics.timed, para não medir (nem abrir span) duas vezes.
+
+            return process_message.__wrapped__(user_id, raw_message)
 
 
 
@@ -282,6 +363,40 @@ def process_message(user_id, raw_message):
 
 
 
+def handle_inbound_message(user_id, raw_message):
+
+    """Processa uma mensagem recebida e enfileira a resposta (workers da fila de entrada, ou inline no modo 'sync')."""
+
+    try:
+
+        response_text = process_message(user_id, raw_message)
+
+        if response_text:
+
+            queue_message(user_id, response_text)
+
+    except Exception as e:
+
+        logging.critical(f"ERRO CRÍTICO NO PROCESSAMENTO DA MENSAGEM: {e}", exc_info=True)
+
+        traceback.print_exc()
+
+        queue_message(user_id, get_message('CRITICAL_ERROR_WEBHOOK'))
+
+
+
+def can_merge_message(user_id, text):
+
+    text = text.strip().lower()
+
+    if text in STANDALONE_COMMANDS or text.isdigit():
+
+        return False
+
+    return database_manager.get_user_state(user_id) not in NO_MERGE_STATES
+
+
+
 @app.route('/webhook', methods=['POST'])
 
 def handle_webhook():
@@ -300,37 +415,71 @@ def handle_webhook():
 
 
 
+    # Trace id criado pelo gateway (cabeçalho ou payload) ou um novo; volta no cabeçalho da resposta.
+
+    trace_id = tracing.accept_trace_id(request.headers.get(tracing.TRACE_HEADER) or webhook_data.get('traceId')) or tracing.new_trace_id()
+
+    with tracing.start_trace(trace_id), tracing.span('app.webhook', user_id=user_id, mode=INGEST_MODE):
+
+        response = ingest_message(user_id, raw_message, trace_id)
+
+    response.headers[tracing.TRACE_HEADER] = trace_id
+
+    return response
+
+
+
+def ingest_message(user_id, raw_message, trace_id=None):
+
+    # A mensagem é sempre gravada; nada se perde se o usuário já estiver em processamento.
+
+    inbound_queue.enqueue_inbound(user_id, raw_message, trace_id)
+
+
+
+    if INGEST_MODE == 'async':
+
+        # Só grava e responde; os workers de conversa processam em segundo plano.
+
+        return jsonify({"status": "ok", "action": "accepted"})
+
+
+
     with user_locks[user_id]:
 
         if user_id in users_being_processed:
 
-            logging.info(f"Lock: Mensagem de {user_id} ignorada, processamento anterior em andamento.")
+            logging.info(f"Lock: Mensagem de {user_id} guardada, será juntada ao fim do processamento em andamento.")
 
-            return jsonify({"status": "ok", "action": "ignored_due_to_lock"})
+            return jsonify({"status": "ok", "action": "buffered"})
 
         users_being_processed.add(user_id)
 
 
 
-        try:
+    # Modo 'sync': esta requisição processa a mensagem e tudo o que chegar do usuário enquanto isso.
+
+    try:
 
-            response_text = process_message(user_id, raw_message)
+        while True:
 
-            if response_text:
+            drained = inbound_queue.drain_user_inbox(user_id, handle_inbound_message, can_merge_message)
 
-                queue_message(user_id, response_text)
+            with user_locks[user_id]:
 
-        except Exception as e:
+                if not drained or not inbound_queue.has_pending(user_id):
 
-            logging.critical(f"ERRO CRÍTICO NO PROCESSAMENTO DA MENSAGEM: {e}", exc_info=True)
+                    users_being_processed.discard(user_id)
 
-            traceback.print_exc()
+                    break
 
-            queue_message(user_id, get_message('CRITICAL_ERROR_WEBHOOK'))
+    except Exception:
 
-        finally:
+        with user_locks[user_id]:
 
-            users_being_processed.remove(user_id)
+            users_being_processed.discard(user_id)
+
+        raise
 
 
 
@@ -350,12 +499,90 @@ def check_user_state():
 
 
 
-    state, _, _ = database_manager.get_user_state_and_history(user_id)
+    # O gateway consulta o estado antes do /webhook com o mesmo trace id da mensagem.
+
+    with tracing.start_trace(tracing.accept_trace_id(request.headers.get(tracing.TRACE_HEADER))), tracing.span('app.check_state', user_id=user_id):
+
+        state, _, _ = database_manager.get_user_state_and_history(user_id)
 
     return jsonify({"state": state})
 
 
 
+@app.route('/ingest-stats', methods=['GET'])
+
+def ingest_stats():
+
+    return jsonify(inbound_queue.get_ingest_stats())
+
+
+
+def collect_runtime_metrics():
+
+    """Valores do momento para o /metrics: filas, caches, disjuntor da IA e HTTP por host."""
+
+    outbound = get_queue_stats()
+
+    inbound = inbound_queue.get_ingest_stats()
+
+    cache = intent_cache.get_stats()
+
+    breaker = ai_agent.llm_breaker.get_stats()
+
+    http_stats = http_client.get_stats()
+
+    grid = availability_grid.get_stats()
+
+    return [
+
+        ('glassy_outbound_queue_depth', 'Mensagens na fila de envio.', 'gauge', outbound['depth']),
+
+        ('glassy_outbound_queue_oldest_age_seconds', 'Idade da mensagem mais antiga na fila de envio.', 'gauge', outbound['oldest_age_sec']),
+
+        ('glassy_inbound_queue_depth', 'Mensagens recebidas ainda não processadas.', 'gauge', inbound['depth']),
+
+        ('glassy_inbound_queue_oldest_age_seconds', 'Idade da mensagem recebida mais antiga ainda na fila.', 'gauge', inbound['oldest_pending_age_sec']),
+
+        ('glassy_intent_cache_hit_ratio', 'Taxa de acerto do cache de intenções.', 'gauge', cache['hit_rate']),
+
+        ('glassy_intent_cache_lookups_total', 'Consultas ao cache de intenções.', 'counter',
+
+         [({'result': 'hit'}, cache['hits']), ({'result': 'miss'}, cache['misses'])]),
+
+        ('glassy_availability_grid_lookups_total', 'Consultas à grade de disponibilidade.', 'counter',
+
+         [({'result': 'hit'}, grid['hits']), ({'result': 'miss'}, grid['misses'])]),
+
+        ('glassy_availability_grid_pending_days', 'Dias invalidados esperando o recálculo da grade.', 'gauge', grid['pending']),
+
+        ('glassy_llm_breaker_open', 'Disjuntor da IA aberto (1) ou meio-aberto/fechado (0).', 'gauge', int(breaker['state'] == 'open')),
+
+        ('glassy_llm_breaker_opened_total', 'Vezes que o disjuntor da IA abriu.', 'counter', breaker['opened']),
+
+        ('glassy_http_requests_total', 'Requisições HTTP por host (inclui novas tentativas).', 'counter',
+
+         [({'host': host}, stats['requests']) for host, stats in http_stats.items()]),
+
+        ('glassy_http_errors_total', 'Requisições HTTP com erro por host.', 'counter',
+
+         [({'host': host}, stats['errors']) for host, stats in http_stats.items()]),
+
+    ]
+
+
+
+metrics.register_collector(collect_runtime_metrics)
+
+
+
+@app.route('/metrics', methods=['GET'])
+
+def metrics_endpoint():
+
+    return Response(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+
 if __name__ == '__main__':
 
     print("Iniciando a API da Glassy...")
@@ -372,8 +599,14 @@ if __name__ == '__main__':
 
     start_reminder_scheduler()
 
+    availability_grid.start_grid_worker()
+
     start_queue_worker()
 
+    if INGEST_MODE == 'async':
+
+        inbound_queue.start_inbox_workers(handle_inbound_message, can_merge_message)
+
 
 
     port = int(os.environ.get('PORT', 5000))
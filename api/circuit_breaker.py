@@ -0,0 +1,94 @@
+# --- Conteúdo do arquivo: api/circuit_breaker.py ---
+import time
+import logging
+import threading
+from collections import deque
+
+# Disjuntor para dependências remotas (hoje, a IA da Cloudflare).
+#   fechado     -> chamadas passam; abre após N falhas seguidas ou p95 acima do limite
+#   aberto      -> chamadas recusadas na hora (o chamador usa o plano B) por open_seconds
+#   meio-aberto -> deixa passar UMA chamada de teste: sucesso fecha, falha reabre
+
+CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half_open'
+
+class CircuitBreaker:
+    def __init__(self, name, failure_threshold, p95_threshold_ms, window, open_seconds, min_samples=5):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.p95_threshold_ms = p95_threshold_ms
+        self.open_seconds = open_seconds
+        self.min_samples = min_samples
+        self._latencies = deque(maxlen=window)
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._consecutive_failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._probe_started = 0.0
+        self._stats = {'opened': 0, 'rejected': 0, 'successes': 0, 'failures': 0}
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._state
+
+    def allow(self):
+        """True se a chamada pode ser feita agora. No meio-aberto, só a chamada de teste passa."""
+        with self._lock:
+            if self._state == OPEN and time.monotonic() - self._opened_at >= self.open_seconds:
+                self._state = HALF_OPEN
+                self._probe_in_flight = False
+                logging.info(f"Disjuntor '{self.name}' meio-aberto: testando a dependência.")
+            if self._state == CLOSED:
+                return True
+            # (uma chamada de teste que nunca reportou resultado não trava o disjuntor para sempre)
+            now = time.monotonic()
+            if self._state == HALF_OPEN and (not self._probe_in_flight or now - self._probe_started >= self.open_seconds):
+                self._probe_in_flight = True
+                self._probe_started = now
+                return True
+            self._stats['rejected'] += 1
+            return False
+
+    def record_success(self, latency_sec):
+        with self._lock:
+            self._stats['successes'] += 1
+            self._consecutive_failures = 0
+            self._latencies.append(latency_sec * 1000)
+            if self._state == HALF_OPEN:
+                self._close()
+            elif self._state == CLOSED and self._p95_breached():
+                self._open(f"p95 acima de {self.p95_threshold_ms:.0f} ms")
+
+    def record_failure(self, latency_sec):
+        with self._lock:
+            self._stats['failures'] += 1
+            self._consecutive_failures += 1
+            self._latencies.append(latency_sec * 1000)
+            if self._state == HALF_OPEN:
+                self._open("falha na chamada de teste")
+            elif self._state == CLOSED and self._consecutive_failures >= self.failure_threshold:
+                self._open(f"{self._consecutive_failures} falhas seguidas")
+
+    def _p95_breached(self):
+        if len(self._latencies) < self.min_samples:
+            return False
+        ordered = sorted(self._latencies)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] > self.p95_threshold_ms
+
+    def _open(self, reason):
+        self._state = OPEN
+        self._opened_at = time.monotonic()
+        self._probe_in_flight = False
+        self._stats['opened'] += 1
+        logging.warning(f"Disjuntor '{self.name}' ABERTO ({reason}); usando só regras locais por {self.open_seconds:.0f}s.")
+
+    def _close(self):
+        self._state = CLOSED
+        self._consecutive_failures = 0
+        self._latencies.clear()
+        logging.info(f"Disjuntor '{self.name}' fechado: dependência respondendo de novo.")
+
+    def get_stats(self):
+        with self._lock:
+            return dict(self._stats, state=self._state, consecutive_failures=self._consecutive_failures)
@@ -4,13 +4,15 @@ from dotenv import load_dotenv
 load_dotenv()
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-DB_PATH = os.path.join(BASE_DIR, '..', 'database', 'conversations.db')
+DB_PATH = os.getenv('DB_PATH', os.path.join(BASE_DIR, '..', 'database', 'conversations.db'))
 CREDENTIALS_PATH = os.path.join(BASE_DIR, 'credentials.json')
 SCOPES = ['https://www.googleapis.com/auth/calendar']
 
 CLOUDFLARE_ACCOUNT_ID = os.getenv("CLOUDFLARE_ACCOUNT_ID")
 CLOUDFLARE_API_TOKEN = os.getenv("CLOUDFLARE_API_TOKEN")
 CLOUDFLARE_AI_MODEL = '@cf/meta/llama-3-8b-instruct'
+# Base da API (pode apontar para o fakes/cloudflare_fake.py em testes locais).
+CLOUDFLARE_API_BASE = os.getenv('CLOUDFLARE_API_BASE', 'https://api.cloudflare.com/client/v4')
 
 CALENDAR_ID = 'contatoglassstudio@gmail.com'
 AGENT_WHATSAPP_NUMBER = '553799582660'
@@ -21,4 +23,119 @@ GATEWAY_URL = os.getenv('GATEWAY_URL', 'http://localhost:3000/send-message')
 
 HORARIOS_FIXOS = ["07:00", "10:00", "13:00", "16:00"]
 DURACAO_EVENTO_MIN = 150
-ENDERECO_STUDIO = "R. Juca Dias, 196, São Judas, Arcos/MG - CEP: 35600-144"
\ No newline at end of file
+ENDERECO_STUDIO = "R. Juca Dias, 196, São Judas, Arcos/MG - CEP: 35600-144"
+
+# --- ESPELHO LOCAL DO GOOGLE AGENDA ---
+# 'google' usa a API real; 'fake' usa o dublê em memória de fakes/calendar_fake.py (testes offline).
+CALENDAR_BACKEND = os.getenv('CALENDAR_BACKEND', 'google')
+# Idade máxima (segundos) do espelho antes de uma leitura disparar uma sincronização incremental.
+CALENDAR_SYNC_MAX_AGE_SEC = int(os.getenv('CALENDAR_SYNC_MAX_AGE_SEC', 60))
+# Quantos dias para trás a sincronização completa baixa; eventos encerrados antes disso saem do espelho.
+CALENDAR_MIRROR_PAST_DAYS = int(os.getenv('CALENDAR_MIRROR_PAST_DAYS', 1))
+
+# --- CLIENTE GOOGLE COMPARTILHADO (services/google_client.py) ---
+GOOGLE_DISCOVERY_CACHE_DIR = os.getenv('GOOGLE_DISCOVERY_CACHE_DIR', os.path.join(BASE_DIR, 'discovery_cache'))
+GOOGLE_HTTP_TIMEOUT_SEC = int(os.getenv('GOOGLE_HTTP_TIMEOUT_SEC', 20))
+
+# --- FILA DE ENVIO (message_queue.py) ---
+QUEUE_WORKERS = int(os.getenv('QUEUE_WORKERS', 4))
+# Polling de segurança: normalmente os workers são acordados por queue_message na hora.
+QUEUE_POLL_INTERVAL_SEC = float(os.getenv('QUEUE_POLL_INTERVAL_SEC', 30))
+QUEUE_WAKEUP_PORT = int(os.getenv('QUEUE_WAKEUP_PORT', 5099))
+# Reserva abandonada (worker travado ou processo morto) volta para a fila após este tempo.
+QUEUE_CLAIM_TIMEOUT_SEC = int(os.getenv('QUEUE_CLAIM_TIMEOUT_SEC', 60))
+QUEUE_RETRY_DELAY_SEC = float(os.getenv('QUEUE_RETRY_DELAY_SEC', 2))
+# Quantas mídias do media store ficam em memória já em base64 (LRU).
+MEDIA_BASE64_CACHE_SIZE = int(os.getenv('MEDIA_BASE64_CACHE_SIZE', 8))
+
+# --- SQLITE (connection_manager.py) ---
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv('SQLITE_BUSY_TIMEOUT_MS', 5000))
+SQLITE_CACHED_STATEMENTS = int(os.getenv('SQLITE_CACHED_STATEMENTS', 256))
+
+# --- HISTÓRICO DE CONVERSA (tabela conversation_turns) ---
+# Turnos carregados como contexto para a IA (extract_intent usa os 3 últimos).
+HISTORY_CONTEXT_TURNS = int(os.getenv('HISTORY_CONTEXT_TURNS', 3))
+# Turnos mantidos por usuário; os mais antigos são apagados a cada novo turno.
+HISTORY_RETENTION_TURNS = int(os.getenv('HISTORY_RETENTION_TURNS', 50))
+
+# --- MOTOR DE LEMBRETES (services/reminder_service.py) ---
+# Sono máximo entre verificações, mesmo sem lembrete próximo (rede de segurança).
+REMINDER_MAX_SLEEP_SEC = int(os.getenv('REMINDER_MAX_SLEEP_SEC', 300))
+# Anota "Lembrete_XX_OK" na descrição do evento no Google após o envio (opcional, só informativo;
+# o controle de envio fica na tabela reminder_ledger). As anotações são enviadas em lote.
+REMINDER_ANNOTATE_CALENDAR = os.getenv('REMINDER_ANNOTATE_CALENDAR', 'false').lower() in ('1', 'true', 'yes')
+
+# --- ENTRADA DE MENSAGENS (inbound_queue.py) ---
+# 'async': o /webhook só grava a mensagem e responde na hora; workers processam em segundo plano.
+# 'sync': comportamento antigo, processamento dentro da requisição do gateway.
+INGEST_MODE = os.getenv('INGEST_MODE', 'async')
+# Conversas processadas em paralelo (sempre uma mensagem por vez para o mesmo usuário).
+INBOX_WORKERS = int(os.getenv('INBOX_WORKERS', 4))
+INBOX_POLL_INTERVAL_SEC = int(os.getenv('INBOX_POLL_INTERVAL_SEC', 30))
+# Reserva considerada abandonada (worker morreu no meio) depois deste tempo; a mensagem volta para a fila.
+INBOX_CLAIM_TIMEOUT_SEC = int(os.getenv('INBOX_CLAIM_TIMEOUT_SEC', 120))
+# Mensagens seguidas do mesmo usuário viram um único turno. Uma mensagem sozinha é processada na hora;
+# o que chega durante o processamento é juntado no turno seguinte. Só quando chegaram duas mensagens
+# a menos de COALESCE_DEBOUNCE_MS uma da outra o worker espera esse silêncio antes de juntar.
+# COALESCE_MAX_WAIT_MS limita a espera de quem não para de digitar.
+COALESCE_DEBOUNCE_MS = int(os.getenv('COALESCE_DEBOUNCE_MS', 300))
+COALESCE_MAX_WAIT_MS = int(os.getenv('COALESCE_MAX_WAIT_MS', 4000))
+
+# --- CACHE DE INTENÇÕES DA IA (intent_cache.py) ---
+INTENT_CACHE_SIZE = int(os.getenv('INTENT_CACHE_SIZE', 2000))
+INTENT_CACHE_TTL_SEC = int(os.getenv('INTENT_CACHE_TTL_SEC', 7 * 24 * 3600))
+# Grava as entradas no SQLite para o cache já começar quente depois de reiniciar.
+INTENT_CACHE_PERSIST = os.getenv('INTENT_CACHE_PERSIST', 'true').lower() in ('1', 'true', 'yes')
+
+# --- CLASSIFICADOR LOCAL DE INTENÇÕES (intent_classifier.py) ---
+# Modelo treinado com tools/train_intent_classifier.py a partir das respostas da IA (tabela intent_labels).
+# Sem o arquivo do modelo, tudo segue direto para a IA.
+INTENT_CLASSIFIER_PATH = os.getenv('INTENT_CLASSIFIER_PATH', os.path.join(BASE_DIR, 'models', 'intent_classifier.json'))
+# Confiança mínima para responder sem chamar a IA.
+INTENT_CLASSIFIER_THRESHOLD = float(os.getenv('INTENT_CLASSIFIER_THRESHOLD', 0.9))
+# Guarda cada mensagem respondida pela IA com o rótulo devolvido (dados de treino).
+INTENT_LABEL_LOG = os.getenv('INTENT_LABEL_LOG', 'true').lower() in ('1', 'true', 'yes')
+# Rótulos guardados no máximo (os mais antigos saem a cada inserção).
+INTENT_LABEL_RETENTION = int(os.getenv('INTENT_LABEL_RETENTION', 50000))
+
+# --- CLIENTE HTTP COMPARTILHADO (http_client.py) ---
+# Conexões mantidas abertas por host (keep-alive).
+HTTP_POOL_SIZE = int(os.getenv('HTTP_POOL_SIZE', 10))
+HTTP_CONNECT_TIMEOUT_SEC = float(os.getenv('HTTP_CONNECT_TIMEOUT_SEC', 3))
+# Novas tentativas (só em chamadas idempotentes), com espera exponencial e jitter a partir da base.
+HTTP_MAX_RETRIES = int(os.getenv('HTTP_MAX_RETRIES', 2))
+HTTP_RETRY_BASE_SEC = float(os.getenv('HTTP_RETRY_BASE_SEC', 0.3))
+CLOUDFLARE_TIMEOUT_SEC = float(os.getenv('CLOUDFLARE_TIMEOUT_SEC', 10))
+GATEWAY_TIMEOUT_SEC = float(os.getenv('GATEWAY_TIMEOUT_SEC', 20))
+
+# --- DISJUNTOR E ORÇAMENTO DE LATÊNCIA DA IA (circuit_breaker.py) ---
+# Abre depois de N falhas seguidas ou quando o p95 das últimas chamadas passa do limite.
+LLM_BREAKER_FAILURES = int(os.getenv('LLM_BREAKER_FAILURES', 3))
+LLM_BREAKER_P95_MS = float(os.getenv('LLM_BREAKER_P95_MS', 5000))
+LLM_BREAKER_WINDOW = int(os.getenv('LLM_BREAKER_WINDOW', 20))
+# Tempo aberto antes de deixar passar uma chamada de teste (meio-aberto).
+LLM_BREAKER_OPEN_SEC = float(os.getenv('LLM_BREAKER_OPEN_SEC', 30))
+# Tempo máximo da extração de intenção por mensagem, somando tentativas.
+INTENT_LATENCY_BUDGET_MS = float(os.getenv('INTENT_LATENCY_BUDGET_MS', 6000))
+# Com o disjuntor aberto, o classificador local responde com uma confiança menor que a normal.
+INTENT_CLASSIFIER_DEGRADED_THRESHOLD = float(os.getenv('INTENT_CLASSIFIER_DEGRADED_THRESHOLD', 0.6))
+
+# --- RASTREAMENTO DE MENSAGENS (tracing.py) ---
+# Cada mensagem ganha um trace id (vindo do gateway ou criado no /webhook) e as etapas viram spans
+# gravados em TRACE_FILE (JSON por linha, com rotação). Veja com: python -m tools.trace_waterfall
+TRACING_ENABLED = os.getenv('TRACING_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+TRACE_FILE = os.getenv('TRACE_FILE', os.path.join(BASE_DIR, 'traces.jsonl'))
+TRACE_MAX_BYTES = int(os.getenv('TRACE_MAX_BYTES', 5 * 1024 * 1024))
+TRACE_BACKUP_COUNT = int(os.getenv('TRACE_BACKUP_COUNT', 3))
+
+# --- CATÁLOGO DE MENSAGENS (message_manager.py) ---
+# messages.csv é compilado ao carregar e recarregado quando o arquivo muda, sem reiniciar o bot.
+MESSAGES_FILE = os.getenv('MESSAGES_FILE', os.path.join(BASE_DIR, 'messages.csv'))
+# De quanto em quanto tempo (no máximo) get_message confere a data de modificação do arquivo. 0 desliga.
+MESSAGES_RELOAD_CHECK_SEC = float(os.getenv('MESSAGES_RELOAD_CHECK_SEC', 2))
+
+# --- GRADE DE DISPONIBILIDADE (services/availability_grid.py) ---
+# Horários livres dos próximos N dias, calculados a partir do espelho da agenda e guardados em
+# memória e no SQLite. A antecedência mínima e a regra das 07:00 são aplicadas na leitura.
+AVAILABILITY_GRID_DAYS = int(os.getenv('AVAILABILITY_GRID_DAYS', 30))
+SLOT_MIN_LEAD_HOURS = int(os.getenv('SLOT_MIN_LEAD_HOURS', 3))
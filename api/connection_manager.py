@@ -0,0 +1,67 @@
+# --- Conteúdo do arquivo: api/connection_manager.py ---
+import sqlite3
+import threading
+from contextlib import contextmanager
+from config import DB_PATH, SQLITE_BUSY_TIMEOUT_MS, SQLITE_CACHED_STATEMENTS
+
+# Camada única de acesso ao SQLite.
+# Cada thread (waitress, worker da fila, agendador) mantém UMA conexão reaproveitada,
+# já configurada com WAL, synchronous=NORMAL e busy timeout, e com o cache de
+# statements preparados do módulo sqlite3 ampliado. Leitores não bloqueiam escritores.
+
+_local = threading.local()
+
+PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-8000",
+)
+
+def _open(db_path):
+    conn = sqlite3.connect(
+        db_path,
+        timeout=SQLITE_BUSY_TIMEOUT_MS / 1000,
+        check_same_thread=False,
+        cached_statements=SQLITE_CACHED_STATEMENTS,
+    )
+    conn.row_factory = sqlite3.Row
+    for pragma in PRAGMAS:
+        conn.execute(pragma)
+    return conn
+
+def get_connection(db_path=None):
+    """Conexão da thread atual para o banco (padrão: DB_PATH), criada na primeira chamada."""
+    db_path = db_path or DB_PATH
+    connections = getattr(_local, 'connections', None)
+    if connections is None:
+        connections = _local.connections = {}
+    conn = connections.get(db_path)
+    if conn is None:
+        conn = connections[db_path] = _open(db_path)
+    return conn
+
+@contextmanager
+def transaction(immediate=False, db_path=None):
+    """
+    Abre uma transação na conexão da thread e faz commit (ou rollback em caso de erro).
+    Use immediate=True quando a transação lê e depois escreve (ex.: reservar um job),
+    para pegar a trava de escrita logo no início e evitar SQLITE_BUSY no meio.
+    """
+    conn = get_connection(db_path)
+    if immediate:
+        conn.execute("BEGIN IMMEDIATE")
+    try:
+        yield conn
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+
+def close_connection(db_path=None):
+    """Fecha a conexão da thread atual (ex.: ao encerrar um worker)."""
+    connections = getattr(_local, 'connections', {})
+    conn = connections.pop(db_path or DB_PATH, None)
+    if conn is not None:
+        conn.close()
@@ -2,15 +2,75 @@
 
 
 
-import sqlite3
-
 import json
 
 import os
 
 from datetime import datetime
 
-from config import DB_PATH
+from config import DB_PATH, HISTORY_CONTEXT_TURNS, HISTORY_RETENTION_TURNS
+
+from connection_manager import get_connection, transaction
+
+import metrics
+
+
+
+# Estados que nunca expiram por inatividade (check_state_timeouts).
+
+TIMEOUT_EXEMPT_STATES = ('INITIAL', 'HUMAN_ATTENDANCE', 'AWAITING_REMINDER_CONFIRMATION')
+
+_EXPIRABLE = f"state NOT IN {TIMEOUT_EXEMPT_STATES!r}"
+
+
+
+def _add_column_if_missing(cursor, table, column, definition):
+
+    cursor.execute(f"PRAGMA table_info({table})")
+
+    if column not in [row[1] for row in cursor.fetchall()]:
+
+        cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+
+
+
+def _migrate_history_blobs(cursor):
+
+    # Migração única: move o histórico salvo como JSON para conversation_turns.
+
+    cursor.execute("SELECT user_id, history FROM conversations WHERE history IS NOT NULL AND history NOT IN ('', '[]')")
+
+    now = datetime.now().isoformat()
+
+    for row in cursor.fetchall():
+
+        turns = json.loads(row[1])[-HISTORY_RETENTION_TURNS:]
+
+        cursor.executemany(
+
+            "INSERT INTO conversation_turns (user_id, role, content, created_at) VALUES (?, ?, ?, ?)",
+
+            [(row[0], turn.get('role', 'user'), turn.get('content', ''), now) for turn in turns]
+
+        )
+
+    cursor.execute("UPDATE conversations SET history = NULL WHERE history IS NOT NULL")
+
+
+
+def _migrate_state_timestamps(cursor):
+
+    # Migração única: copia o 'state_timestamp' que ficava dentro do JSON de 'data' para a coluna.
+
+    cursor.execute("SELECT user_id, data FROM conversations WHERE state_timestamp IS NULL AND data LIKE '%state_timestamp%'")
+
+    for row in cursor.fetchall():
+
+        data = json.loads(row[1])
+
+        timestamp = data.pop('state_timestamp', None)
+
+        cursor.execute("UPDATE conversations SET state_timestamp = ?, data = ? WHERE user_id = ?", (timestamp, json.dumps(data), row[0]))
 
 
 
@@ -18,7 +78,7 @@ def setup_database():
 
     os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)
 
-    conn = sqlite3.connect(DB_PATH, check_same_thread=False)
+    conn = get_connection()
 
     cursor = conn.cursor()
 
@@ -62,42 +122,396 @@ def setup_database():
 
     ''')
 
+    # Colunas do pool de envio: reserva atômica por worker e espera entre tentativas.
+
+    _add_column_if_missing(cursor, 'outbound_queue', 'claimed_by', 'TEXT')
+
+    _add_column_if_missing(cursor, 'outbound_queue', 'claimed_at', 'REAL')
+
+    _add_column_if_missing(cursor, 'outbound_queue', 'next_attempt_at', 'REAL')
+
+    _add_column_if_missing(cursor, 'outbound_queue', 'media_id', 'TEXT')
+
+    # Trace id da mensagem que originou a resposta (ver tracing.py).
+
+    _add_column_if_missing(cursor, 'outbound_queue', 'trace_id', 'TEXT')
+
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_outbound_queue_user ON outbound_queue (user_id, id)")
+
+
+
+
+
+
+
+    # --- FILA DE ENTRADA: MENSAGENS RECEBIDAS PELO /webhook AGUARDANDO PROCESSAMENTO (ver inbound_queue.py) ---
+
+    cursor.execute('''
+
+        CREATE TABLE IF NOT EXISTS inbound_queue (
+
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+
+            user_id TEXT NOT NULL,
+
+            message_text TEXT NOT NULL,
+
+            received_at REAL NOT NULL,
+
+            attempts INTEGER DEFAULT 0,
+
+            claimed_by TEXT,
+
+            claimed_at REAL
+
+        )
+
+    ''')
+
+    _add_column_if_missing(cursor, 'inbound_queue', 'trace_id', 'TEXT')
+
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_inbound_queue_user ON inbound_queue (user_id, id)")
+
+
+
+
+
+
+
+    # --- RÓTULOS DA IA PARA TREINAR O CLASSIFICADOR LOCAL (ver intent_classifier.py) ---
+
+    cursor.execute('''
+
+        CREATE TABLE IF NOT EXISTS intent_labels (
+
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+
+            message TEXT NOT NULL,
+
+            label TEXT NOT NULL,
+
+            result TEXT NOT NULL,
+
+            has_history INTEGER NOT NULL DEFAULT 0,
+
+            created_at TEXT NOT NULL
+
+        )
+
+    ''')
+
+
+
+
+
+
+
+    # --- CACHE PERSISTENTE DAS RESPOSTAS DA IA (ver intent_cache.py) ---
+
+    cursor.execute('''
+
+        CREATE TABLE IF NOT EXISTS intent_cache (
+
+            cache_key TEXT PRIMARY KEY,
+
+            prompt_version TEXT NOT NULL,
+
+            result TEXT NOT NULL,
+
+            created_at REAL NOT NULL
+
+        )
+
+    ''')
+
+
+
+    # --- TIMESTAMP DO ESTADO EM COLUNA PRÓPRIA, COM ÍNDICE PARCIAL PARA O SWEEPER DE TIMEOUT ---
+
+    _add_column_if_missing(cursor, 'conversations', 'state_timestamp', 'TEXT')
+
+    _migrate_state_timestamps(cursor)
+
+    cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_conversations_expirable ON conversations (state_timestamp) WHERE {_EXPIRABLE}")
+
+
+
+    # --- HISTÓRICO DE CONVERSA: UMA LINHA POR TURNO (substitui o JSON em conversations.history) ---
+
+    cursor.execute('''
+
+        CREATE TABLE IF NOT EXISTS conversation_turns (
+
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+
+            user_id TEXT NOT NULL,
+
+            role TEXT NOT NULL,
+
+            content TEXT,
+
+            created_at TEXT NOT NULL
+
+        )
+
+    ''')
+
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_conversation_turns_user ON conversation_turns (user_id, id)")
+
+    _migrate_history_blobs(cursor)
+
+
+
+    # --- LEMBRETES: FILA DE PRIORIDADE POR HORÁRIO DE DISPARO (ver services/reminder_service.py) ---
+
+    cursor.execute('''
+
+        CREATE TABLE IF NOT EXISTS reminder_schedule (
+
+            event_id TEXT NOT NULL,
+
+            kind TEXT NOT NULL,
+
+            start_utc TEXT NOT NULL,
+
+            due_at TEXT NOT NULL,
+
+            PRIMARY KEY (event_id, kind)
+
+        )
+
+    ''')
+
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_reminder_schedule_due ON reminder_schedule (due_at)")
+
+
+
+    # Registro local dos lembretes enviados. A chave inclui o horário do agendamento:
+
+    # se o evento for remarcado, os lembretes do novo horário saem normalmente.
+
+    cursor.execute('''
+
+        CREATE TABLE IF NOT EXISTS reminder_ledger (
+
+            event_id TEXT NOT NULL,
+
+            kind TEXT NOT NULL,
+
+            start_utc TEXT NOT NULL,
+
+            sent_at TEXT NOT NULL,
+
+            PRIMARY KEY (event_id, kind, start_utc)
+
+        )
+
+    ''')
+
+
+
+    # --- MÍDIAS ENDEREÇADAS POR CONTEÚDO (ver media_store.py) ---
+
+    cursor.execute('''
+
+        CREATE TABLE IF NOT EXISTS media_store (
+
+            media_id TEXT PRIMARY KEY,
+
+            file_path TEXT NOT NULL,
+
+            file_name TEXT,
+
+            mime_type TEXT,
+
+            size INTEGER,
+
+            created_at TEXT NOT NULL
+
+        )
+
+    ''')
+
+
+
+    # --- ESPELHO LOCAL DO GOOGLE AGENDA (ver services/calendar_mirror.py) ---
+
+    cursor.execute('''
+
+        CREATE TABLE IF NOT EXISTS calendar_events (
+
+            event_id TEXT PRIMARY KEY,
+
+            calendar_id TEXT NOT NULL,
+
+            start_utc TEXT NOT NULL,
+
+            end_utc TEXT NOT NULL,
+
+            updated TEXT,
+
+            raw TEXT NOT NULL
+
+        )
+
+    ''')
+
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_calendar_events_start ON calendar_events (calendar_id, start_utc)")
+
+
+
+    cursor.execute('''
+
+        CREATE TABLE IF NOT EXISTS calendar_sync_state (
+
+            calendar_id TEXT PRIMARY KEY,
+
+            sync_token TEXT,
+
+            synced_at REAL
+
+        )
+
+    ''')
+
+
+
+    # --- ÍNDICE TELEFONE -> AGENDAMENTOS (ver services/phone_index.py) ---
+
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'phone_index'")
+
+    phone_index_exists = cursor.fetchone() is not None
+
+    cursor.execute('''
+
+        CREATE TABLE IF NOT EXISTS phone_index (
+
+            phone_key TEXT NOT NULL,
+
+            event_id TEXT NOT NULL,
+
+            start_utc TEXT NOT NULL,
+
+            phone TEXT NOT NULL,
+
+            PRIMARY KEY (phone_key, event_id)
+
+        )
+
+    ''')
+
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_phone_index_lookup ON phone_index (phone_key, start_utc)")
+
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_phone_index_event ON phone_index (event_id)")
+
+    if not phone_index_exists:
+
+        # Índice novo: força uma carga completa do espelho para preenchê-lo.
+
+        cursor.execute("DELETE FROM calendar_sync_state")
+
+    # --- GRADE DE DISPONIBILIDADE (ver services/availability_grid.py) ---
+
+    cursor.execute('''
+
+        CREATE TABLE IF NOT EXISTS availability_grid (
+
+            day TEXT PRIMARY KEY,
+
+            free_slots TEXT NOT NULL,
+
+            built_at REAL NOT NULL
+
+        )
+
+    ''')
+
     
 
     conn.commit()
 
-    conn.close()
 
 
+@metrics.timed(metrics.DB_SECONDS, 'get_recent_turns', 'read')
 
-def get_user_state_and_history(user_id):
+def get_recent_turns(user_id, limit=HISTORY_CONTEXT_TURNS):
 
-    conn = sqlite3.connect(DB_PATH, check_same_thread=False)
+    """Últimos 'limit' turnos do usuário, do mais antigo para o mais recente (leitura pelo índice)."""
 
-    conn.row_factory = sqlite3.Row
+    cursor = get_connection().execute(
 
-    cursor = conn.cursor()
+        "SELECT role, content FROM conversation_turns WHERE user_id = ? ORDER BY id DESC LIMIT ?", (user_id, limit))
 
-    cursor.execute("SELECT state, data, history FROM conversations WHERE user_id = ?", (user_id,))
+    return [{"role": row['role'], "content": row['content']} for row in reversed(cursor.fetchall())]
 
-    result = cursor.fetchone()
 
-    conn.close()
+
+@metrics.timed(metrics.DB_SECONDS, 'append_turn', 'write')
+
+def append_turn(user_id, role, content):
+
+    """Acrescenta um turno ao histórico e descarta os que passarem de HISTORY_RETENTION_TURNS."""
+
+    with transaction() as conn:
+
+        conn.execute("INSERT INTO conversation_turns (user_id, role, content, created_at) VALUES (?, ?, ?, ?)",
+
+                     (user_id, role, content, datetime.now().isoformat()))
+
+        conn.execute(
+
+            "DELETE FROM conversation_turns WHERE user_id = ? AND id <= ("
+
+            "SELECT id FROM conversation_turns WHERE user_id = ? ORDER BY id DESC LIMIT 1 OFFSET ?)",
+
+            (user_id, user_id, HISTORY_RETENTION_TURNS))
+
+
+
+@metrics.timed(metrics.DB_SECONDS, 'get_user_state_and_history', 'read')
+
+def get_user_state_and_history(user_id):
+
+    cursor = get_connection().execute("SELECT state, data FROM conversations WHERE user_id = ?", (user_id,))
+
+    result = cursor.fetchone()
 
     if result:
 
         data_dict = json.loads(result['data'] or '{}')
 
-        history_list = json.loads(result['history'] or '[]')
-
-        return result['state'], data_dict, history_list
+        return result['state'], data_dict, get_recent_turns(user_id)
 
     return "INITIAL", {}, []
 
 
 
+@metrics.timed(metrics.DB_SECONDS, 'get_user_state', 'read')
+
+def get_user_state(user_id):
+
+    """Só o estado da conversa (sem dados nem histórico), para decisões rápidas como a junção de mensagens."""
+
+    row = get_connection().execute("SELECT state FROM conversations WHERE user_id = ?", (user_id,)).fetchone()
+
+    return row['state'] if row else "INITIAL"
+
+
+
+@metrics.timed(metrics.DB_SECONDS, 'set_user_state_and_history', 'write')
+
 def set_user_state_and_history(user_id, state, data, history):
 
+    """
+
+    Grava estado e dados da conversa. O histórico NÃO é regravado: cada turno já foi
+
+    salvo por append_turn. Uma lista vazia em 'history' significa recomeçar a conversa
+
+    e apaga os turnos do usuário.
+
+    """
+
     if not isinstance(data, dict):
 
         data = {}
@@ -112,7 +526,7 @@ def set_user_state_and_history(user_id, state, data, history):
 
     if state not in ["INITIAL", "HUMAN_ATTENDANCE"]:
 
-        data['state_timestamp'] = datetime.now().isoformat()
+        state_timestamp = datetime.now().isoformat()
 
     else:
 
@@ -120,16 +534,60 @@ def set_user_state_and_history(user_id, state, data, history):
 
         data = {}
 
+        state_timestamp = None
 
+    data.pop('state_timestamp', None)
 
-    conn = sqlite3.connect(DB_PATH, check_same_thread=False)
 
-    cursor = conn.cursor()
 
-    cursor.execute("INSERT OR REPLACE INTO conversations (user_id, state, data, history) VALUES (?, ?, ?, ?)",
+    with transaction() as conn:
 
-                    (user_id, state, json.dumps(data), json.dumps(history)))
+        conn.execute("INSERT OR REPLACE INTO conversations (user_id, state, data, history, state_timestamp) VALUES (?, ?, ?, NULL, ?)",
 
-    conn.commit()
+                     (user_id, state, json.dumps(data), state_timestamp))
+
+        if not history:
+
+            conn.execute("DELETE FROM conversation_turns WHERE user_id = ?", (user_id,))
+
+
+
+@metrics.timed(metrics.DB_SECONDS, 'expire_inactive_sessions', 'write')
+
+def expire_inactive_sessions(cutoff, timeout_message):
+
+    """
+
+    Encerra de uma vez (uma transação, operações em conjunto) as sessões cujo
+
+    state_timestamp é anterior a 'cutoff': enfileira a mensagem de timeout para todas,
+
+    apaga o histórico e volta o estado para INITIAL. Retorna os user_ids encerrados.
+
+    """
+
+    expired = f"SELECT user_id FROM conversations WHERE {_EXPIRABLE} AND state_timestamp < ?"
+
+    with transaction(immediate=True) as conn:
+
+        expired_users = [row[0] for row in conn.execute(expired, (cutoff,)).fetchall()]
+
+        if not expired_users:
+
+            return []
+
+        conn.execute(
+
+            f"INSERT INTO outbound_queue (user_id, message_text, created_at) SELECT user_id, ?, ? FROM ({expired})",
+
+            (timeout_message, datetime.now().isoformat(), cutoff))
+
+        conn.execute(f"DELETE FROM conversation_turns WHERE user_id IN ({expired})", (cutoff,))
+
+        conn.execute(
+
+            f"UPDATE conversations SET state = 'INITIAL', data = '{{}}', state_timestamp = NULL WHERE {_EXPIRABLE} AND state_timestamp < ?",
+
+            (cutoff,))
 
-    conn.close()
+    return expired_users
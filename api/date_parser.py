@@ -0,0 +1,391 @@
+# --- Conteúdo do arquivo: api/date_parser.py ---
+import re
+import datetime
+import unicodedata
+from functools import lru_cache
+from collections import namedtuple
+
+# Leitura local de datas e horários em português ("depois de amanhã", "dia 5", "15/11/2026",
+# "sexta da semana que vem", "às 3 da tarde", "10h30"...), sem passar pela IA.
+# A mensagem é normalizada e quebrada em tokens; as regras abaixo consomem sequências de tokens
+# guiadas pelas tabelas de palavras. O resultado é memorizado por (texto, hoje).
+# Usado por calendar_service.parse_natural_date, utils.normalize_time_input e pelo app para
+# responder sem a IA quando a mensagem é só uma data/horário.
+
+RELATIVE_DAYS = {
+    ('hoje',): 0,
+    ('amanha',): 1,
+    ('depois', 'de', 'amanha'): 2,
+    ('depois', 'da', 'amanha'): 2,
+}
+NEXT_WEEK = [('semana', 'que', 'vem'), ('proxima', 'semana'), ('semana', 'seguinte')]
+WEEKDAYS = {'segunda': 0, 'terca': 1, 'quarta': 2, 'quinta': 3, 'sexta': 4, 'sabado': 5, 'domingo': 6}
+# Abreviações só valem depois de um número ("15 de nov"): "set", "mar" e "dez" também são palavras.
+MONTHS = {
+    'janeiro': 1, 'jan': 1, 'fevereiro': 2, 'fev': 2, 'marco': 3, 'mar': 3, 'abril': 4, 'abr': 4,
+    'maio': 5, 'mai': 5, 'junho': 6, 'jun': 6, 'julho': 7, 'jul': 7, 'agosto': 8, 'ago': 8,
+    'setembro': 9, 'set': 9, 'outubro': 10, 'out': 10, 'novembro': 11, 'nov': 11, 'dezembro': 12, 'dez': 12,
+}
+NUMBER_WORDS = {
+    'um': 1, 'uma': 1, 'dois': 2, 'duas': 2, 'tres': 3, 'quatro': 4, 'cinco': 5, 'seis': 6, 'sete': 7,
+    'oito': 8, 'nove': 9, 'dez': 10, 'onze': 11, 'doze': 12, 'treze': 13, 'catorze': 14, 'quatorze': 14,
+    'quinze': 15, 'dezesseis': 16, 'dezessete': 17, 'dezoito': 18, 'dezenove': 19, 'vinte': 20,
+    'trinta': 30, 'quarenta': 40, 'cinquenta': 50,
+}
+# Período do dia depois da hora ("3 da tarde"): soma 12 às horas da tarde/noite.
+PERIODS = {'manha': 0, 'tarde': 12, 'noite': 12}
+# Sem hora nenhuma, "de manhã" vale 09:00 (como já fazia utils.normalize_time_input).
+MORNING_DEFAULT = '09:00'
+HOUR_WORDS = {'h', 'hs', 'hr', 'hrs', 'hora', 'horas'}
+DAY_UNITS = {'dia': 1, 'dias': 1, 'semana': 7, 'semanas': 7}
+# Palavras que podem acompanhar uma data/horário sem mudar o sentido. Uma mensagem só com elas,
+# datas e horários é "só data/horário" (ParsedDateTime.only_date_time); negações nunca entram aqui.
+FILLER_WORDS = {
+    'a', 'o', 'as', 'os', 'ao', 'de', 'do', 'da', 'dos', 'das', 'dia', 'no', 'na', 'em', 'e', 'para', 'pra', 'pro',
+    'feira', 'h', 'hs', 'hr', 'hrs', 'hora', 'horas', 'pode', 'ser', 'podemos', 'seria', 'fica', 'ficaria',
+    'quero', 'queria', 'prefiro', 'preferia', 'melhor', 'entao', 'ok', 'sim', 'por', 'favor', 'pf', 'pfv', 'que',
+    'tal', 'esse', 'essa', 'este', 'esta', 'nesse', 'nessa', 'neste', 'nesta', 'proxima', 'proximo', 'agora',
+    'mesmo', 'mesma', 'tem', 'vaga', 'horario', 'data', 'pela', 'pelas', 'por', 'volta', 'umas', 'uns', 'la',
+    'cedo', 'eu', 'consigo', 'posso', 'vou', 'vem',
+}
+
+_TOKEN = re.compile(r"""
+    (?P<iso>\d{4}-\d{1,2}-\d{1,2})(?!\d)
+  | (?P<date>\d{1,2}[/.-]\d{1,2}(?:[/.-]\d{2,4})?)(?!\d)
+  | (?P<clock>\d{1,2})(?::|h)(?P<minute>\d{2})(?!\d)
+  | (?P<hour>\d{1,2})\s?(?:h|hs|hrs?|horas?)(?![a-z])
+  | (?P<num>\d+)
+  | (?P<word>[a-z]+)
+""", re.VERBOSE)
+
+ParsedDateTime = namedtuple('ParsedDateTime', ['date', 'time', 'bare_time', 'leftover'])
+ParsedDateTime.__doc__ = """
+Resultado de parse(): 'date' (datetime.date ou None), 'time' ('HH:MM' ou None),
+'bare_time' (horário lido só de números soltos, como "10" ou "1330", para quando já se
+sabe que a resposta é um horário) e 'leftover' (palavras que não são data, horário nem
+enchimento).
+"""
+ParsedDateTime.only_date_time = property(lambda self: not self.leftover and (self.date is not None or self.time is not None))
+
+_RELATIVE_DAYS_LONGEST_FIRST = sorted(RELATIVE_DAYS.items(), key=lambda item: -len(item[0]))
+
+def _normalize(text):
+    text = text.lower().strip()
+    if not text.isascii():
+        text = unicodedata.normalize('NFKD', text).encode('ASCII', 'ignore').decode('ASCII')
+    return text
+
+def _tokenize(text):
+    tokens = []
+    for match in _TOKEN.finditer(_normalize(text)):
+        kind = match.lastgroup
+        if kind == 'minute':
+            tokens.append(('clock', (int(match.group('clock')), int(match.group('minute')))))
+        elif kind == 'hour':
+            tokens.append(('hour', int(match.group('hour'))))
+        elif kind == 'iso':
+            year, month, day = match.group('iso').split('-')
+            tokens.append(('date', f"{day}/{month}/{year}"))
+        elif kind == 'num':
+            tokens.append(('num', match.group('num')))
+        else:
+            tokens.append((kind, match.group(kind)))
+    return tokens
+
+def _safe_date(year, month, day):
+    try:
+        return datetime.date(year, month, day)
+    except (ValueError, OverflowError):
+        return None
+
+def _day_month(day, month, year, today):
+    """Dia/mês (e ano, se veio): sem ano, a próxima ocorrência a partir de hoje."""
+    if year is not None:
+        return _safe_date(year + 2000 if year < 100 else year, month, day)
+    year = today.year
+    if month < today.month or (month == today.month and day < today.day):
+        year += 1
+    return _safe_date(year, month, day)
+
+def _day_of_month(day, today):
+    """'dia 5': neste mês se ainda não passou, senão no próximo (pulando meses sem esse dia)."""
+    year, month = today.year, today.month
+    if day < today.day:
+        month += 1
+    for _ in range(3):
+        if month > 12:
+            year, month = year + 1, 1
+        found = _safe_date(year, month, day)
+        if found:
+            return found
+        month += 1
+    return None
+
+def _next_monday(today):
+    return today + datetime.timedelta(days=7 - today.weekday())
+
+class _Reader:
+    """Percorre os tokens de uma mensagem aplicando as regras; guarda o que cada regra consumiu."""
+
+    def __init__(self, tokens, today):
+        self.tokens = tokens
+        self.today = today
+        self.used = [False] * len(tokens)
+        self.date = None
+        self.time = None
+        self.weekday = None
+        self.next_week = False
+
+    def word(self, i):
+        return self.tokens[i][1] if i < len(self.tokens) and self.tokens[i][0] == 'word' else None
+
+    def number(self, i):
+        """Número na posição i (em dígitos ou por extenso), ou None."""
+        if i >= len(self.tokens):
+            return None
+        kind, value = self.tokens[i]
+        if kind == 'num' and len(value) <= 4:
+            return int(value)
+        if kind == 'word':
+            return NUMBER_WORDS.get(value)
+        return None
+
+    def phrase(self, i, words):
+        return all(self.word(i + k) == word for k, word in enumerate(words))
+
+    def consume(self, start, count):
+        for k in range(start, start + count):
+            self.used[k] = True
+        return count
+
+    # --- Regras de data: cada uma devolve quantos tokens consumiu (0 = não casou) ---
+
+    def relative_day(self, i):
+        for words, offset in _RELATIVE_DAYS_LONGEST_FIRST:
+            if self.phrase(i, words):
+                self.date = self.date or self.today + datetime.timedelta(days=offset)
+                return self.consume(i, len(words))
+        return 0
+
+    def next_week_phrase(self, i):
+        for words in NEXT_WEEK:
+            if self.phrase(i, words):
+                self.next_week = True
+                return self.consume(i, len(words))
+        return 0
+
+    def weekday_name(self, i):
+        weekday = WEEKDAYS.get(self.word(i))
+        if weekday is None:
+            return 0
+        self.weekday = weekday
+        return self.consume(i, 2 if self.word(i + 1) == 'feira' else 1)
+
+    def numeric_date(self, i):
+        kind, value = self.tokens[i]
+        if kind != 'date':
+            return 0
+        parts = [int(part) for part in re.split(r'[/.-]', value)]
+        found = _day_month(parts[0], parts[1], parts[2] if len(parts) > 2 else None, self.today)
+        if found is None:
+            return 0
+        self.date = self.date or found
+        return self.consume(i, 1)
+
+    def day_and_month(self, i):
+        """'15 de novembro [de 2026]', 'dia 15 do 11', 'dia 5'."""
+        start = i
+        if self.word(i) == 'dia':
+            i += 1
+        elif self.tokens[i][0] != 'num':
+            return 0
+        day = self.number(i)
+        if day is None or not 1 <= day <= 31:
+            return 0
+        i += 1
+        month = year = None
+        link = 1 if self.word(i) in ('de', 'do') else 0
+        if self.word(i + link) in MONTHS:
+            month = MONTHS[self.word(i + link)]
+            i += link + 1
+        elif link and self.tokens[i + 1:i + 2] and self.tokens[i + 1][0] == 'num':
+            month = self.number(i + 1)
+            if month is None or not 1 <= month <= 12:
+                month = None
+            else:
+                i += 2
+        if month is not None:
+            link = 1 if self.word(i) == 'de' else 0
+            if i + link < len(self.tokens) and self.tokens[i + link][0] == 'num' and len(self.tokens[i + link][1]) == 4:
+                year = int(self.tokens[i + link][1])
+                i += link + 1
+            found = _day_month(day, month, year, self.today)
+        elif self.word(start) == 'dia':
+            found = _day_of_month(day, self.today)
+        else:
+            return 0
+        if found is None:
+            return 0
+        self.date = self.date or found
+        return self.consume(start, i - start)
+
+    def days_from_now(self, i):
+        """'daqui a 3 dias', 'em duas semanas', 'daqui uma semana'."""
+        if self.word(i) not in ('daqui', 'em'):
+            return 0
+        skip = 2 if self.word(i + 1) == 'a' else 1
+        amount = self.number(i + skip)
+        unit = DAY_UNITS.get(self.word(i + skip + 1))
+        if amount is None or unit is None:
+            return 0
+        self.date = self.date or self.today + datetime.timedelta(days=amount * unit)
+        return self.consume(i, skip + 2)
+
+    # --- Regras de horário ---
+
+    def _minutes_and_period(self, i, hour, minute=0):
+        """Completa uma hora já lida com 'e meia'/'e 15' e 'da tarde'; devolve tokens consumidos a partir de i."""
+        count = 0
+        if minute == 0 and self.word(i) == 'e':
+            if self.word(i + 1) == 'meia':
+                minute, count = 30, 2
+            elif self.number(i + 1) is not None and self.number(i + 1) < 60:
+                minute, count = self.number(i + 1), 2
+        link = 1 if self.word(i + count) in ('da', 'de', 'a', 'pela', 'na') else 0
+        period = PERIODS.get(self.word(i + count + link))
+        if period is not None:
+            if hour == 12 and self.word(i + count + link) == 'noite':
+                hour = 0  # "12 da noite" é meia-noite
+            elif hour < 12:
+                hour += period
+            count += link + 1
+        if hour > 23 or minute > 59:
+            return None, 0
+        if self.time is None:
+            self.time = f"{hour:02d}:{minute:02d}"
+        return self.time, count
+
+    def clock_time(self, i):
+        kind, value = self.tokens[i]
+        if kind == 'clock':
+            hour, minute = value
+        elif kind == 'hour':
+            hour, minute = value, 0
+        else:
+            return 0
+        found, count = self._minutes_and_period(i + 1, hour, minute)
+        return self.consume(i, 1 + count) if found else 0
+
+    def spoken_time(self, i):
+        """'às 10', 'as dez e meia', 'à uma', '3 da tarde', 'meio-dia', 'meia-noite'."""
+        if self.phrase(i, ('meio', 'dia')) or self.phrase(i, ('meia', 'noite')):
+            found, count = self._minutes_and_period(i + 2, 12 if self.word(i) == 'meio' else 0)
+            return self.consume(i, 2 + count) if found else 0
+        start = i
+        if self.word(i) in ('as', 'a'):
+            i += 1
+        hour = self.number(i)
+        if hour is None or hour > 23:
+            return 0
+        if self.word(i + 1) in HOUR_WORDS:
+            i += 1
+        elif start == i and not self.phrase(i + 1, ('e', 'meia')):
+            # Sem 'às' antes, o número só é hora se vier 'horas', 'e meia' ou um período depois ("3 da tarde").
+            link = 1 if self.word(i + 1) in ('da', 'de', 'a', 'pela', 'na') else 0
+            if PERIODS.get(self.word(i + 1 + link)) is None:
+                return 0
+        found, count = self._minutes_and_period(i + 1, hour)
+        return self.consume(start, i + 1 - start + count) if found else 0
+
+    RULES = ('relative_day', 'next_week_phrase', 'numeric_date', 'days_from_now', 'clock_time',
+             'spoken_time', 'day_and_month', 'weekday_name')
+
+    def run(self):
+        rules = [getattr(self, rule) for rule in self.RULES]
+        i = 0
+        while i < len(self.tokens):
+            for rule in rules:
+                consumed = rule(i)
+                if consumed:
+                    i += consumed
+                    break
+            else:
+                i += 1
+        self._resolve_weekday()
+
+    def _resolve_weekday(self):
+        if self.date is not None:
+            return
+        words = {value for kind, value in self.tokens if kind == 'word'}
+        if self.weekday is None:
+            if self.next_week:
+                self.date = _next_monday(self.today)
+            return
+        if self.next_week:
+            self.date = _next_monday(self.today) + datetime.timedelta(days=self.weekday)
+            return
+        days_ahead = self.weekday - self.today.weekday()
+        if 'proxima' in words or 'proximo' in words or days_ahead <= 0:
+            days_ahead += 7
+        self.date = self.today + datetime.timedelta(days=days_ahead)
+
+    def bare_time(self):
+        """Horário só com números soltos ('10', '1330', '10 30'), como na resposta ao pedido de horário."""
+        numbers = [value for (kind, value), used in zip(self.tokens, self.used) if kind == 'num' and not used]
+        if len(numbers) == 1:
+            digits = numbers[0]
+            if len(digits) <= 2:
+                hour, minute = int(digits), 0
+            elif len(digits) in (3, 4):
+                hour, minute = int(digits[:-2]), int(digits[-2:])
+            else:
+                return None
+        elif len(numbers) == 2 and len(numbers[0]) <= 2 and len(numbers[1]) == 2:
+            hour, minute = int(numbers[0]), int(numbers[1])
+        else:
+            return None
+        return f"{hour:02d}:{minute:02d}" if hour < 24 and minute < 60 else None
+
+    def legacy_day_month(self):
+        """Dois números soltos ('15 11') como dia e mês, como o parse_natural_date antigo aceitava."""
+        numbers = [int(value) for (kind, value), used in zip(self.tokens, self.used) if kind == 'num' and not used]
+        if self.date is None and self.time is None and len(numbers) == 2 and 1 <= numbers[1] <= 12:
+            found = _day_month(numbers[0], numbers[1], None, self.today)
+            if found:
+                self.date = found
+                for k, (kind, _) in enumerate(self.tokens):
+                    if kind == 'num':
+                        self.used[k] = True
+
+    def result(self):
+        bare = self.bare_time() if self.time is None else None
+        self.legacy_day_month()
+        leftover = tuple(value for (kind, value), used in zip(self.tokens, self.used)
+                         if not used and not (kind == 'word' and value in FILLER_WORDS))
+        time = self.time
+        if time is None and 'manha' in (value for (kind, value), used in zip(self.tokens, self.used) if not used):
+            time = MORNING_DEFAULT
+            leftover = tuple(value for value in leftover if value != 'manha')
+        return ParsedDateTime(self.date, time, bare, leftover)
+
+@lru_cache(maxsize=4096)
+def _parse(text, today):
+    reader = _Reader(_tokenize(text), today)
+    reader.run()
+    return reader.result()
+
+def parse(text, today=None):
+    """Lê data e horário de uma mensagem. Memorizado por (texto, hoje)."""
+    return _parse(text or '', today or datetime.date.today())
+
+def parse_date(text, today=None):
+    """A data da mensagem (datetime.date) ou None."""
+    return parse(text, today).date
+
+def parse_time(text):
+    """O horário 'HH:MM' da mensagem, aceitando também só números ('10', '1330'); '' se não houver."""
+    parsed = parse(text)
+    return parsed.time or parsed.bare_time or ""
+
+def cache_info():
+    return _parse.cache_info()
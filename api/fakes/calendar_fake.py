@@ -0,0 +1,210 @@
+import time
+import uuid
+import copy
+import threading
+import datetime
+import pytz
+import httplib2
+from googleapiclient.errors import HttpError
+
+# Dublê em memória do recurso 'calendar v3' do googleapiclient.
+# Implementa o subconjunto usado pelo bot (events().list/get/insert/patch/delete + execute())
+# incluindo paginação e tokens de sincronização incremental, para testar o espelho offline.
+# 'latency_ms' simula o tempo de ida e volta de cada chamada (benchmarks).
+# Ative com CALENDAR_BACKEND=fake.
+
+
+def _http_error(status: int, reason: str):
+    resp = httplib2.Response({'status': status})
+    resp.reason = reason
+    return HttpError(resp, reason.encode('utf-8'))
+
+
+def _parse_time(time_info: dict) -> datetime.datetime:
+    if time_info.get('dateTime'):
+        dt = datetime.datetime.fromisoformat(time_info['dateTime'].replace('Z', '+00:00'))
+        if dt.tzinfo is None:
+            dt = pytz.timezone(time_info.get('timeZone') or 'UTC').localize(dt)
+        return dt
+    day = datetime.date.fromisoformat(time_info['date'])
+    return pytz.timezone('America/Sao_Paulo').localize(datetime.datetime.combine(day, datetime.time.min))
+
+
+class _Request:
+    def __init__(self, fn):
+        self._fn = fn
+
+    def execute(self, *args, **kwargs):
+        return self._fn()
+
+
+class _BatchRequest:
+    """Lote no formato do BatchHttpRequest: uma única ida à API, um callback por requisição."""
+
+    def __init__(self, callback=None):
+        self._callback = callback
+        self._requests = []
+
+    def add(self, request, callback=None, request_id=None):
+        self._requests.append((request_id or str(len(self._requests) + 1), request, callback or self._callback))
+
+    def execute(self, *args, **kwargs):
+        for request_id, request, callback in self._requests:
+            try:
+                response, exception = request.execute(), None
+            except HttpError as e:
+                response, exception = None, e
+            if callback:
+                callback(request_id, response, exception)
+
+
+class FakeCalendarService:
+    """Agenda falsa. 'calls' conta as chamadas por método, como se fossem idas à API."""
+
+    def __init__(self, page_size: int = 250, latency_ms: float = 0):
+        self.page_size = page_size
+        self.latency_ms = latency_ms
+        self.calls = {}
+        self._events = {}
+        self._seq = 0
+        self._min_valid_seq = 0
+        self._lock = threading.Lock()
+
+    # --- Ferramentas para testes ---
+
+    def add_event(self, summary: str, start: datetime.datetime, minutes: int = 150, description: str = '', created=None):
+        body = {
+            'summary': summary,
+            'description': description,
+            'start': {'dateTime': start.isoformat(), 'timeZone': 'America/Sao_Paulo'},
+            'end': {'dateTime': (start + datetime.timedelta(minutes=minutes)).isoformat(), 'timeZone': 'America/Sao_Paulo'},
+        }
+        if created:
+            body['created'] = created.astimezone(pytz.utc).isoformat()
+        return self._insert(body)
+
+    def move_event(self, event_id: str, start: datetime.datetime, minutes: int = 150):
+        """Remarca um evento (como se a atendente tivesse arrastado na agenda)."""
+        return self._patch(event_id, {
+            'start': {'dateTime': start.isoformat(), 'timeZone': 'America/Sao_Paulo'},
+            'end': {'dateTime': (start + datetime.timedelta(minutes=minutes)).isoformat(), 'timeZone': 'America/Sao_Paulo'},
+        })
+
+    def expire_sync_tokens(self):
+        """Invalida todos os tokens emitidos; a próxima sincronização incremental recebe HTTP 410."""
+        with self._lock:
+            self._seq += 1
+            self._min_valid_seq = self._seq
+
+    # --- API compatível com googleapiclient ---
+
+    def events(self):
+        return self
+
+    def list(self, calendarId=None, timeMin=None, timeMax=None, singleEvents=None, orderBy=None,
+             syncToken=None, pageToken=None, showDeleted=False, maxResults=None, **kwargs):
+        return _Request(lambda: self._list(timeMin, timeMax, syncToken, pageToken, showDeleted, maxResults))
+
+    def get(self, calendarId=None, eventId=None, **kwargs):
+        return _Request(lambda: self._get(eventId))
+
+    def insert(self, calendarId=None, body=None, **kwargs):
+        return _Request(lambda: self._insert(body, count=True))
+
+    def patch(self, calendarId=None, eventId=None, body=None, **kwargs):
+        return _Request(lambda: self._patch(eventId, body, count=True))
+
+    def delete(self, calendarId=None, eventId=None, **kwargs):
+        return _Request(lambda: self._delete(eventId))
+
+    def new_batch_http_request(self, callback=None):
+        self._count('batch')
+        return _BatchRequest(callback)
+
+    # --- Implementação ---
+
+    def _count(self, method):
+        self.calls[method] = self.calls.get(method, 0) + 1
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000)
+
+    def _touch(self, event):
+        self._seq += 1
+        event['_seq'] = self._seq
+        event['updated'] = datetime.datetime.now(pytz.utc).isoformat()
+
+    def _public(self, event):
+        return {k: copy.deepcopy(v) for k, v in event.items() if not k.startswith('_')}
+
+    def _insert(self, body, count=False):
+        if count:
+            self._count('insert')
+        with self._lock:
+            event = copy.deepcopy(body)
+            event['id'] = uuid.uuid4().hex
+            event['status'] = 'confirmed'
+            event.setdefault('created', datetime.datetime.now(pytz.utc).isoformat())
+            for field in ('start', 'end'):
+                if event[field].get('dateTime'):
+                    event[field]['dateTime'] = _parse_time(event[field]).isoformat()
+            self._touch(event)
+            self._events[event['id']] = event
+            return self._public(event)
+
+    def _get(self, event_id):
+        self._count('get')
+        with self._lock:
+            event = self._events.get(event_id)
+            if not event or event['status'] == 'cancelled':
+                raise _http_error(404, 'Not Found')
+            return self._public(event)
+
+    def _patch(self, event_id, body, count=False):
+        if count:
+            self._count('patch')
+        with self._lock:
+            event = self._events.get(event_id)
+            if not event or event['status'] == 'cancelled':
+                raise _http_error(404, 'Not Found')
+            event.update(copy.deepcopy(body))
+            self._touch(event)
+            return self._public(event)
+
+    def _delete(self, event_id):
+        self._count('delete')
+        with self._lock:
+            event = self._events.get(event_id)
+            if not event or event['status'] == 'cancelled':
+                raise _http_error(410, 'Resource has been deleted')
+            event['status'] = 'cancelled'
+            self._touch(event)
+            return ''
+
+    def _list(self, time_min, time_max, sync_token, page_token, show_deleted, max_results):
+        self._count('list')
+        with self._lock:
+            if sync_token:
+                since = int(sync_token.split('-')[1])
+                if since < self._min_valid_seq:
+                    raise _http_error(410, 'Sync token is no longer valid, a full sync is required.')
+                items = [e for e in self._events.values() if e['_seq'] > since]
+            else:
+                lower = datetime.datetime.fromisoformat(time_min.replace('Z', '+00:00')) if time_min else None
+                upper = datetime.datetime.fromisoformat(time_max.replace('Z', '+00:00')) if time_max else None
+                items = [
+                    e for e in self._events.values()
+                    if (show_deleted or e['status'] != 'cancelled')
+                    and (lower is None or _parse_time(e['end']) > lower)
+                    and (upper is None or _parse_time(e['start']) < upper)
+                ]
+            items.sort(key=lambda e: (_parse_time(e['start']), e['id']))
+
+            offset = int(page_token) if page_token else 0
+            size = max_results or self.page_size
+            page = items[offset:offset + size]
+            result = {'kind': 'calendar#events', 'items': [self._public(e) for e in page]}
+            if offset + size < len(items):
+                result['nextPageToken'] = str(offset + size)
+            else:
+                result['nextSyncToken'] = f"tok-{self._seq}"
+            return result
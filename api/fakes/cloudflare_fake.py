@@ -0,0 +1,69 @@
+import json
+import time
+import random
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# API de IA da Cloudflare falsa: aceita POST /client/v4/accounts/<id>/ai/run/<modelo>
+# e responde no mesmo formato ({"result": {"response": "..."}}).
+# Latência, taxa de falha (HTTP 500) e resposta configuráveis. Conta as conexões TCP
+# abertas pelos clientes, para conferir o reaproveitamento (keep-alive).
+# Use com CLOUDFLARE_API_BASE=<fake.url>.
+
+
+def _default_responder(messages):
+    return json.dumps({"intent": "unknown"})
+
+
+class FakeCloudflareAI:
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, latency_ms: float = 0, failure_rate: float = 0.0, responder=None):
+        self.latency_ms = latency_ms
+        self.failure_rate = failure_rate
+        self.responder = responder or _default_responder
+        self.requests = []
+        self.connections = set()
+        self.failures = 0
+        self._lock = threading.Lock()
+        fake = self
+
+        class _Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            disable_nagle_algorithm = True
+
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length', 0))
+                payload = json.loads(self.rfile.read(length) or b'{}')
+                with fake._lock:
+                    fake.connections.add(self.client_address)
+                    fake.requests.append({'path': self.path, 'payload': payload, 'headers': dict(self.headers)})
+                if fake.latency_ms:
+                    time.sleep(fake.latency_ms / 1000)
+                if random.random() < fake.failure_rate:
+                    with fake._lock:
+                        fake.failures += 1
+                    self._reply(500, {'success': False, 'errors': [{'message': 'Falha simulada'}]})
+                    return
+                self._reply(200, {'success': True, 'result': {'response': fake.responder(payload.get('messages', []))}})
+
+            def _reply(self, status, body):
+                data = json.dumps(body).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), _Handler)
+        self._server.daemon_threads = True
+        self.url = f"http://{host}:{self._server.server_address[1]}/client/v4"
+
+    def start(self):
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
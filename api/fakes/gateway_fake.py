@@ -0,0 +1,77 @@
+import json
+import time
+import random
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# Gateway WhatsApp falso: aceita POST /send-message como o bot.js e registra cada entrega.
+# Latência e taxa de falha configuráveis, para benchmarks e testes locais.
+# Fala HTTP/1.1 com keep-alive, como o Express do bot.js; 'connections' conta as conexões TCP abertas.
+
+
+class FakeGateway:
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, latency_ms: float = 0, failure_rate: float = 0.0):
+        self.latency_ms = latency_ms
+        self.failure_rate = failure_rate
+        self.deliveries = []
+        self.connections = set()
+        self._lock = threading.Lock()
+        self._listeners = []
+        gateway = self
+
+        class _Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            disable_nagle_algorithm = True
+
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length', 0))
+                payload = json.loads(self.rfile.read(length) or b'{}')
+                with gateway._lock:
+                    gateway.connections.add(self.client_address)
+                if gateway.latency_ms:
+                    time.sleep(gateway.latency_ms / 1000)
+                if random.random() < gateway.failure_rate:
+                    self._reply(500, {'status': 'error', 'message': 'Falha simulada'})
+                    return
+                gateway._record(payload, dict(self.headers))
+                self._reply(200, {'status': 'success'})
+
+            def _reply(self, status, body):
+                data = json.dumps(body).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), _Handler)
+        self._server.daemon_threads = True
+        self.url = f"http://{host}:{self._server.server_address[1]}/send-message"
+
+    def _record(self, payload, headers):
+        delivery = {'to': payload.get('to'), 'payload': payload, 'headers': headers, 'received_at': time.time()}
+        with self._lock:
+            self.deliveries.append(delivery)
+            listeners = list(self._listeners)
+        for listener in listeners:
+            listener(delivery)
+
+    def add_listener(self, fn):
+        """Registra uma função chamada a cada entrega (útil para medir latência ponta a ponta)."""
+        with self._lock:
+            self._listeners.append(fn)
+
+    def deliveries_for(self, user_id: str):
+        with self._lock:
+            return [d for d in self.deliveries if d['to'] == user_id]
+
+    def start(self):
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
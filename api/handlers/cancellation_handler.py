@@ -16,8 +16,12 @@ import pytz
 
 from handlers import menu_handler
 
+import tracing
 
 
+
+@tracing.traced()
+
 def handle_cancellation(user_id, state, data, extracted_intent, raw_message, history):
 
     
@@ -1,6 +1,6 @@
 # --- Conteúdo do arquivo: api/handlers/menu_handler.py ---
 import os
-import base64
+import media_store
 from message_queue import queue_message
 from utils import notify_human_agent
 from message_manager import get_message
@@ -16,15 +16,15 @@ def get_portfolio(user_id: str):
             queue_message(user_id, error_message)
             return
 
-        with open(file_path, "rb") as pdf_file:
-            encoded_string = base64.b64encode(pdf_file.read()).decode('utf-8')
+        # Registrado uma vez no media store; a fila guarda só a referência ao arquivo.
+        media_id = media_store.register_file(file_path, mime_type='application/pdf')
         
         caption_text = get_message('PORTFOLIO_CAPTION') # 
         
         queue_message(
             user_id=user_id, 
             text=caption_text, 
-            media_data=encoded_string, # 
+            media_id=media_id,
             file_name="Portfolio - Glass Studio.pdf"
         )
     except Exception as e:
@@ -14,8 +14,12 @@ from message_manager import get_message
 
 from handlers import menu_handler
 
+import tracing
 
 
+
+@tracing.traced()
+
 def handle_scheduling(user_id, state, data, extracted_intent, raw_message, history):
 
     if state in ["INITIAL", "AWAITING_DATE"]:
@@ -0,0 +1,119 @@
+# --- Conteúdo do arquivo: api/http_client.py ---
+import time
+import random
+import logging
+import threading
+from urllib.parse import urlsplit
+import requests
+from requests.adapters import HTTPAdapter
+from config import HTTP_POOL_SIZE, HTTP_CONNECT_TIMEOUT_SEC, HTTP_MAX_RETRIES, HTTP_RETRY_BASE_SEC
+
+# Camada HTTP compartilhada (IA da Cloudflare, gateway do WhatsApp).
+# Uma Session por host com pool de conexões keep-alive: o handshake TCP/TLS acontece uma vez
+# e é reaproveitado. Novas tentativas com espera exponencial + jitter SÓ para chamadas
+# idempotentes (ex.: a IA); um envio ao gateway repetido viraria mensagem duplicada, então
+# ali quem decide é a fila de envio. Contadores de latência e erros por host em get_stats().
+
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+_sessions = {}
+_lock = threading.Lock()
+_stats = {}
+
+def _host(url):
+    parts = urlsplit(url)
+    return f"{parts.scheme}://{parts.netloc}"
+
+def get_session(url):
+    """Session do host da URL (criada na primeira chamada, compartilhada entre threads)."""
+    host = _host(url)
+    session = _sessions.get(host)
+    if session is None:
+        with _lock:
+            session = _sessions.get(host)
+            if session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=HTTP_POOL_SIZE)
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+                _sessions[host] = session
+    return session
+
+def _record(host, elapsed, error=False, retried=False):
+    with _lock:
+        stats = _stats.setdefault(host, {'requests': 0, 'errors': 0, 'retries': 0, 'latency_sum_ms': 0.0, 'latency_max_ms': 0.0})
+        stats['requests'] += 1
+        stats['errors'] += error
+        stats['retries'] += retried
+        stats['latency_sum_ms'] += elapsed * 1000
+        stats['latency_max_ms'] = max(stats['latency_max_ms'], elapsed * 1000)
+
+def _backoff(attempt, response=None):
+    retry_after = response.headers.get('Retry-After') if response is not None else None
+    if retry_after and retry_after.isdigit():
+        return float(retry_after)
+    return random.uniform(0, HTTP_RETRY_BASE_SEC * (2 ** attempt))
+
+def _remaining(deadline):
+    return None if deadline is None else deadline - time.monotonic()
+
+def request(method, url, timeout, idempotent=False, max_retries=HTTP_MAX_RETRIES, deadline=None, **kwargs):
+    """
+    Faz a requisição pelo pool do host. 'timeout' é o tempo de leitura; a conexão usa HTTP_CONNECT_TIMEOUT_SEC.
+    Com idempotent=True, falhas de rede e respostas 429/5xx são repetidas até max_retries vezes.
+    'deadline' (time.monotonic()) limita o total, somando tentativas e esperas: os timeouts
+    encolhem para caber e não há nova tentativa que não termine antes dele.
+    Levanta requests.exceptions.RequestException como o requests (inclusive HTTPError no fim das tentativas).
+    """
+    host = _host(url)
+    session = get_session(url)
+    attempts = 1 + (max_retries if idempotent else 0)
+    for attempt in range(attempts):
+        remaining = _remaining(deadline)
+        if remaining is not None and remaining <= 0:
+            raise requests.exceptions.Timeout(f"Orçamento de latência esgotado antes de chamar {host}.")
+        connect_timeout = HTTP_CONNECT_TIMEOUT_SEC if remaining is None else min(HTTP_CONNECT_TIMEOUT_SEC, remaining)
+        read_timeout = timeout if remaining is None else min(timeout, remaining)
+        last_attempt = attempt == attempts - 1
+        start = time.perf_counter()
+        response = None
+        try:
+            response = session.request(method, url, timeout=(connect_timeout, read_timeout), **kwargs)
+            delay = _backoff(attempt, response)
+            if response.status_code in RETRY_STATUS and not last_attempt and (deadline is None or time.monotonic() + delay < deadline):
+                _record(host, time.perf_counter() - start, error=True, retried=True)
+                response.close()
+                logging.warning(f"HTTP {response.status_code} de {host}; nova tentativa em {delay:.2f}s.")
+                time.sleep(delay)
+                continue
+            response.raise_for_status()
+            _record(host, time.perf_counter() - start)
+            return response
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+            _record(host, time.perf_counter() - start, error=True, retried=not last_attempt)
+            delay = _backoff(attempt)
+            if last_attempt or (deadline is not None and time.monotonic() + delay >= deadline):
+                raise
+            logging.warning(f"Falha de rede com {host} ({e.__class__.__name__}); nova tentativa em {delay:.2f}s.")
+            time.sleep(delay)
+        except requests.exceptions.HTTPError:
+            _record(host, time.perf_counter() - start, error=True)
+            raise
+
+def post(url, timeout, idempotent=False, **kwargs):
+    return request('POST', url, timeout, idempotent=idempotent, **kwargs)
+
+def get_stats():
+    """Por host: requisições, erros, novas tentativas e latência média/máxima (ms)."""
+    with _lock:
+        return {
+            host: dict(stats, latency_avg_ms=round(stats['latency_sum_ms'] / stats['requests'], 1) if stats['requests'] else 0)
+            for host, stats in _stats.items()
+        }
+
+def close_all():
+    """Fecha as conexões abertas (usado em testes e benchmarks)."""
+    with _lock:
+        for session in _sessions.values():
+            session.close()
+        _sessions.clear()
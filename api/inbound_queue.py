@@ -0,0 +1,217 @@
+# --- Conteúdo do arquivo: api/inbound_queue.py ---
+import time
+import uuid
+import logging
+import threading
+from collections import deque
+from config import INBOX_WORKERS, INBOX_POLL_INTERVAL_SEC, INBOX_CLAIM_TIMEOUT_SEC, COALESCE_DEBOUNCE_MS, COALESCE_MAX_WAIT_MS
+from connection_manager import get_connection, transaction
+import tracing
+
+# Fila de entrada: o /webhook grava a mensagem recebida e responde na hora ao gateway.
+# Um pool de workers de conversa processa as mensagens em segundo plano, uma por vez para
+# cada usuário (na ordem de chegada) e em paralelo entre usuários diferentes.
+# Assim uma IA ou agenda lenta ocupa um worker, nunca uma thread do waitress.
+# Rajadas ("oi" + "quero marcar amanhã") não se perdem: o que chega enquanto o usuário
+# está em processamento (ou dentro do debounce) é juntado num único turno.
+
+# Tentativas de processamento antes de descartar uma mensagem (ex.: worker morrendo sempre no mesmo ponto).
+MAX_ATTEMPTS = 3
+
+_stop_event = threading.Event()
+_worker_threads = []
+
+_wakeup = threading.Condition()
+_wakeup_count = 0
+
+# Métricas de pressão da fila (por processo).
+_stats_lock = threading.Lock()
+_stats = {'received': 0, 'processed': 0, 'turns': 0, 'coalesced': 0, 'dropped': 0, 'busy_workers': 0}
+_wait_samples = deque(maxlen=1000)  # espera na fila (ms) das últimas mensagens reservadas
+
+def _notify_workers():
+    global _wakeup_count
+    with _wakeup:
+        _wakeup_count += 1
+        _wakeup.notify_all()
+
+def _wait_for_wakeup(seen_count, timeout):
+    with _wakeup:
+        if _wakeup_count == seen_count and not _stop_event.is_set():
+            _wakeup.wait(timeout)
+
+def enqueue_inbound(user_id, text, trace_id=None):
+    """Grava a mensagem recebida na fila de entrada e acorda os workers. Retorna o id da linha."""
+    with transaction() as conn:
+        job_id = conn.execute(
+            "INSERT INTO inbound_queue (user_id, message_text, received_at, trace_id) VALUES (?, ?, ?, ?)",
+            (user_id, text, time.time(), trace_id)
+        ).lastrowid
+    with _stats_lock:
+        _stats['received'] += 1
+    _notify_workers()
+    return job_id
+
+def _claim_next_batch(worker_id, can_merge, user_id=None, debounce=True):
+    """
+    Reserva as mensagens pendentes mais antigas de um usuário que não tenha nada em processamento.
+    Como as linhas só saem da fila depois de processadas, uma conversa em andamento segura
+    as mensagens seguintes do mesmo usuário, que depois são juntadas num só turno.
+    Uma mensagem sozinha sai na hora. Com debounce, só espera quem ainda está digitando: se
+    chegou outra mensagem do usuário nos últimos COALESCE_DEBOUNCE_MS, aguarda o silêncio (no
+    máximo COALESCE_MAX_WAIT_MS). Mensagens que can_merge(user_id, texto) recusa (comandos, ou o
+    estado da conversa espera uma resposta por mensagem) vão sozinhas e sem espera.
+    """
+    now = time.time()
+    quiet_since = now - COALESCE_DEBOUNCE_MS / 1000 if debounce else now
+    stale_before = now - INBOX_CLAIM_TIMEOUT_SEC
+    user_filter = "AND q.user_id = ?" if user_id else ""
+    with transaction(immediate=True) as conn:
+        candidates = conn.execute(
+            f"""
+            SELECT q.*, (q.received_at <= ? OR NOT EXISTS (
+                       SELECT 1 FROM inbound_queue n WHERE n.user_id = q.user_id AND n.id > q.id AND n.received_at > ?)
+                   ) AS settled
+            FROM inbound_queue q
+            WHERE (q.claimed_by IS NULL OR q.claimed_at < ?) {user_filter}
+              AND NOT EXISTS (SELECT 1 FROM inbound_queue p WHERE p.user_id = q.user_id AND p.id < q.id)
+            ORDER BY q.id LIMIT 64
+            """,
+            (now - COALESCE_MAX_WAIT_MS / 1000, quiet_since, stale_before, *([user_id] if user_id else []))
+        ).fetchall()
+        first = next((row for row in candidates
+                      if row['settled'] or not can_merge(row['user_id'], row['message_text'])), None)
+        if not first:
+            return []
+
+        batch = [first]
+        if can_merge(first['user_id'], first['message_text']):
+            for row in conn.execute(
+                "SELECT * FROM inbound_queue WHERE user_id = ? AND id > ? AND (claimed_by IS NULL OR claimed_at < ?) ORDER BY id",
+                (first['user_id'], first['id'], stale_before)
+            ).fetchall():
+                if not can_merge(row['user_id'], row['message_text']):
+                    break
+                batch.append(row)
+
+        conn.executemany(
+            "UPDATE inbound_queue SET claimed_by = ?, claimed_at = ?, attempts = attempts + 1 WHERE id = ?",
+            [(worker_id, now, row['id']) for row in batch]
+        )
+    with _stats_lock:
+        _wait_samples.extend((now - row['received_at']) * 1000 for row in batch)
+    for row in batch:
+        tracing.record_span('inbound_queue.wait', row['received_at'], now, trace_id=row['trace_id'], worker=worker_id, batch_size=len(batch))
+    return batch
+
+def _finish_batch(batch):
+    with transaction() as conn:
+        conn.executemany("DELETE FROM inbound_queue WHERE id = ?", [(row['id'],) for row in batch])
+    _notify_workers()  # libera as próximas mensagens do mesmo usuário
+
+def _handle_batch(batch, handler):
+    """Processa um lote reservado como um único turno e o retira da fila."""
+    first = batch[0]
+    if first['attempts'] >= MAX_ATTEMPTS:
+        logging.error(f"Mensagem {first['id']} de {first['user_id']} descartada após {first['attempts']} tentativas de processamento.")
+        with _stats_lock:
+            _stats['dropped'] += len(batch)
+    else:
+        if len(batch) > 1:
+            logging.info(f"{len(batch)} mensagens seguidas de {first['user_id']} agrupadas em um único turno.")
+        with _stats_lock:
+            _stats['busy_workers'] += 1
+        # O turno segue o trace da primeira mensagem; as juntadas a ela ficam listadas no span.
+        merged = [row['trace_id'] for row in batch[1:] if row['trace_id']]
+        try:
+            with tracing.start_trace(first['trace_id'] or tracing.new_trace_id()), \
+                    tracing.span('inbound_queue.turn', user_id=first['user_id'], messages=len(batch), **({'merged_traces': merged} if merged else {})):
+                handler(first['user_id'], "\n".join(row['message_text'] for row in batch))
+        finally:
+            with _stats_lock:
+                _stats['busy_workers'] -= 1
+                _stats['processed'] += len(batch)
+                _stats['turns'] += 1
+                _stats['coalesced'] += len(batch) - 1
+    _finish_batch(batch)
+
+def _has_waiting_messages():
+    return get_connection().execute("SELECT 1 FROM inbound_queue WHERE claimed_by IS NULL LIMIT 1").fetchone() is not None
+
+def _process_inbound_queue(worker_id, handler, can_merge):
+    """Worker de conversa: reserva um lote de mensagens e chama handler(user_id, texto)."""
+    while not _stop_event.is_set():
+        seen_count = _wakeup_count
+        batch = []
+        try:
+            batch = _claim_next_batch(worker_id, can_merge)
+            if batch:
+                _handle_batch(batch, handler)
+        except Exception as e:
+            # O handler já trata os erros da conversa; aqui só chegam falhas da própria fila.
+            logging.critical(f"ERRO INESPERADO NO WORKER DE ENTRADA [{worker_id}]: {e}", exc_info=True)
+            time.sleep(1)
+
+        if not batch:
+            # Mensagens segurando o debounce: volta a olhar assim que o silêncio puder ter se completado.
+            timeout = COALESCE_DEBOUNCE_MS / 1000 if _has_waiting_messages() else INBOX_POLL_INTERVAL_SEC
+            _wait_for_wakeup(seen_count, timeout)
+
+def drain_user_inbox(user_id, handler, can_merge):
+    """
+    Processa na thread atual o próximo lote do usuário, sem debounce (modo 'sync').
+    Retorna False quando não há mais nada para ele.
+    """
+    batch = _claim_next_batch(f"sync-{threading.get_ident()}", can_merge, user_id=user_id, debounce=False)
+    if batch:
+        _handle_batch(batch, handler)
+    return bool(batch)
+
+def has_pending(user_id):
+    return get_connection().execute("SELECT 1 FROM inbound_queue WHERE user_id = ? LIMIT 1", (user_id,)).fetchone() is not None
+
+def get_ingest_stats():
+    """Métricas de pressão da fila de entrada (para o endpoint /ingest-stats)."""
+    row = get_connection().execute(
+        "SELECT COUNT(*) AS depth, SUM(claimed_by IS NOT NULL) AS in_flight, MIN(received_at) AS oldest FROM inbound_queue"
+    ).fetchone()
+    with _stats_lock:
+        stats = dict(_stats)
+        waits = sorted(_wait_samples)
+
+    def percentile(p):
+        return round(waits[min(len(waits) - 1, int(len(waits) * p))], 1) if waits else None
+
+    stats.update({
+        'workers': len(_worker_threads),
+        'depth': row['depth'],
+        'in_flight': row['in_flight'] or 0,
+        'coalescing_rate': round(stats['coalesced'] / stats['processed'], 3) if stats['processed'] else 0,
+        'oldest_pending_age_sec': round(time.time() - row['oldest'], 3) if row['oldest'] else 0,
+        'wait_ms_p50': percentile(0.50),
+        'wait_ms_p95': percentile(0.95),
+        'wait_ms_max': round(waits[-1], 1) if waits else None,
+    })
+    return stats
+
+def start_inbox_workers(handler, can_merge=lambda user_id, text: True, workers=None):
+    """
+    Inicia o pool de workers de conversa. 'handler(user_id, texto)' processa cada turno;
+    'can_merge(user_id, texto)' diz se a mensagem pode ser juntada com as vizinhas.
+    """
+    _stop_event.clear()
+    for index in range(workers or INBOX_WORKERS):
+        worker_id = f"inbox-{index + 1}-{uuid.uuid4().hex[:6]}"
+        worker_thread = threading.Thread(target=_process_inbound_queue, args=(worker_id, handler, can_merge), daemon=True)
+        worker_thread.start()
+        _worker_threads.append(worker_thread)
+    print(f"--> Workers de conversa iniciados ({workers or INBOX_WORKERS} em paralelo).")
+
+def stop_inbox_workers(timeout=5):
+    """Sinaliza os workers para encerrar e aguarda o término (usado em testes e benchmarks)."""
+    _stop_event.set()
+    with _wakeup:
+        _wakeup.notify_all()
+    for worker_thread in _worker_threads:
+        worker_thread.join(timeout)
+    _worker_threads.clear()
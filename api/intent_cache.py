@@ -0,0 +1,109 @@
+# --- Conteúdo do arquivo: api/intent_cache.py ---
+import json
+import time
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from config import INTENT_CACHE_SIZE, INTENT_CACHE_TTL_SEC, INTENT_CACHE_PERSIST
+from connection_manager import transaction
+
+# Cache LRU com validade (TTL) das respostas da IA de intenções.
+# A chave junta a mensagem normalizada, um resumo do histórico enviado junto e a versão
+# do prompt (hash do SYSTEM_INSTRUCTION): mudou o prompt, as entradas antigas deixam de valer.
+# Só respostas bem-sucedidas da IA entram aqui. Opcionalmente persistido na tabela intent_cache.
+
+_entries = OrderedDict()  # chave -> (resultado em JSON, criado em)
+_lock = threading.Lock()
+_stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'expired': 0}
+_prompt_version = None
+
+def prompt_version(system_instruction):
+    return hashlib.sha256(system_instruction.encode('utf-8')).hexdigest()[:16]
+
+def make_key(normalized_message, history, version):
+    history_digest = hashlib.sha256(
+        json.dumps([(turn.get('role'), turn.get('content')) for turn in history or []], ensure_ascii=False).encode('utf-8')
+    ).hexdigest()[:16]
+    return hashlib.sha256(f"{version}|{history_digest}|{normalized_message}".encode('utf-8')).hexdigest()
+
+def _use_version(version):
+    """Na primeira chamada (ou se o prompt mudou) descarta o que for de outra versão e carrega o que estiver salvo."""
+    global _prompt_version
+    if _prompt_version == version:
+        return
+    _entries.clear()
+    _prompt_version = version
+    if not INTENT_CACHE_PERSIST:
+        return
+    try:
+        with transaction() as conn:
+            conn.execute(
+                "DELETE FROM intent_cache WHERE prompt_version != ? OR created_at < ?",
+                (version, time.time() - INTENT_CACHE_TTL_SEC)
+            )
+            rows = conn.execute(
+                "SELECT cache_key, result, created_at FROM intent_cache ORDER BY created_at DESC LIMIT ?",
+                (INTENT_CACHE_SIZE,)
+            ).fetchall()
+        for row in reversed(rows):
+            _entries[row['cache_key']] = (row['result'], row['created_at'])
+        logging.info(f"Cache de intenções carregado com {len(rows)} entradas (prompt {version}).")
+    except Exception as e:
+        logging.warning(f"Cache de intenções: não foi possível carregar do banco: {e}")
+
+def get(key, version):
+    """Resultado em cache (uma cópia, o chamador pode alterar) ou None."""
+    with _lock:
+        _use_version(version)
+        entry = _entries.get(key)
+        if entry and time.time() - entry[1] > INTENT_CACHE_TTL_SEC:
+            del _entries[key]
+            _stats['expired'] += 1
+            entry = None
+        if entry is None:
+            _stats['misses'] += 1
+            return None
+        _entries.move_to_end(key)
+        _stats['hits'] += 1
+    return json.loads(entry[0])
+
+def put(key, version, result):
+    encoded = json.dumps(result, ensure_ascii=False)
+    created_at = time.time()
+    with _lock:
+        _use_version(version)
+        _entries[key] = (encoded, created_at)
+        _entries.move_to_end(key)
+        evicted = []
+        while len(_entries) > INTENT_CACHE_SIZE:
+            evicted.append(_entries.popitem(last=False)[0])
+            _stats['evictions'] += 1
+    if not INTENT_CACHE_PERSIST:
+        return
+    try:
+        with transaction() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO intent_cache (cache_key, prompt_version, result, created_at) VALUES (?, ?, ?, ?)",
+                (key, version, encoded, created_at)
+            )
+            conn.executemany("DELETE FROM intent_cache WHERE cache_key = ?", [(k,) for k in evicted])
+    except Exception as e:
+        logging.warning(f"Cache de intenções: não foi possível gravar no banco: {e}")
+
+def get_stats():
+    with _lock:
+        stats = dict(_stats, size=len(_entries), prompt_version=_prompt_version)
+    lookups = stats['hits'] + stats['misses']
+    stats['hit_rate'] = round(stats['hits'] / lookups, 3) if lookups else 0
+    return stats
+
+def clear():
+    """Esvazia o cache (memória e banco)."""
+    global _prompt_version
+    with _lock:
+        _entries.clear()
+        _prompt_version = None
+    if INTENT_CACHE_PERSIST:
+        with transaction() as conn:
+            conn.execute("DELETE FROM intent_cache")
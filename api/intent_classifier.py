@@ -0,0 +1,186 @@
+# --- Conteúdo do arquivo: api/intent_classifier.py ---
+import os
+import json
+import math
+import zlib
+import base64
+import hashlib
+import logging
+import threading
+from array import array
+from datetime import datetime
+from config import INTENT_CLASSIFIER_PATH, INTENT_CLASSIFIER_THRESHOLD, INTENT_LABEL_LOG, INTENT_LABEL_RETENTION
+from connection_manager import transaction
+
+# Classificador local de intenções, entre as palavras-chave e a IA remota.
+# Naive Bayes multinomial sobre n-gramas de caracteres (e palavras) com hashing, pesos
+# guardados como arrays float32. É treinado com as respostas que a própria IA deu
+# (tabela intent_labels) por tools/train_intent_classifier.py. Só responde acima do
+# limiar de confiança; no resto a mensagem segue para a IA.
+
+MODEL_FORMAT = 1
+N_FEATURES = 2 ** 15
+NGRAM_RANGE = (2, 4)
+
+# Intenções que dependem dos campos extraídos pela IA (serviço, data, horário): o
+# classificador aprende a reconhecê-las, mas nunca responde por elas. 'unknown' também
+# fica com a IA: é o rótulo do que o modelo não sabe encaixar.
+NEVER_ANSWER = {'schedule', 'ask_availability', 'unknown'}
+
+_lock = threading.Lock()
+_model = None
+_model_mtime = None
+_stats = {'answered': 0, 'deferred': 0}
+
+def label_for(result):
+    """Rótulo de treino para uma resposta da IA ('confirmation' carrega o sim/não)."""
+    intent = result.get('intent') or 'unknown'
+    if intent == 'confirmation' and result.get('confirmation') in ('yes', 'no'):
+        return f"confirmation:{result['confirmation']}"
+    return intent
+
+def result_for(label):
+    intent, _, confirmation = label.partition(':')
+    return {"intent": intent, "confirmation": confirmation} if confirmation else {"intent": intent}
+
+def featurize(normalized_text):
+    """Contagem dos n-gramas (texto já normalizado por ai_agent.normalize_text) por índice de hash."""
+    features = {}
+    padded = f" {normalized_text} "
+    grams = [f"w:{word}" for word in normalized_text.split()]
+    for n in range(NGRAM_RANGE[0], NGRAM_RANGE[1] + 1):
+        grams.extend(padded[i:i + n] for i in range(len(padded) - n + 1))
+    for gram in grams:
+        index = zlib.crc32(gram.encode('utf-8')) % N_FEATURES
+        features[index] = features.get(index, 0) + 1
+    return features
+
+class IntentModel:
+    def __init__(self, classes, class_log_prior, feature_log_prob, version, metrics=None):
+        self.classes = classes
+        self.class_log_prior = class_log_prior
+        self.feature_log_prob = feature_log_prob  # um array('f') de N_FEATURES por classe
+        self.version = version
+        self.metrics = metrics or {}
+
+    def predict(self, normalized_text):
+        """(rótulo, confiança) para o texto normalizado."""
+        features = featurize(normalized_text)
+        scores = []
+        for prior, weights in zip(self.class_log_prior, self.feature_log_prob):
+            scores.append(prior + sum(count * weights[index] for index, count in features.items()))
+        best = max(range(len(scores)), key=scores.__getitem__)
+        total = sum(math.exp(score - scores[best]) for score in scores)
+        return self.classes[best], 1 / total
+
+    def to_dict(self):
+        return {
+            'format': MODEL_FORMAT,
+            'version': self.version,
+            'n_features': N_FEATURES,
+            'ngram_range': list(NGRAM_RANGE),
+            'classes': self.classes,
+            'class_log_prior': self.class_log_prior,
+            'feature_log_prob': [base64.b64encode(weights.tobytes()).decode('ascii') for weights in self.feature_log_prob],
+            'metrics': self.metrics,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        if data.get('format') != MODEL_FORMAT or data.get('n_features') != N_FEATURES or tuple(data.get('ngram_range', ())) != NGRAM_RANGE:
+            raise ValueError(f"Modelo incompatível (formato {data.get('format')}); treine de novo com tools/train_intent_classifier.py.")
+        weights = []
+        for encoded in data['feature_log_prob']:
+            class_weights = array('f')
+            class_weights.frombytes(base64.b64decode(encoded))
+            weights.append(class_weights)
+        return cls(data['classes'], data['class_log_prior'], weights, data['version'], data.get('metrics'))
+
+def train(samples, alpha=0.1):
+    """Treina com uma lista de (texto normalizado, rótulo) e retorna um IntentModel."""
+    classes = sorted({label for _, label in samples})
+    class_index = {label: i for i, label in enumerate(classes)}
+    counts = [array('d', bytes(8 * N_FEATURES)) for _ in classes]
+    totals = [0.0] * len(classes)
+    docs = [0] * len(classes)
+    for text, label in samples:
+        c = class_index[label]
+        docs[c] += 1
+        for index, count in featurize(text).items():
+            counts[c][index] += count
+            totals[c] += count
+
+    class_log_prior = [math.log(n / len(samples)) for n in docs]
+    feature_log_prob = []
+    for c in range(len(classes)):
+        denominator = math.log(totals[c] + alpha * N_FEATURES)
+        feature_log_prob.append(array('f', (math.log(count + alpha) - denominator for count in counts[c])))
+
+    digest = hashlib.sha256(b''.join(weights.tobytes() for weights in feature_log_prob)).hexdigest()[:8]
+    version = f"{datetime.now():%Y%m%d%H%M%S}-{digest}"
+    return IntentModel(classes, class_log_prior, feature_log_prob, version)
+
+def save_model(model, path=INTENT_CLASSIFIER_PATH):
+    """Grava o modelo de forma atômica (arquivo temporário + rename)."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(model.to_dict(), f)
+    os.replace(tmp_path, path)
+
+def load_model(path=INTENT_CLASSIFIER_PATH):
+    with open(path, encoding='utf-8') as f:
+        return IntentModel.from_dict(json.load(f))
+
+def _current_model():
+    """Modelo em uso; recarrega sozinho quando o arquivo é trocado por um novo treino."""
+    global _model, _model_mtime
+    try:
+        mtime = os.stat(INTENT_CLASSIFIER_PATH).st_mtime
+    except OSError:
+        return None
+    if mtime != _model_mtime:
+        with _lock:
+            if mtime != _model_mtime:
+                try:
+                    _model = load_model()
+                    logging.info(f"Classificador de intenções carregado (versão {_model.version}).")
+                except Exception as e:
+                    logging.error(f"Classificador de intenções: não foi possível carregar o modelo: {e}")
+                    _model = None
+                _model_mtime = mtime
+    return _model
+
+def classify(normalized_text, threshold=INTENT_CLASSIFIER_THRESHOLD):
+    """Resultado no formato da IA se o modelo tiver confiança suficiente; senão None (vai para a IA)."""
+    model = _current_model()
+    if model is None:
+        return None
+    label, confidence = model.predict(normalized_text)
+    if confidence < threshold or label.partition(':')[0] in NEVER_ANSWER:
+        _stats['deferred'] += 1
+        return None
+    _stats['answered'] += 1
+    logging.info(f"Classificador local respondeu '{label}' ({confidence:.2f}, modelo {model.version}).")
+    return result_for(label)
+
+def log_label(message, result, has_history):
+    """Guarda a mensagem e o rótulo devolvido pela IA, para o próximo treino (no máximo INTENT_LABEL_RETENTION)."""
+    if not INTENT_LABEL_LOG:
+        return
+    try:
+        with transaction() as conn:
+            conn.execute(
+                "INSERT INTO intent_labels (message, label, result, has_history, created_at) VALUES (?, ?, ?, ?, ?)",
+                (message, label_for(result), json.dumps(result, ensure_ascii=False), int(has_history), datetime.now().isoformat())
+            )
+            conn.execute(
+                "DELETE FROM intent_labels WHERE id <= (SELECT id FROM intent_labels ORDER BY id DESC LIMIT 1 OFFSET ?)",
+                (INTENT_LABEL_RETENTION,)
+            )
+    except Exception as e:
+        logging.warning(f"Não foi possível registrar o rótulo da IA: {e}")
+
+def get_stats():
+    model = _model
+    return dict(_stats, model_version=model.version if model else None)
@@ -0,0 +1,82 @@
+# --- Conteúdo do arquivo: api/media_store.py ---
+import os
+import base64
+import hashlib
+import mimetypes
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from connection_manager import get_connection, transaction
+from config import MEDIA_BASE64_CACHE_SIZE
+
+# Armazém de mídias endereçado por conteúdo (SHA-256).
+# Cada arquivo é registrado uma vez; a fila de envio guarda só o media_id, e o worker
+# manda ao gateway o base64, calculado e conferido contra o hash uma vez por processo e mantido em cache.
+# O gateway nunca recebe caminhos: o /send-message não tem autenticação e não pode ler arquivos locais.
+
+_registered = {}    # (caminho, mtime, tamanho) -> media_id
+_encoded_cache = OrderedDict()  # media_id -> base64 (conferido contra o hash), até MEDIA_BASE64_CACHE_SIZE
+_lock = threading.Lock()
+
+def _file_digest(file_path):
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def register_file(file_path, file_name=None, mime_type=None):
+    """Registra o arquivo (se ainda não registrado) e retorna seu media_id. O hash só é recalculado se o arquivo mudar."""
+    file_path = os.path.abspath(file_path)
+    stat = os.stat(file_path)
+    key = (file_path, stat.st_mtime, stat.st_size)
+    with _lock:
+        media_id = _registered.get(key)
+        if media_id:
+            return media_id
+
+        media_id = _file_digest(file_path)
+        with transaction() as conn:
+            conn.execute(
+                """
+                INSERT INTO media_store (media_id, file_path, file_name, mime_type, size, created_at) VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT(media_id) DO UPDATE SET file_path = excluded.file_path, file_name = excluded.file_name
+                """,
+                (media_id, file_path, file_name or os.path.basename(file_path),
+                 mime_type or mimetypes.guess_type(file_path)[0] or 'application/octet-stream',
+                 stat.st_size, datetime.now().isoformat())
+            )
+        _registered[key] = media_id
+        return media_id
+
+def get_media(media_id):
+    return get_connection().execute("SELECT * FROM media_store WHERE media_id = ?", (media_id,)).fetchone()
+
+class MediaContentChanged(Exception):
+    """O arquivo de uma mídia registrada mudou: o conteúdo não bate mais com o media_id (hash)."""
+
+def get_base64(media_id):
+    """
+    Conteúdo em base64, codificado uma única vez por processo e guardado num LRU pequeno.
+    Os bytes lidos são conferidos contra o media_id antes de entrar no cache: se o arquivo foi
+    trocado depois do registro, levanta MediaContentChanged em vez de mandar o conteúdo novo.
+    """
+    with _lock:
+        encoded = _encoded_cache.get(media_id)
+        if encoded is not None:
+            _encoded_cache.move_to_end(media_id)
+            return encoded
+    media = get_media(media_id)
+    if media is None:
+        raise KeyError(f"Mídia {media_id} não registrada.")
+    with open(media['file_path'], 'rb') as f:
+        content = f.read()
+    if hashlib.sha256(content).hexdigest() != media_id:
+        raise MediaContentChanged(f"Mídia {media_id}: o arquivo {media['file_path']} mudou desde o registro.")
+    encoded = base64.b64encode(content).decode('utf-8')
+    with _lock:
+        _encoded_cache[media_id] = encoded
+        _encoded_cache.move_to_end(media_id)
+        while len(_encoded_cache) > MEDIA_BASE64_CACHE_SIZE:
+            _encoded_cache.popitem(last=False)
+    return encoded
@@ -2,96 +2,338 @@ import csv
 
 import os
 
+import time
+
+import string
+
 import logging
 
+import threading
+
+from config import MESSAGES_FILE, MESSAGES_RELOAD_CHECK_SEC
+
+
+
+# Chaves usadas pelo código e os valores que cada chamada de get_message passa.
+
+# Conferido ao carregar o CSV: chave ausente ou placeholder que o código não preenche vira erro no log
+
+# na hora da carga, e não um aviso a cada mensagem enviada.
+
+EXPECTED_MESSAGES = {
+
+    'WELCOME': (), 'TRANSFER_TO_HUMAN': (), 'COURSE_INFO': (), 'COURSE_INFO_PROMPT': (),
+
+    'PORTFOLIO_CAPTION': (), 'PORTFOLIO_ERROR': (), 'PORTFOLIO_SENT': (),
+
+    'REMINDER_RESPONSE': (), 'AUTOMATION_PAUSED': (), 'AUTOMATION_REACTIVATED': (),
+
+    'GENERAL_OK_IF_YOU_NEED_ANYTHING': (), 'GENERAL_OK_NO_PROBLEM': (), 'GENERAL_THANKS': (),
+
+    'GENERAL_UNKNOWN_INTENT': (), 'GENERAL_LOST_FALLBACK': (), 'CRITICAL_ERROR_WEBHOOK': (), 'SESSION_TIMEOUT': (),
+
+    'ESCAPE_INTENT_PORTFOLIO': ('last_question',),
+
+    'ESCAPE_INTENT_COURSE_INFO': ('course_info', 'last_question'),
+
+    'TRANSFER_CONFIRM_REJECTED': ('horarios_str',),
+
+    'SCHEDULING_INVALID_DATE': (), 'SCHEDULING_PAST_DATE': (),
 
+    'SCHEDULING_SUNDAY_CLOSED': ('next_day',),
 
-messages = {}
+    'SCHEDULING_NO_PROBLEM_ON_CANCEL': (), 'SCHEDULING_REQUEST_DATE': (), 'SCHEDULING_NO_SLOTS': (),
 
+    'SCHEDULING_AVAILABLE_SLOTS': ('formatted_date', 'horarios_str'),
 
+    'SCHEDULING_ASK_SWITCH_SLOT': (), 'SCHEDULING_TRY_ANOTHER_DATE': (), 'SCHEDULING_TIME_CONFIRMED': (),
 
-def load_messages():
+    'SCHEDULING_INVALID_TIME': ('horarios_str',),
+
+    'SCHEDULING_REQUEST_SERVICE': (), 'SCHEDULING_SERVICE_CONFIRMED': (), 'SCHEDULING_REQUEST_FULL_NAME': (),
+
+    'SCHEDULING_PHONE_CONFIRMED_ASK_OBS': (), 'SCHEDULING_POLICY_PROMPT': (), 'SCHEDULING_CANCELLED': (),
+
+    'SCHEDULING_FINAL_CONFIRMATION': ('name', 'service', 'formatted_date', 'time', 'address'),
+
+    'CANCELLATION_FOUND_PROMPT': ('client_name', 'service_name', 'formatted_datetime'),
+
+    'CANCELLATION_TOO_CLOSE': (), 'CANCELLATION_NOT_FOUND': (), 'CANCELLATION_REQUEST_PHONE': (),
+
+    'CANCELLATION_ABORTED': (), 'CANCELLATION_CONFIRMED': (), 'CANCELLATION_API_ERROR': (),
+
+    'CANCELLATION_TOO_CLOSE_NO_AGENT': (),
+
+    'REMINDER_24H': ('service', 'start_time', 'address'),
+
+    'REMINDER_1H': ('service', 'start_time', 'address'),
+
+    'AGENT_NOTIFY_HUMAN': ('client_number',),
+
+    'AGENT_NOTIFY_BOOKING': ('name', 'service', 'formatted_date', 'time'),
+
+    'AGENT_NOTIFY_BOOKING_WITH_OBS': ('name', 'service', 'formatted_date', 'time', 'obs'),
+
+    'AGENT_NOTIFY_CANCELLATION': ('client_name', 'datetime'),
+
+}
+
+
+
+class CompiledMessage:
 
     """
 
-    Carrega as mensagens de um arquivo CSV para um dicionário em memória.
+    Um texto do catálogo já pronto para uso: '\\n' convertido em quebra de linha e os
 
-    O arquivo CSV deve ter duas colunas: 'key' e 'text'.
+    placeholders separados em partes (texto fixo, nome do campo), montadas com um join.
 
     """
 
-    global messages
+    __slots__ = ('key', 'text', 'fields', '_static', '_parts', '_format')
 
-    try:
 
-        file_path = os.path.join(os.path.dirname(__file__), 'messages.csv')
 
-        
+    def __init__(self, key, raw_text):
 
-        with open(file_path, mode='r', encoding='utf-8') as infile:
+        self.key = key
 
-            reader = csv.reader(infile)
+        self.text = raw_text.replace('\\n', '\n')
 
-            next(reader)  # Pula o cabeçalho (key,text)
+        parts = list(string.Formatter().parse(self.text))  # ValueError se as chaves estiverem malformadas
 
-            for row in reader:
+        self.fields = frozenset(name for _, name, _, _ in parts if name is not None)
 
-                if row and len(row) >= 2:
+        self._static = ''.join(literal for literal, _, _, _ in parts) if not self.fields else None
 
-                    key = row[0]
+        simple = all(not name or (name.isidentifier() and not spec and not conversion) for _, name, spec, conversion in parts if name is not None)
 
-                    text = row[1]
+        self._parts = tuple((literal, name) for literal, name, _, _ in parts) if simple else None
 
-                    messages[key] = text
+        self._format = None if simple else self.text.format  # formatação avançada ({x:>5}, {x!r}, {x.y}): usa o str.format
 
-        
 
-        logging.info("Dicionário de mensagens carregado com sucesso.")
 
+    def render(self, kwargs):
 
+        if self._static is not None:
 
-    except Exception as e:
+            return self._static
 
-        logging.critical(f"ERRO CRÍTICO AO CARREGAR MENSAGENS: {e}", exc_info=True)
+        if self._format is not None:
 
+            return self._format(**kwargs)
 
+        return ''.join([literal + (str(kwargs[name]) if name is not None else '') for literal, name in self._parts])
 
 
 
-def get_message(key, **kwargs):
+    def __repr__(self):
+
+        return f"CompiledMessage({self.key!r}, fields={sorted(self.fields)})"
+
+
+
+# Catálogo em uso: trocado por inteiro a cada recarga (uma atribuição), então quem lê nunca
+
+# precisa de lock e nunca vê um catálogo pela metade.
+
+_catalog = {}
+
+messages = {}  # chave -> texto com as quebras de linha já resolvidas
+
+_file_mtime = None
+
+_next_check = 0.0
+
+_reload_lock = threading.Lock()
+
+
+
+def _read_csv(file_path):
+
+    raw = {}
+
+    with open(file_path, mode='r', encoding='utf-8') as infile:
+
+        reader = csv.reader(infile)
+
+        next(reader)  # Pula o cabeçalho (key,text)
+
+        for row in reader:
+
+            if row and len(row) >= 2:
+
+                key = row[0]
+
+                if key in raw:
+
+                    logging.warning(f"Mensagem '{key}' repetida no {os.path.basename(file_path)}; vale a última.")
+
+                raw[key] = row[1]
+
+    return raw
+
+
+
+def compile_catalog(raw):
 
     """
 
-    Retorna uma mensagem formatada do dicionário.
+    Compila {chave: texto cru} e confere contra EXPECTED_MESSAGES.
 
-    Substitui placeholders como {nome} pelos valores em kwargs.
+    Retorna (catálogo, problemas), onde problemas é uma lista de descrições em texto.
+
+    """
+
+    catalog = {}
+
+    problems = []
+
+    for key, raw_text in raw.items():
 
-    Converte o texto '\n' para quebras de linha reais.
+        try:
+
+            catalog[key] = CompiledMessage(key, raw_text)
+
+        except ValueError as e:
+
+            problems.append(f"'{key}': texto com chaves {{}} malformadas ({e})")
+
+    for key, provided in EXPECTED_MESSAGES.items():
+
+        if key not in raw:
+
+            problems.append(f"'{key}': chave usada pelo código e ausente do arquivo")
+
+        elif key in catalog:
+
+            unknown = catalog[key].fields - set(provided)
+
+            if unknown:
+
+                problems.append(f"'{key}': placeholder(s) {sorted(unknown)} que o código não preenche (disponíveis: {list(provided) or 'nenhum'})")
+
+    return catalog, problems
+
+
+
+def load_messages(file_path=None):
+
+    """
+
+    Carrega e compila as mensagens do arquivo CSV (colunas 'key' e 'text').
+
+    Problemas no arquivo são registrados no log agora. Numa recarga, um arquivo com
+
+    problemas não substitui o catálogo que já está funcionando.
+
+    Retorna True se o catálogo foi trocado.
 
     """
 
-    message_template = messages.get(key)
+    global _catalog, messages, _file_mtime
+
+    file_path = file_path or MESSAGES_FILE
+
+    try:
+
+        mtime = os.path.getmtime(file_path)
+
+        catalog, problems = compile_catalog(_read_csv(file_path))
+
+    except Exception as e:
+
+        logging.critical(f"ERRO CRÍTICO AO CARREGAR MENSAGENS: {e}", exc_info=True)
+
+        return False
+
+    _file_mtime = mtime
+
+    for problem in problems:
+
+        logging.error(f"messages.csv: {problem}")
+
+    if problems and _catalog:
+
+        logging.error(f"Recarga de mensagens recusada ({len(problems)} problema(s)); mantendo o catálogo anterior.")
 
-    if message_template:
+        return False
+
+    _catalog = catalog
+
+    messages = {key: compiled.text for key, compiled in catalog.items()}
+
+    logging.info(f"Dicionário de mensagens carregado com sucesso ({len(catalog)} mensagens).")
+
+    return True
+
+
+
+def _reload_if_changed():
+
+    """Recarrega o catálogo se o CSV mudou. Só uma thread recarrega; as outras seguem com o catálogo atual."""
+
+    global _next_check
+
+    now = time.monotonic()
+
+    if MESSAGES_RELOAD_CHECK_SEC <= 0 or now < _next_check or not _reload_lock.acquire(blocking=False):
+
+        return
+
+    try:
+
+        _next_check = now + MESSAGES_RELOAD_CHECK_SEC
 
         try:
 
-            # --- ALTERAÇÃO AQUI ---
+            mtime = os.path.getmtime(MESSAGES_FILE)
+
+        except OSError:
+
+            return
+
+        if mtime != _file_mtime:
 
-            # Adicionamos .replace('\\n', '\n') para garantir a quebra de linha
+            logging.info("messages.csv foi alterado; recarregando as mensagens.")
 
-            formatted_message = message_template.format(**kwargs).replace('\\n', '\n')
+            load_messages()
+
+    finally:
+
+        _reload_lock.release()
+
+
+
+def get_message(key, **kwargs):
+
+    """
+
+    Retorna uma mensagem formatada do catálogo compilado.
+
+    Substitui placeholders como {nome} pelos valores em kwargs.
+
+    """
+
+    _reload_if_changed()
+
+    compiled = _catalog.get(key)
+
+    if compiled:
+
+        try:
 
-            return formatted_message
+            return compiled.render(kwargs)
 
-        except KeyError as e:
+        except (KeyError, IndexError, AttributeError) as e:
 
             logging.warning(f"Placeholder {e} não encontrado para a chave '{key}'.")
 
-            return message_template.replace('\\n', '\n')
+            return compiled.text
 
     else:
 
         logging.warning(f"A chave de mensagem '{key}' não foi encontrada.")
 
-        return f"AVISO: Chave '{key}' não encontrada."
+        return f"AVISO: Chave '{key}' não encontrada."
\ No newline at end of file
@@ -1,66 +1,242 @@
 # --- Conteúdo do arquivo: api/message_queue.py ---
-import sqlite3
-import json
 import time
+import uuid
+import socket
+import logging
 import threading
 import requests
 from datetime import datetime
-from config import GATEWAY_URL, DB_PATH
+from config import GATEWAY_URL, QUEUE_WORKERS, QUEUE_POLL_INTERVAL_SEC, QUEUE_CLAIM_TIMEOUT_SEC, QUEUE_RETRY_DELAY_SEC, QUEUE_WAKEUP_PORT, GATEWAY_TIMEOUT_SEC
+import media_store
+import http_client
+import metrics
+import tracing
+from connection_manager import get_connection, transaction
 
-def queue_message(user_id, text, media_data=None, file_name=None):
-    """Adiciona uma mensagem à fila de envio no banco de dados."""
+MAX_ATTEMPTS = 5
+
+_stop_event = threading.Event()
+_worker_threads = []
+
+# Jobs já aceitos pelo gateway cujo DELETE falhou (ex.: banco travado). Nunca voltam a ser
+# reservados neste processo; o DELETE é refeito antes de cada nova reserva.
+_sent_awaiting_delete = set()
+_sent_lock = threading.Lock()
+
+# Despertar dos workers: quem enfileira avisa na hora, em vez de esperar o próximo ciclo de polling.
+# No mesmo processo usa uma Condition; outros processos mandam um datagrama UDP para QUEUE_WAKEUP_PORT.
+_wakeup = threading.Condition()
+_wakeup_count = 0
+_wakeup_socket = None
+
+def notify_queue_worker():
+    """Acorda os workers da fila (no próprio processo ou, se não houver, no processo da API)."""
+    global _wakeup_count
+    if _worker_threads:
+        with _wakeup:
+            _wakeup_count += 1
+            _wakeup.notify_all()
+        return
     try:
-        conn = sqlite3.connect(DB_PATH, check_same_thread=False)
-        cursor = conn.cursor()
-        cursor.execute(
-            "INSERT INTO outbound_queue (user_id, message_text, media_data, file_name, created_at) VALUES (?, ?, ?, ?, ?)",
-            (user_id, text, media_data, file_name, datetime.now().isoformat())
-        )
-        conn.commit()
-        conn.close()
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+            sock.sendto(b'wakeup', ('127.0.0.1', QUEUE_WAKEUP_PORT))
+    except OSError:
+        pass  # Sem ouvinte: o polling de segurança encontra a mensagem.
+
+def _wait_for_wakeup(seen_count, timeout):
+    with _wakeup:
+        if _wakeup_count == seen_count and not _stop_event.is_set():
+            _wakeup.wait(timeout)
+
+def _listen_for_wakeups():
+    while not _stop_event.is_set():
+        try:
+            _wakeup_socket.recv(64)
+        except OSError:
+            return
+        notify_queue_worker()
+
+def _start_wakeup_listener():
+    global _wakeup_socket
+    try:
+        _wakeup_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        _wakeup_socket.bind(('127.0.0.1', QUEUE_WAKEUP_PORT))
+    except OSError as e:
+        logging.warning(f"Despertar entre processos da fila indisponível (porta {QUEUE_WAKEUP_PORT}): {e}")
+        _wakeup_socket = None
+        return
+    threading.Thread(target=_listen_for_wakeups, daemon=True).start()
+
+@metrics.timed(metrics.OUTBOUND_SECONDS, 'enqueue')
+def queue_message(user_id, text, media_data=None, file_name=None, media_id=None):
+    """
+    Adiciona uma mensagem à fila de envio no banco de dados.
+    Para arquivos do media store, passe media_id em vez de media_data (a linha guarda só a referência).
+    """
+    try:
+        # A resposta herda o trace da mensagem em processamento (se houver) e o devolve ao gateway.
+        with transaction() as conn:
+            conn.execute(
+                "INSERT INTO outbound_queue (user_id, message_text, media_data, media_id, file_name, created_at, trace_id) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (user_id, text, media_data, media_id, file_name, datetime.now().isoformat(), tracing.current_trace_id())
+            )
         print(f"Mensagem para {user_id} enfileirada.")
+        notify_queue_worker()
     except Exception as e:
         print(f"!!! ERRO AO ENFILEIRAR MENSAGEM: {e}")
 
-def _process_outbound_queue():
-    """Worker que processa a fila de mensagens e as envia para o Gateway."""
-    while True:
-        conn = sqlite3.connect(DB_PATH, check_same_thread=False)
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
+def _claim_next_job(worker_id):
+    """
+    Reserva atomicamente o próximo job enviável.
+    Só a mensagem mais antiga pendente de cada destinatário pode ser reservada, então
+    mensagens para o mesmo user_id saem em ordem estrita, enquanto destinatários
+    diferentes são atendidos em paralelo pelos outros workers.
+    Jobs já entregues esperando o DELETE não contam como pendentes.
+    """
+    now = time.time()
+    with _sent_lock:
+        sent_ids = tuple(_sent_awaiting_delete)
+    not_sent = f"AND q.id NOT IN ({', '.join('?' * len(sent_ids))})" if sent_ids else ""
+    with transaction(immediate=True) as conn:
+        job = conn.execute(
+            f"""
+            SELECT * FROM outbound_queue q
+            WHERE q.attempts < ?
+              AND (q.claimed_by IS NULL OR q.claimed_at < ?)
+              AND (q.next_attempt_at IS NULL OR q.next_attempt_at <= ?)
+              {not_sent}
+              AND NOT EXISTS (
+                  SELECT 1 FROM outbound_queue p
+                  WHERE p.user_id = q.user_id AND p.attempts < ? AND p.id < q.id {not_sent.replace('q.id', 'p.id')}
+              )
+            ORDER BY q.id LIMIT 1
+            """,
+            (MAX_ATTEMPTS, now - QUEUE_CLAIM_TIMEOUT_SEC, now, *sent_ids, MAX_ATTEMPTS, *sent_ids)
+        ).fetchone()
+        if job:
+            conn.execute("UPDATE outbound_queue SET claimed_by = ?, claimed_at = ? WHERE id = ?", (worker_id, now, job['id']))
+    return job
+
+def _confirm_sent(job_ids):
+    """
+    Apaga da fila jobs que o gateway já aceitou. Se o DELETE falhar, os ids ficam em
+    _sent_awaiting_delete: não são reenviados e o DELETE é tentado de novo depois.
+    """
+    try:
+        with transaction() as conn:
+            conn.executemany("DELETE FROM outbound_queue WHERE id = ?", [(job_id,) for job_id in job_ids])
+    except Exception as e:
+        with _sent_lock:
+            _sent_awaiting_delete.update(job_ids)
+        print(f"!!! ERRO AO REMOVER JOB(S) {list(job_ids)} JÁ ENVIADO(S): {e}. Não serão reenviados; nova remoção em breve.")
+        return False
+    with _sent_lock:
+        _sent_awaiting_delete.difference_update(job_ids)
+    return True
+
+def _retry_pending_deletes():
+    with _sent_lock:
+        job_ids = list(_sent_awaiting_delete)
+    if job_ids:
+        _confirm_sent(job_ids)
+
+def _release_failed_job(job, final=False):
+    attempts = MAX_ATTEMPTS if final else job['attempts'] + 1
+    delay = QUEUE_RETRY_DELAY_SEC * attempts
+    with transaction() as conn:
+        conn.execute(
+            "UPDATE outbound_queue SET attempts = ?, claimed_by = NULL, claimed_at = NULL, next_attempt_at = ? WHERE id = ?",
+            (attempts, time.time() + delay, job['id'])
+        )
+    if attempts < MAX_ATTEMPTS:
+        retry_timer = threading.Timer(delay, notify_queue_worker)
+        retry_timer.daemon = True
+        retry_timer.start()
+
+@metrics.timed(metrics.OUTBOUND_SECONDS, 'send')
+def _send_job(job):
+    payload = {"to": job['user_id'], "text": job['message_text']}
+    if job['media_id']:
+        payload['mediaData'] = media_store.get_base64(job['media_id'])
+        payload['fileName'] = job['file_name']
+    elif job['media_data']:
+        payload['mediaData'] = job['media_data']
+        payload['fileName'] = job['file_name']
+    headers = {}
+    if job['trace_id']:
+        payload['traceId'] = job['trace_id']
+        headers[tracing.TRACE_HEADER] = job['trace_id']
+    # Sem nova tentativa no cliente HTTP: o gateway pode ter entregue mesmo sem responder.
+    # Quem repete é a fila (_release_failed_job), com espera crescente.
+    http_client.post(GATEWAY_URL, timeout=GATEWAY_TIMEOUT_SEC, headers=headers, json=payload)
+
+def _process_outbound_queue(worker_id):
+    """Worker que reserva jobs da fila e os envia para o Gateway. Vários rodam em paralelo."""
+    while not _stop_event.is_set():
+        seen_count = _wakeup_count
         job = None
+        sent = False
         try:
-            cursor.execute("SELECT * FROM outbound_queue WHERE attempts < 5 ORDER BY created_at ASC LIMIT 1")
-            job = cursor.fetchone()
-            
-            if job:
-                print(f"Processando job {job['id']} para {job['user_id']}...")
-                payload = {"to": job['user_id'], "text": job['message_text']}
-                if job['media_data']:
-                    payload['mediaData'] = job['media_data']
-                    payload['fileName'] = job['file_name']
+            _retry_pending_deletes()
+            job = _claim_next_job(worker_id)
 
+            if job:
+                print(f"[{worker_id}] Processando job {job['id']} para {job['user_id']}...")
                 try:
-                    response = requests.post(GATEWAY_URL, json=payload, timeout=20)
-                    response.raise_for_status()
-                    cursor.execute("DELETE FROM outbound_queue WHERE id = ?", (job['id'],))
-                    conn.commit()
-                    print(f"Job {job['id']} enviado com sucesso.")
+                    with tracing.start_trace(job['trace_id']):
+                        tracing.record_span('outbound_queue.wait', datetime.fromisoformat(job['created_at']).timestamp(), time.time(),
+                                            worker=worker_id, attempts=job['attempts'])
+                        _send_job(job)
+                    sent = True
+                    if _confirm_sent([job['id']]):
+                        print(f"Job {job['id']} enviado com sucesso.")
                 except requests.exceptions.RequestException as e:
+                    metrics.OUTBOUND_SEND_FAILURES.inc()
                     print(f"!!! ERRO AO ENVIAR JOB {job['id']}: {e}. Nova tentativa em breve.")
-                    cursor.execute("UPDATE outbound_queue SET attempts = attempts + 1 WHERE id = ?", (job['id'],))
-                    conn.commit()
+                    _release_failed_job(job)
+                except media_store.MediaContentChanged as e:
+                    # Repetir não adianta: o arquivo não volta a ter o conteúdo registrado.
+                    metrics.OUTBOUND_SEND_FAILURES.inc()
+                    print(f"!!! JOB {job['id']} DESCARTADO: {e}")
+                    _release_failed_job(job, final=True)
         except Exception as e:
             print(f"!!! ERRO INESPERADO NO WORKER DA FILA: {e}")
-            if job:
-                cursor.execute("UPDATE outbound_queue SET attempts = attempts + 1 WHERE id = ?", (job['id'],))
-                conn.commit()
+            if job and not sent:
+                _release_failed_job(job)
+
+        if not job:
+            # Dorme até alguém enfileirar; o polling lento só cobre inserções sem aviso.
+            _wait_for_wakeup(seen_count, QUEUE_POLL_INTERVAL_SEC)
+
+def get_queue_stats():
+    """Profundidade da fila de envio, jobs em envio e idade (s) do job mais antigo."""
+    row = get_connection().execute(
+        "SELECT COUNT(*) AS depth, SUM(claimed_by IS NOT NULL) AS in_flight, MIN(created_at) AS oldest FROM outbound_queue"
+    ).fetchone()
+    oldest_age = (datetime.now() - datetime.fromisoformat(row['oldest'])).total_seconds() if row['oldest'] else 0
+    return {'depth': row['depth'], 'in_flight': row['in_flight'] or 0, 'oldest_age_sec': round(oldest_age, 1)}
 
-        conn.close()
-        time.sleep(2) 
+def start_queue_worker(workers=None):
+    """Inicia o pool de workers da fila, cada um em sua própria thread."""
+    _stop_event.clear()
+    if _wakeup_socket is None:
+        _start_wakeup_listener()
+    for index in range(workers or QUEUE_WORKERS):
+        worker_id = f"sender-{index + 1}-{uuid.uuid4().hex[:6]}"
+        worker_thread = threading.Thread(target=_process_outbound_queue, args=(worker_id,), daemon=True)
+        worker_thread.start()
+        _worker_threads.append(worker_thread)
+    print(f"--> Worker da fila de mensagens iniciado ({workers or QUEUE_WORKERS} envios em paralelo).")
 
-def start_queue_worker():
-    """Inicia o worker da fila em uma thread separada."""
-    worker_thread = threading.Thread(target=_process_outbound_queue, daemon=True)
-    worker_thread.start()
-    print("--> Worker da fila de mensagens iniciado.")
\ No newline at end of file
+def stop_queue_worker(timeout=5):
+    """Sinaliza os workers para encerrar e aguarda o término (usado em testes e benchmarks)."""
+    global _wakeup_socket
+    _stop_event.set()
+    with _wakeup:
+        _wakeup.notify_all()
+    if _wakeup_socket is not None:
+        _wakeup_socket.close()
+        _wakeup_socket = None
+    for worker_thread in _worker_threads:
+        worker_thread.join(timeout)
+    _worker_threads.clear()
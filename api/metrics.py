@@ -0,0 +1,132 @@
+# --- Conteúdo do arquivo: api/metrics.py ---
+import time
+import bisect
+import threading
+from functools import wraps
+import tracing
+
+# Métricas do processo da API, expostas em /metrics no formato texto do Prometheus.
+# Contadores e histogramas de baldes fixos, por rótulo; cada métrica tem seu próprio lock
+# e a atualização é só somar em uma lista já alocada. Valores "do momento" (profundidade
+# das filas, taxa de acerto do cache...) vêm de coletores chamados na hora da leitura.
+
+# Segundos. Do SQLite (sub-ms) até a IA/Google Calendar no pior caso.
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+_registry = []
+_collectors = []
+
+def _format_labels(labelnames, labelvalues, extra=()):
+    pairs = list(zip(labelnames, labelvalues)) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Counter:
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {} if labelnames else {(): 0}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def inc(self, *labelvalues, amount=1):
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            values = sorted(self._values.items())
+        lines.extend(f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}" for labels, value in values)
+        return lines
+
+class Histogram:
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series = {}  # rótulos -> [contagem por balde (+Inf no fim), soma]
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def observe(self, value, *labelvalues):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labelvalues)
+            if series is None:
+                series = self._series[labelvalues] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = sorted((labels, list(counts), total) for labels, (counts, total) in self._series.items())
+        for labels, counts, total in series:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = _format_labels(self.labelnames, labels, [('le', _format_value(bound))])
+                lines.append(f"{self.name}_bucket{le} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, labels)} {total!r}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, labels)} {cumulative}")
+        return lines
+
+def timed(histogram, *labelvalues):
+    """
+    Decorador: observa a duração de cada chamada (com ou sem exceção) no histograma.
+    Com um trace ativo, a chamada também vira um span ('módulo.função') em tracing.py.
+    """
+    def decorator(fn):
+        span_name = f"{fn.__module__}.{fn.__name__}"
+
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                with tracing.span(span_name):
+                    return fn(*args, **kwargs)
+            finally:
+                histogram.observe(time.perf_counter() - start, *labelvalues)
+        return wrapper
+    return decorator
+
+def register_collector(collector):
+    """
+    Registra uma função chamada a cada leitura de /metrics. Ela retorna uma lista de
+    (nome, ajuda, tipo, valor) ou (nome, ajuda, tipo, [(rótulos: dict, valor), ...]).
+    """
+    _collectors.append(collector)
+
+def render():
+    """Todas as métricas no formato texto do Prometheus (version 0.0.4)."""
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    for collector in _collectors:
+        for name, documentation, kind, samples in collector():
+            lines.extend([f"# HELP {name} {documentation}", f"# TYPE {name} {kind}"])
+            if not isinstance(samples, list):
+                samples = [({}, samples)]
+            for labels, value in samples:
+                lines.append(f"{name}{_format_labels(labels.keys(), labels.values())} {_format_value(value)}")
+    return '\n'.join(lines) + '\n'
+
+# --- Métricas do bot ---
+PROCESS_MESSAGE_SECONDS = Histogram('glassy_process_message_seconds', 'Tempo de app.process_message por mensagem.')
+INTENT_SECONDS = Histogram('glassy_extract_intent_seconds', 'Tempo de ai_agent.extract_intent.')
+INTENT_SOURCE = Counter('glassy_intent_source_total', 'Quem respondeu a intenção.', ['source'])
+LLM_SECONDS = Histogram('glassy_llm_request_seconds', 'Tempo da chamada à IA da Cloudflare (com novas tentativas).')
+CALENDAR_SECONDS = Histogram('glassy_calendar_seconds', 'Tempo das funções de calendar_service.', ['call'])
+DB_SECONDS = Histogram('glassy_db_seconds', 'Tempo das leituras e gravações de database_manager.', ['op', 'kind'])
+OUTBOUND_SECONDS = Histogram('glassy_outbound_seconds', 'Fila de envio: gravar a mensagem (enqueue) e entregá-la ao gateway (send).', ['op'])
+OUTBOUND_SEND_FAILURES = Counter('glassy_outbound_send_failures_total', 'Envios ao gateway que falharam (o job volta para a fila).')
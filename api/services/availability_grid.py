@@ -0,0 +1,272 @@
+import json
+import time
+import logging
+import datetime
+import threading
+from services import calendar_mirror
+from connection_manager import get_connection, transaction
+from config import HORARIOS_FIXOS, DURACAO_EVENTO_MIN, AVAILABILITY_GRID_DAYS, SLOT_MIN_LEAD_HOURS
+
+# Grade de disponibilidade: para cada dia de hoje até AVAILABILITY_GRID_DAYS à frente, os horários de
+# HORARIOS_FIXOS que não colidem com nenhum evento do espelho da agenda. Fica em memória (leitura
+# sem banco) e na tabela availability_grid, para sobreviver a reinícios.
+# Os dias lidos do banco na partida só passam a ser servidos depois que o espelho sincroniza:
+# alterações feitas com o bot fora do ar chegam nessa sincronização e invalidam os dias tocados.
+# Cada alteração do espelho (sincronização, create_event, confirm_cancel_event) invalida só os dias
+# tocados pelo evento antes e depois da mudança; um worker recalcula esses dias em segundo plano.
+# O que depende da hora atual (antecedência mínima e 07:00 depois das 21h) é aplicado na leitura.
+
+TZ = calendar_mirror.TZ
+SLOT_TIMES = {slot_str: datetime.datetime.strptime(slot_str, "%H:%M").time() for slot_str in HORARIOS_FIXOS}
+
+_grid = {}          # datetime.date -> tupla com os horários livres pela agenda
+_versions = {}      # datetime.date -> contador de invalidações (evita gravar um cálculo já vencido)
+_pending = set()    # dias invalidados esperando o worker
+_unverified = {}    # datetime.date -> horários lidos do banco, aguardando a sincronização do espelho
+_lock = threading.Lock()
+_wakeup = threading.Condition(_lock)
+_stats = {'hits': 0, 'misses': 0, 'invalidations': 0, 'rebuilt_days': 0}
+_worker_thread = None
+
+
+def _window(today=None):
+    today = today or datetime.datetime.now(TZ).date()
+    return today, today + datetime.timedelta(days=AVAILABILITY_GRID_DAYS)
+
+
+def _window_days(today=None):
+    first, last = _window(today)
+    return [first + datetime.timedelta(days=offset) for offset in range((last - first).days + 1)]
+
+
+def _day_bounds(first_day, last_day):
+    """[início do primeiro dia, início do dia seguinte ao último) no fuso do estúdio."""
+    start = TZ.localize(datetime.datetime.combine(first_day, datetime.time.min))
+    end = TZ.localize(datetime.datetime.combine(last_day + datetime.timedelta(days=1), datetime.time.min))
+    return start, end
+
+
+def _busy_intervals(events):
+    return [(datetime.datetime.fromisoformat(e['start'].get('dateTime')),
+             datetime.datetime.fromisoformat(e['end'].get('dateTime')))
+            for e in events if 'dateTime' in e['start']]
+
+
+def _free_slots(day, busy_intervals):
+    """Horários fixos do dia sem sobreposição com os eventos (a parte da regra que não depende da hora atual)."""
+    free = []
+    for slot_str in HORARIOS_FIXOS:
+        slot_start = TZ.localize(datetime.datetime.combine(day, SLOT_TIMES[slot_str]))
+        slot_end = slot_start + datetime.timedelta(minutes=DURACAO_EVENTO_MIN)
+        if not any(max(start, slot_start) < min(end, slot_end) for start, end in busy_intervals):
+            free.append(slot_str)
+    return tuple(free)
+
+
+def _compute(days):
+    """Calcula os dias pedidos com uma única consulta ao espelho. Retorna {dia: horários livres}."""
+    if not days:
+        return {}
+    time_min, time_max = _day_bounds(min(days), max(days))
+    busy = _busy_intervals(calendar_mirror.list_events(time_min, time_max))
+    result = {}
+    for day in days:
+        day_start, day_end = _day_bounds(day, day)
+        result[day] = _free_slots(day, [(start, end) for start, end in busy if start < day_end and end > day_start])
+    return result
+
+
+def _store(computed, versions):
+    """Publica os dias calculados, menos os invalidados enquanto o cálculo acontecia."""
+    stored = {}
+    with _lock:
+        for day, free in computed.items():
+            if _versions.get(day, 0) == versions.get(day, 0):
+                _grid[day] = free
+                _unverified.pop(day, None)
+                _pending.discard(day)
+                stored[day] = free
+        _stats['rebuilt_days'] += len(stored)
+    if stored:
+        try:
+            with transaction() as conn:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO availability_grid (day, free_slots, built_at) VALUES (?, ?, ?)",
+                    [(day.isoformat(), json.dumps(free), time.time()) for day, free in stored.items()]
+                )
+        except Exception as e:
+            logging.warning(f"Grade de disponibilidade: não foi possível gravar no banco: {e}")
+    return stored
+
+
+def _rebuild(days):
+    with _lock:
+        versions = {day: _versions.get(day, 0) for day in days}
+    return _store(_compute(sorted(days)), versions)
+
+
+def _event_days(event):
+    """Dias (no fuso do estúdio) ocupados por um evento com horário."""
+    if not event or 'dateTime' not in event.get('start', {}) or 'dateTime' not in event.get('end', {}):
+        return set()
+    start = datetime.datetime.fromisoformat(event['start']['dateTime']).astimezone(TZ)
+    end = datetime.datetime.fromisoformat(event['end']['dateTime']).astimezone(TZ)
+    days = set()
+    day = start.date()
+    while day <= end.date() and len(days) <= AVAILABILITY_GRID_DAYS:
+        days.add(day)
+        day += datetime.timedelta(days=1)
+    return days
+
+
+def invalidate(days=None):
+    """Tira da grade (memória e banco) os dias indicados (todos, se None) e acorda o worker para recalculá-los."""
+    with _lock:
+        targets = set(_grid) | set(_unverified) | set(_window_days()) if days is None else set(days)
+        for day in targets:
+            _versions[day] = _versions.get(day, 0) + 1
+            _grid.pop(day, None)
+            _unverified.pop(day, None)
+        first, last = _window()
+        _pending.update(day for day in targets if first <= day <= last)
+        _stats['invalidations'] += len(targets)
+        _wakeup.notify_all()
+    # A linha gravada também sai: outro processo (ou este, depois de reiniciar) não pode carregá-la.
+    try:
+        with transaction() as conn:
+            if days is None:
+                conn.execute("DELETE FROM availability_grid")
+            else:
+                conn.executemany("DELETE FROM availability_grid WHERE day = ?", [(day.isoformat(),) for day in targets])
+    except Exception as e:
+        logging.warning(f"Grade de disponibilidade: não foi possível apagar dias invalidados do banco: {e}")
+
+
+def on_calendar_change(changes, full_resync):
+    """Ouvinte do espelho: invalida os dias do evento antes e depois de cada alteração."""
+    if full_resync:
+        invalidate()
+        return
+    days = set()
+    for previous, current in changes:
+        days |= _event_days(previous) | _event_days(current)
+    if days:
+        invalidate(days)
+
+
+def on_calendar_synced():
+    """Ouvinte do espelho: depois de uma sincronização, os dias lidos do banco que não foram invalidados valem."""
+    with _lock:
+        for day, free in _unverified.items():
+            _grid.setdefault(day, free)
+        _unverified.clear()
+
+
+# Registrados na importação: qualquer processo que leia a grade precisa ver as alterações do espelho.
+calendar_mirror.add_change_listener(on_calendar_change)
+calendar_mirror.add_sync_listener(on_calendar_synced)
+
+
+def _free_slots_for(day):
+    with _lock:
+        free = _grid.get(day)
+        _stats['hits' if free is not None else 'misses'] += 1
+    if free is not None:
+        return free
+    first, last = _window()
+    if not first <= day <= last:
+        return _compute([day])[day]  # fora da janela: calcula na hora, sem guardar
+    stored = _rebuild([day])
+    return stored[day] if day in stored else _compute([day])[day]  # invalidado durante o cálculo: recalcula
+
+
+def available_slots(day, now=None):
+    """
+    Horários livres para agendar no dia, já com as regras que dependem da hora atual:
+    pelo menos SLOT_MIN_LEAD_HOURS de antecedência e, depois das 21h, nada às 07:00 do dia seguinte.
+    """
+    now = now or datetime.datetime.now(TZ)
+    earliest = now + datetime.timedelta(hours=SLOT_MIN_LEAD_HOURS)
+    skip_seven_am = now.hour >= 21 and day == now.date() + datetime.timedelta(days=1)
+    free = _free_slots_for(day)
+    if day > earliest.date() and not skip_seven_am:
+        return list(free)
+    available = []
+    for slot_str in free:
+        if skip_seven_am and slot_str == "07:00":
+            continue
+        if TZ.localize(datetime.datetime.combine(day, SLOT_TIMES[slot_str])) < earliest:
+            continue
+        available.append(slot_str)
+    return available
+
+
+def load():
+    """
+    Carrega a grade gravada no banco (dias ainda na janela) como não verificada e agenda o recálculo
+    de todos os dias. Os dias carregados só são servidos depois da próxima sincronização do espelho.
+    """
+    first, last = _window()
+    rows = get_connection().execute(
+        "SELECT day, free_slots FROM availability_grid WHERE day >= ? AND day <= ?", (first.isoformat(), last.isoformat())
+    ).fetchall()
+    with _lock:
+        for row in rows:
+            day = datetime.date.fromisoformat(row['day'])
+            if day not in _grid:
+                _unverified[day] = tuple(json.loads(row['free_slots']))
+        _pending.update(_window_days())
+        _wakeup.notify_all()
+    return len(rows)
+
+
+def _run_forever():
+    current_day = datetime.datetime.now(TZ).date()
+    while True:
+        with _lock:
+            _wakeup.wait_for(lambda: _pending, timeout=60)
+            days = set(_pending)
+        today = datetime.datetime.now(TZ).date()
+        if today != current_day:
+            # Virada do dia: descarta os dias passados e inclui o novo dia no fim da janela.
+            current_day = today
+            with _lock:
+                for day in [day for day in _grid if day < today]:
+                    del _grid[day]
+                for day in [day for day in _unverified if day < today]:
+                    del _unverified[day]
+                for day in [day for day in _versions if day < today]:
+                    del _versions[day]
+                _pending.update(day for day in _window_days(today) if day not in _grid)
+                days = set(_pending)
+            try:
+                with transaction() as conn:
+                    conn.execute("DELETE FROM availability_grid WHERE day < ?", (today.isoformat(),))
+            except Exception as e:
+                logging.warning(f"Grade de disponibilidade: não foi possível limpar dias passados: {e}")
+        if not days:
+            continue
+        try:
+            _rebuild(days)
+        except Exception as e:
+            logging.error(f"Erro ao recalcular a grade de disponibilidade: {e}", exc_info=True)
+            time.sleep(5)
+
+
+def start_grid_worker():
+    """Carrega a grade do banco e inicia o worker que recalcula os dias invalidados."""
+    global _worker_thread
+    if _worker_thread is not None:
+        return
+    loaded = load()
+    _worker_thread = threading.Thread(target=_run_forever, daemon=True)
+    _worker_thread.start()
+    print(f"--> Grade de disponibilidade iniciada ({loaded} dia(s) carregados do banco, {AVAILABILITY_GRID_DAYS} dias à frente).")
+
+
+def get_stats():
+    with _lock:
+        stats = dict(_stats, days=len(_grid), pending=len(_pending), unverified=len(_unverified))
+    lookups = stats['hits'] + stats['misses']
+    stats['hit_rate'] = round(stats['hits'] / lookups, 3) if lookups else 0
+    return stats
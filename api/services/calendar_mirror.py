@@ -0,0 +1,298 @@
+import json
+import time
+import threading
+import logging
+import datetime
+import pytz
+from googleapiclient.errors import HttpError
+from services import phone_index
+from connection_manager import get_connection, transaction
+from config import CALENDAR_ID, CALENDAR_SYNC_MAX_AGE_SEC, CALENDAR_MIRROR_PAST_DAYS
+
+# Espelho local (SQLite) da agenda CALENDAR_ID.
+# Mantido atualizado com sincronização incremental (events.list + syncToken) e
+# escrita direta (write-through) quando o próprio bot cria, altera ou remove eventos.
+# Eventos encerrados há mais de CALENDAR_MIRROR_PAST_DAYS dias são apagados a cada sincronização.
+# Leituras de disponibilidade, cancelamento e lembretes consultam só este espelho.
+
+TZ = pytz.timezone('America/Sao_Paulo')
+
+_sync_lock = threading.RLock()
+_change_listeners = []
+_sync_listeners = []
+# Escritas diretas feitas enquanto alguma sincronização baixa do Google (event_id -> número da escrita):
+# a sincronização não sobrescreve com a versão baixada um evento que o bot gravou depois.
+_write_seq = 0
+_written_during_sync = {}
+_syncs_in_flight = 0
+_background_sync = None  # thread da sincronização disparada por ensure_fresh
+
+
+def add_change_listener(listener):
+    """
+    Registra uma função chamada após cada alteração do espelho: listener(changes, full_resync).
+    'changes' é uma lista de (evento_anterior, evento_atual); um dos dois é None em criações/remoções.
+    Em uma carga completa, full_resync=True e 'changes' traz só os eventos atuais.
+    """
+    _change_listeners.append(listener)
+
+
+def add_sync_listener(listener):
+    """Registra uma função chamada sem argumentos ao fim de cada sincronização bem-sucedida com o Google."""
+    _sync_listeners.append(listener)
+
+
+def _notify_listeners(changes, full_resync=False):
+    if not changes and not full_resync:
+        return
+    for listener in list(_change_listeners):
+        try:
+            listener(changes, full_resync)
+        except Exception as e:
+            logging.error(f"Erro em ouvinte de alterações da agenda: {e}", exc_info=True)
+
+
+def _to_utc_iso(time_info: dict) -> str:
+    """Converte o campo 'start'/'end' de um evento do Google para ISO em UTC (ordenável como texto)."""
+    if time_info.get('dateTime'):
+        dt = datetime.datetime.fromisoformat(time_info['dateTime'].replace('Z', '+00:00'))
+        if dt.tzinfo is None:
+            tz = pytz.timezone(time_info.get('timeZone') or 'America/Sao_Paulo')
+            dt = tz.localize(dt)
+    else:
+        # Evento de dia inteiro: começa à meia-noite no fuso do estúdio.
+        day = datetime.date.fromisoformat(time_info['date'])
+        dt = TZ.localize(datetime.datetime.combine(day, datetime.time.min))
+    return dt.astimezone(pytz.utc).isoformat()
+
+
+def _upsert(cursor, event: dict):
+    start_utc = _to_utc_iso(event['start'])
+    cursor.execute(
+        "INSERT OR REPLACE INTO calendar_events (event_id, calendar_id, start_utc, end_utc, updated, raw) VALUES (?, ?, ?, ?, ?, ?)",
+        (event['id'], CALENDAR_ID, start_utc, _to_utc_iso(event['end']), event.get('updated'), json.dumps(event))
+    )
+    phone_index.index_event(cursor, event, start_utc)
+
+
+def _get_raw(cursor, event_id: str):
+    row = cursor.execute("SELECT raw FROM calendar_events WHERE event_id = ?", (event_id,)).fetchone()
+    return json.loads(row['raw']) if row else None
+
+
+def _delete(cursor, event_id: str):
+    cursor.execute("DELETE FROM calendar_events WHERE event_id = ?", (event_id,))
+    phone_index.unindex_event(cursor, event_id)
+
+
+def _get_sync_state(cursor):
+    cursor.execute("SELECT sync_token, synced_at FROM calendar_sync_state WHERE calendar_id = ?", (CALENDAR_ID,))
+    row = cursor.fetchone()
+    return (row['sync_token'], row['synced_at']) if row else (None, None)
+
+
+def _fetch_changes(service, sync_token):
+    """Baixa todas as páginas de events.list. Sem token, faz a carga completa a partir de ontem."""
+    params = {'calendarId': CALENDAR_ID, 'singleEvents': True}
+    if sync_token:
+        params['syncToken'] = sync_token
+    else:
+        time_min = datetime.datetime.now(pytz.utc) - datetime.timedelta(days=CALENDAR_MIRROR_PAST_DAYS)
+        params['timeMin'] = time_min.isoformat()
+
+    items = []
+    page_token = None
+    while True:
+        result = service.events().list(pageToken=page_token, **params).execute()
+        items.extend(result.get('items', []))
+        page_token = result.get('nextPageToken')
+        if not page_token:
+            return items, result.get('nextSyncToken')
+
+
+def _updated_at(event):
+    updated = (event or {}).get('updated')
+    return datetime.datetime.fromisoformat(updated.replace('Z', '+00:00')) if updated else None
+
+
+def _written_is_newer(cursor, event: dict) -> bool:
+    """
+    Para um evento gravado pelo próprio bot (write-through) enquanto a sincronização baixava:
+    True se o que está no espelho é pelo menos tão novo quanto a versão baixada, que então é ignorada.
+    Removido pelo bot = mais novo; a próxima sincronização traz o cancelamento do Google.
+    """
+    stored = _get_raw(cursor, event['id'])
+    if stored is None:
+        return True
+    stored_at, fetched_at = _updated_at(stored), _updated_at(event)
+    return not (stored_at and fetched_at and fetched_at > stored_at)
+
+
+def _prune(cursor) -> int:
+    """Apaga do espelho (e do índice de telefones) os eventos que terminaram antes da janela mantida."""
+    cutoff = (datetime.datetime.now(pytz.utc) - datetime.timedelta(days=CALENDAR_MIRROR_PAST_DAYS)).isoformat()
+    cursor.execute(
+        "DELETE FROM phone_index WHERE event_id IN (SELECT event_id FROM calendar_events WHERE calendar_id = ? AND end_utc < ?)",
+        (CALENDAR_ID, cutoff)
+    )
+    cursor.execute("DELETE FROM calendar_events WHERE calendar_id = ? AND end_utc < ?", (CALENDAR_ID, cutoff))
+    return cursor.rowcount
+
+
+def sync_calendar(service=None, force_full: bool = False):
+    """
+    Sincroniza o espelho com o Google Agenda.
+    Usa o syncToken salvo (incremental); se ele não existir ou expirar (HTTP 410),
+    refaz a carga completa. Retorna a quantidade de eventos alterados.
+    """
+    global _syncs_in_flight
+    from services.calendar_service import get_calendar_service
+
+    service = service or get_calendar_service()
+    with _sync_lock:
+        stored_token = _get_sync_state(get_connection().cursor())[0]
+        started_seq = _write_seq
+        _syncs_in_flight += 1
+    sync_token = None if force_full else stored_token
+
+    try:
+        # A ida ao Google acontece fora da trava e da transação: as escritas diretas não esperam a rede.
+        try:
+            items, next_token = _fetch_changes(service, sync_token)
+        except HttpError as e:
+            if sync_token and e.resp.status == 410:
+                logging.warning("Token de sincronização da agenda expirado. Refazendo carga completa.")
+                sync_token = None
+                items, next_token = _fetch_changes(service, None)
+            else:
+                raise
+
+        changes = []
+        with _sync_lock:
+            if _get_sync_state(get_connection().cursor())[0] != stored_token:
+                # Outra sincronização já aplicou alterações mais novas enquanto esta baixava.
+                logging.info("Sincronização da agenda descartada: outra sincronização terminou antes.")
+                return 0
+            written = {event_id for event_id, seq in _written_during_sync.items() if seq > started_seq}
+
+            with transaction(immediate=True) as conn:
+                cursor = conn.cursor()
+                if not sync_token:
+                    # Carga completa: os eventos gravados pelo bot durante o download ficam (e são comparados abaixo).
+                    keep = tuple(written)
+                    not_kept = f" AND event_id NOT IN ({', '.join('?' * len(keep))})" if keep else ""
+                    cursor.execute(
+                        f"DELETE FROM phone_index WHERE event_id IN (SELECT event_id FROM calendar_events WHERE calendar_id = ?{not_kept})",
+                        (CALENDAR_ID, *keep)
+                    )
+                    cursor.execute(f"DELETE FROM calendar_events WHERE calendar_id = ?{not_kept}", (CALENDAR_ID, *keep))
+
+                for event in items:
+                    if event['id'] in written and _written_is_newer(cursor, event):
+                        continue
+                    previous = _get_raw(cursor, event['id']) if sync_token or event['id'] in written else None
+                    if event.get('status') == 'cancelled':
+                        _delete(cursor, event['id'])
+                        if previous:
+                            changes.append((previous, None))
+                    elif 'start' in event and 'end' in event:
+                        _upsert(cursor, event)
+                        changes.append((previous, event))
+
+                pruned = _prune(cursor)
+                cursor.execute(
+                    "INSERT OR REPLACE INTO calendar_sync_state (calendar_id, sync_token, synced_at) VALUES (?, ?, ?)",
+                    (CALENDAR_ID, next_token, time.time())
+                )
+
+            _notify_listeners(changes, full_resync=not sync_token)
+            for listener in list(_sync_listeners):
+                try:
+                    listener()
+                except Exception as e:
+                    logging.error(f"Erro em ouvinte de sincronização da agenda: {e}", exc_info=True)
+    finally:
+        with _sync_lock:
+            _syncs_in_flight -= 1
+            if not _syncs_in_flight:
+                _written_during_sync.clear()
+
+    if items:
+        logging.info(f"Espelho da agenda sincronizado ({'incremental' if sync_token else 'completo'}): {len(items)} evento(s).")
+    if pruned:
+        logging.info(f"Espelho da agenda: {pruned} evento(s) encerrado(s) há mais de {CALENDAR_MIRROR_PAST_DAYS} dia(s) removido(s).")
+    return len(items)
+
+
+def _sync_in_background():
+    try:
+        sync_calendar()
+    except Exception as e:
+        logging.warning(f"Falha ao sincronizar espelho da agenda em segundo plano, usando dados locais: {e}")
+
+
+def _start_background_sync():
+    """Dispara uma sincronização numa thread própria, se nenhuma estiver em andamento."""
+    global _background_sync
+    with _sync_lock:
+        if _syncs_in_flight or (_background_sync is not None and _background_sync.is_alive()):
+            return
+        _background_sync = threading.Thread(target=_sync_in_background, daemon=True)
+        _background_sync.start()
+
+
+def ensure_fresh(max_age: int = CALENDAR_SYNC_MAX_AGE_SEC):
+    """
+    Garante que o espelho tenha sido sincronizado há no máximo 'max_age' segundos.
+    Com dados locais, não espera a rede: se estiverem velhos, acorda uma sincronização em
+    segundo plano e a leitura segue com o espelho atual. Só a primeira carga é feita na hora.
+    """
+    _, synced_at = _get_sync_state(get_connection().cursor())
+
+    if not synced_at:
+        sync_calendar()
+    elif time.time() - synced_at > max_age:
+        _start_background_sync()
+
+
+def list_events(time_min: datetime.datetime, time_max: datetime.datetime):
+    """Eventos que se sobrepõem a [time_min, time_max), ordenados pelo início (mesma semântica do events.list)."""
+    cursor = get_connection().execute(
+        "SELECT raw FROM calendar_events WHERE calendar_id = ? AND start_utc < ? AND end_utc > ? ORDER BY start_utc",
+        (CALENDAR_ID, time_max.astimezone(pytz.utc).isoformat(), time_min.astimezone(pytz.utc).isoformat())
+    )
+    return [json.loads(row['raw']) for row in cursor.fetchall()]
+
+
+def get_event(event_id: str):
+    row = get_connection().execute("SELECT raw FROM calendar_events WHERE event_id = ?", (event_id,)).fetchone()
+    return json.loads(row['raw']) if row else None
+
+
+def _record_write(event_id: str):
+    """Chamado com _sync_lock: marca a escrita direta para as sincronizações em andamento."""
+    global _write_seq
+    if _syncs_in_flight:
+        _write_seq += 1
+        _written_during_sync[event_id] = _write_seq
+
+
+def upsert_event(event: dict):
+    """Write-through: grava no espelho um evento recém-criado ou alterado pelo bot."""
+    with _sync_lock:
+        with transaction() as conn:
+            previous = _get_raw(conn.cursor(), event['id'])
+            _upsert(conn.cursor(), event)
+        _record_write(event['id'])
+        _notify_listeners([(previous, event)])
+
+
+def remove_event(event_id: str):
+    """Write-through: remove do espelho um evento apagado pelo bot."""
+    with _sync_lock:
+        with transaction() as conn:
+            previous = _get_raw(conn.cursor(), event_id)
+            _delete(conn.cursor(), event_id)
+        _record_write(event_id)
+        if previous:
+            _notify_listeners([(previous, None)])
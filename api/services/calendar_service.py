@@ -4,83 +4,59 @@ import re
 
 import logging
 
-from google.oauth2.service_account import Credentials
-
-from googleapiclient.discovery import build
-
 import pytz
 
-from config import CREDENTIALS_PATH, SCOPES, CALENDAR_ID, DURACAO_EVENTO_MIN, ENDERECO_STUDIO, HORARIOS_FIXOS
+from config import CALENDAR_ID, DURACAO_EVENTO_MIN, ENDERECO_STUDIO, CALENDAR_BACKEND
 
 from message_manager import get_message
 
+from services import calendar_mirror, google_client, phone_index, availability_grid
 
+import metrics
 
-def parse_natural_date(date_str: str):
-
-    today = datetime.date.today()
-
-    date_str = date_str.lower().strip()
-
-    if "hoje" in date_str:
-
-        return today
+import date_parser
 
-    if "amanhã" in date_str:
 
-        return today + datetime.timedelta(days=1)
 
-    if date_str == "hoje":
+_fake_service = None
 
-        return today
-
-
-
-    weekdays = {
-
-        "segunda": 0, "terça": 1, "terca": 1, "quarta": 2,
-
-        "quinta": 3, "sexta": 4, "sábado": 5, "sabado": 5
-
-    }
 
-    for day_name, day_index in weekdays.items():
 
-        if day_name in date_str:
+def parse_natural_date(date_str: str):
 
-            days_ahead = day_index - today.weekday()
+    """
 
-            if "próxima" in date_str or "proxima" in date_str or days_ahead <= 0:
+    Converte a data dita pelo usuário ("amanhã", "próxima sexta", "dia 5", "15/11/2026",
 
-                days_ahead += 7
+    "15 de novembro"...) em datetime.date, ou None. A leitura fica em date_parser.py.
 
-            return today + datetime.timedelta(days=days_ahead)
+    """
 
-    try:
+    return date_parser.parse_date(date_str)
 
-        dia, mes = map(int, re.findall(r'\d+', date_str))
 
-        ano = today.year
 
-        if mes < today.month or (mes == today.month and dia < today.day):
+def get_calendar_service():
 
-            ano += 1
+    global _fake_service
 
-        return datetime.date(ano, mes, dia)
+    if CALENDAR_BACKEND == 'fake':
 
-    except (ValueError, IndexError):
+        if _fake_service is None:
 
-        return None
+            from fakes.calendar_fake import FakeCalendarService
 
+            _fake_service = FakeCalendarService()
 
+        return _fake_service
 
-def get_calendar_service():
+    # Cliente reaproveitado por thread; credenciais e discovery ficam em cache no processo.
 
-    creds = Credentials.from_service_account_file(CREDENTIALS_PATH, scopes=SCOPES)
+    return google_client.get_service('calendar', 'v3')
 
-    return build('calendar', 'v3', credentials=creds)
 
 
+@metrics.timed(metrics.CALENDAR_SECONDS, 'get_available_slots')
 
 def get_available_slots(date_str: str):
 
@@ -102,81 +78,15 @@ def get_available_slots(date_str: str):
 
 
 
-    service = get_calendar_service()
-
-    tz = pytz.timezone('America/Sao_Paulo')
-
-    timeMin = datetime.datetime.combine(requested_date, datetime.time.min).astimezone(tz).isoformat()
-
-    timeMax = datetime.datetime.combine(requested_date, datetime.time.max).astimezone(tz).isoformat()
-
-
-
-    events_result = service.events().list(
-
-        calendarId=CALENDAR_ID, timeMin=timeMin, timeMax=timeMax,
-
-        singleEvents=True, orderBy='startTime'
-
-    ).execute()
+    # Sincroniza o espelho se preciso (alterações invalidam os dias afetados na grade) e lê a grade.
 
+    calendar_mirror.ensure_fresh()
 
+    return availability_grid.available_slots(requested_date)
 
-    events = events_result.get('items', [])
-
-    busy_intervals = [(datetime.datetime.fromisoformat(e['start'].get('dateTime')), 
-
-                       datetime.datetime.fromisoformat(e['end'].get('dateTime'))) 
-
-                      for e in events if 'dateTime' in e['start']]
-
-
-
-    horarios_disponiveis = []
-
-    now_in_tz = datetime.datetime.now(tz)
-
-
-
-    for slot_str in HORARIOS_FIXOS:
-
-        slot_time_naive = datetime.datetime.strptime(slot_str, "%H:%M").time()
-
-        slot_datetime = tz.localize(datetime.datetime.combine(requested_date, slot_time_naive))
-
-        
-
-        is_seven_am_slot = (slot_str == "07:00")
-
-        is_after_nine_pm = (now_in_tz.hour >= 21)
-
-        is_for_tomorrow = (requested_date == now_in_tz.date() + datetime.timedelta(days=1))
-
-        
-
-        if is_seven_am_slot and is_after_nine_pm and is_for_tomorrow:
-
-            continue
-
-        
-
-        if slot_datetime < (now_in_tz + datetime.timedelta(hours=3)):
-
-            continue
-
-
-
-        slot_end_time = slot_datetime + datetime.timedelta(minutes=DURACAO_EVENTO_MIN)
-
-        if not any(max(start, slot_datetime) < min(end, slot_end_time) for start, end in busy_intervals):
-
-            horarios_disponiveis.append(slot_str)
-
-    
-
-    return horarios_disponiveis
 
 
+@metrics.timed(metrics.CALENDAR_SECONDS, 'create_event')
 
 def create_event(name: str, service: str, date_str: str, time_str: str, phone: str, obs: str = 'Nenhuma'):
 
@@ -224,150 +134,156 @@ def create_event(name: str, service: str, date_str: str, time_str: str, phone: s
 
     }
 
-    return service_calendar.events().insert(calendarId=CALENDAR_ID, body=event).execute()
+    created_event = service_calendar.events().insert(calendarId=CALENDAR_ID, body=event).execute()
 
+    calendar_mirror.upsert_event(created_event)
 
+    return created_event
 
-def find_event_to_cancel(phone_number: str):
 
-    service = get_calendar_service()
 
-    clean_input_phone = re.sub(r'\D', '', phone_number)
+@metrics.timed(metrics.CALENDAR_SECONDS, 'find_event_to_cancel')
+
+def find_event_to_cancel(phone_number: str):
 
-    if not clean_input_phone:
+    if not re.sub(r'\D', '', phone_number):
 
         return None, None, None, None
 
 
 
-    now = datetime.datetime.now(pytz.utc)
+    # Consulta indexada por telefone (E.164 ou últimos 8 dígitos), sem varrer as descrições.
 
-    timeMin = now.isoformat()
+    now = datetime.datetime.now(pytz.utc)
 
-    timeMax = (now + datetime.timedelta(days=90)).isoformat()
+    calendar_mirror.ensure_fresh()
 
+    event_id = phone_index.find_next_event_id(phone_number, now.isoformat(), (now + datetime.timedelta(days=90)).isoformat())
 
+    event = calendar_mirror.get_event(event_id) if event_id else None
 
-    events_result = service.events().list(
+    if not event:
 
-        calendarId=CALENDAR_ID, timeMin=timeMin, timeMax=timeMax,
+        return None, None, None, None
 
-        singleEvents=True, orderBy='startTime'
 
-    ).execute()
 
-    events = events_result.get('items', [])
+    summary = event.get('summary', 'Compromisso')
 
+    start_time_str = event['start'].get('dateTime')
 
+    start_dt_obj = datetime.datetime.fromisoformat(start_time_str).astimezone(pytz.timezone('America/Sao_Paulo'))
 
-    for event in events:
+    formatted_datetime = f"dia {start_dt_obj.strftime('%d/%m')} às {start_dt_obj.strftime('%H:%M')}"
 
-        description = event.get('description', '')
+    return summary, formatted_datetime, event_id, start_dt_obj
 
-        match = re.search(r'Contato:\s*(\S+)', description)
 
-        if match:
 
-            stored_phone = re.sub(r'\D', '', match.group(1))
+@metrics.timed(metrics.CALENDAR_SECONDS, 'confirm_cancel_event')
 
-            
+def confirm_cancel_event(event_id: str):
 
-            match_found = (stored_phone == clean_input_phone or
+    service = get_calendar_service()
 
-                           stored_phone.endswith(clean_input_phone) or
+    try:
 
-                           clean_input_phone.endswith(stored_phone) or
+        service.events().delete(calendarId=CALENDAR_ID, eventId=event_id).execute()
 
-                           (len(stored_phone) >= 8 and len(clean_input_phone) >= 8 and stored_phone[-8:] == clean_input_phone[-8:]))
+        calendar_mirror.remove_event(event_id)
 
+        return True
 
+    except:
 
-            if match_found:
+        return False
 
-                event_id = event['id']
 
-                summary = event.get('summary', 'Compromisso')
 
-                start_time_str = event['start'].get('dateTime')
+@metrics.timed(metrics.CALENDAR_SECONDS, 'get_events_for_next_hours')
 
-                start_dt_obj = datetime.datetime.fromisoformat(start_time_str).astimezone(pytz.timezone('America/Sao_Paulo'))
+def get_events_for_next_hours(hours: int):
 
-                formatted_datetime = f"dia {start_dt_obj.strftime('%d/%m')} às {start_dt_obj.strftime('%H:%M')}"
+    now_utc = datetime.datetime.now(pytz.utc)
 
-                return summary, formatted_datetime, event_id, start_dt_obj
+    try:
 
+        calendar_mirror.ensure_fresh()
 
+        return calendar_mirror.list_events(now_utc, now_utc + datetime.timedelta(hours=hours))
 
-    return None, None, None, None
+    except Exception as e:
 
+        logging.error(f"ERRO AO BUSCAR EVENTOS DA AGENDA: {e}")
 
+        return []
 
-def confirm_cancel_event(event_id: str):
 
-    service = get_calendar_service()
 
-    try:
+@metrics.timed(metrics.CALENDAR_SECONDS, 'update_event_description')
 
-        service.events().delete(calendarId=CALENDAR_ID, eventId=event_id).execute()
+def update_event_description(event_id: str, new_description: str):
 
-        return True
+    service = get_calendar_service()
 
-    except:
+    try:
 
-        return False
+        event_patch = {'description': new_description}
 
+        updated_event = service.events().patch(calendarId=CALENDAR_ID, eventId=event_id, body=event_patch).execute()
 
+        calendar_mirror.upsert_event(updated_event)
 
-def get_events_for_next_hours(hours: int):
+        return True
 
-    service = get_calendar_service()
+    except Exception as e:
 
-    now_utc = datetime.datetime.now(pytz.utc)
+        logging.error(f"ERRO AO ATUALIZAR DESCRIÇÃO DO EVENTO: {e}")
 
-    timeMin = now_utc.isoformat()
+        return False
 
-    timeMax = (now_utc + datetime.timedelta(hours=hours)).isoformat()
 
-    try:
 
-        events_result = service.events().list(
+@metrics.timed(metrics.CALENDAR_SECONDS, 'update_event_descriptions')
 
-            calendarId=CALENDAR_ID,
+def update_event_descriptions(descriptions: dict):
 
-            timeMin=timeMin,
+    """Atualiza várias descrições (event_id -> texto) em lotes de até 50 requisições. Retorna quantas foram gravadas."""
 
-            timeMax=timeMax,
+    service = get_calendar_service()
 
-            singleEvents=True,
+    applied = []
 
-            orderBy='startTime'
+    def on_response(request_id, response, exception):
 
-        ).execute()
+        if exception is not None:
 
-        return events_result.get('items', [])
+            logging.error(f"ERRO AO ATUALIZAR DESCRIÇÃO DO EVENTO {request_id}: {exception}")
 
-    except Exception as e:
+        else:
 
-        logging.error(f"ERRO AO BUSCAR EVENTOS DA AGENDA: {e}")
+            applied.append(response)
 
-        return []
+    items = list(descriptions.items())
 
+    for i in range(0, len(items), 50):
 
+        batch = service.new_batch_http_request(callback=on_response)
 
-def update_event_description(event_id: str, new_description: str):
+        for event_id, description in items[i:i + 50]:
 
-    service = get_calendar_service()
+            batch.add(service.events().patch(calendarId=CALENDAR_ID, eventId=event_id, body={'description': description}), request_id=event_id)
 
-    try:
+        try:
 
-        event_patch = {'description': new_description}
+            batch.execute()
 
-        service.events().patch(calendarId=CALENDAR_ID, eventId=event_id, body=event_patch).execute()
+        except Exception as e:
 
-        return True
+            logging.error(f"ERRO AO ENVIAR LOTE DE DESCRIÇÕES: {e}")
 
-    except Exception as e:
+    for event in applied:
 
-        logging.error(f"ERRO AO ATUALIZAR DESCRIÇÃO DO EVENTO: {e}")
+        calendar_mirror.upsert_event(event)
 
-        return False
+    return len(applied)
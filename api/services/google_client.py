@@ -0,0 +1,81 @@
+import os
+import json
+import threading
+import logging
+import httplib2
+import google_auth_httplib2
+from google.oauth2.service_account import Credentials
+from googleapiclient import discovery_cache
+from googleapiclient.discovery import build_from_document, DISCOVERY_URI
+from config import CREDENTIALS_PATH, SCOPES, GOOGLE_DISCOVERY_CACHE_DIR, GOOGLE_HTTP_TIMEOUT_SEC
+
+# Provedor de clientes Google compartilhado pelo processo inteiro.
+# - Credenciais (e o token de acesso) são carregadas uma única vez e renovadas sob trava.
+# - O documento de discovery vem do pacote (static discovery) ou de um cache em disco,
+#   então a inicialização não depende de rede.
+# - Cada thread recebe o seu próprio Resource, porque o httplib2 não é thread-safe
+#   (threads do waitress, agendador de lembretes e worker da fila).
+
+_credentials = None
+_credentials_lock = threading.Lock()
+_discovery_docs = {}
+_discovery_lock = threading.Lock()
+_local = threading.local()
+
+
+def get_credentials():
+    """Credenciais da service account, carregadas uma vez e com o token sempre válido."""
+    global _credentials
+    with _credentials_lock:
+        if _credentials is None:
+            _credentials = Credentials.from_service_account_file(CREDENTIALS_PATH, scopes=SCOPES)
+        if not _credentials.valid:
+            _credentials.refresh(google_auth_httplib2.Request(httplib2.Http(timeout=GOOGLE_HTTP_TIMEOUT_SEC)))
+        return _credentials
+
+
+def _discovery_cache_path(api: str, version: str) -> str:
+    return os.path.join(GOOGLE_DISCOVERY_CACHE_DIR, f"{api}.{version}.json")
+
+
+def get_discovery_document(api: str, version: str) -> str:
+    """Documento de discovery: memória -> pacote do googleapiclient -> cache em disco -> rede (e salva em disco)."""
+    key = (api, version)
+    with _discovery_lock:
+        if key in _discovery_docs:
+            return _discovery_docs[key]
+
+        document = discovery_cache.get_static_doc(api, version)
+        cache_path = _discovery_cache_path(api, version)
+        if document is None and os.path.exists(cache_path):
+            with open(cache_path, 'r', encoding='utf-8') as f:
+                document = f.read()
+        if document is None:
+            logging.warning(f"Discovery de {api} {version} não encontrado localmente. Baixando da rede.")
+            uri = DISCOVERY_URI.format(api=api, apiVersion=version)
+            response, content = httplib2.Http(timeout=GOOGLE_HTTP_TIMEOUT_SEC).request(uri)
+            if response.status >= 400:
+                raise RuntimeError(f"Falha ao baixar discovery de {api} {version}: HTTP {response.status}")
+            document = content.decode('utf-8')
+            json.loads(document)
+            os.makedirs(GOOGLE_DISCOVERY_CACHE_DIR, exist_ok=True)
+            with open(cache_path, 'w', encoding='utf-8') as f:
+                f.write(document)
+
+        _discovery_docs[key] = document
+        return document
+
+
+def get_service(api: str = 'calendar', version: str = 'v3'):
+    """Resource do googleapiclient exclusivo da thread atual, criado uma única vez por thread."""
+    resources = getattr(_local, 'resources', None)
+    if resources is None:
+        resources = _local.resources = {}
+
+    credentials = get_credentials()
+    resource = resources.get((api, version))
+    if resource is None:
+        http = google_auth_httplib2.AuthorizedHttp(credentials, http=httplib2.Http(timeout=GOOGLE_HTTP_TIMEOUT_SEC))
+        resource = build_from_document(get_discovery_document(api, version), http=http)
+        resources[(api, version)] = resource
+    return resource
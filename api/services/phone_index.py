@@ -0,0 +1,85 @@
+import re
+from connection_manager import get_connection
+
+# Índice telefone -> agendamentos, mantido junto com o espelho da agenda (services/calendar_mirror.py).
+# Cada evento com "Contato: <telefone>" na descrição gera duas chaves:
+#   '+<E.164>'        ex.: '+5537999990000'
+#   'l8:<8 dígitos>'  últimos 8 dígitos, para casar números digitados sem DDI/DDD ou sem o nono dígito.
+# Assim a busca de um cancelamento é uma consulta indexada, sem baixar nem varrer eventos.
+# Números digitados com menos de 8 dígitos não geram chave: casam pelo final do telefone
+# gravado, como a comparação por 'endswith' fazia antes do índice.
+
+CONTACT_PATTERN = re.compile(r'Contato:\s*(\S+)')
+
+
+def canonical_phone(raw: str):
+    """Dígitos no formato E.164 (sem '+'). Números nacionais com DDD ganham o DDI 55."""
+    digits = re.sub(r'\D', '', raw or '')
+    if not digits:
+        return None
+    if len(digits) >= 10 and not digits.startswith('55'):
+        digits = '55' + digits
+    return digits
+
+
+def phone_keys(raw: str):
+    digits = canonical_phone(raw)
+    if not digits:
+        return []
+    keys = [f"+{digits}"]
+    if len(digits) >= 8:
+        keys.append(f"l8:{digits[-8:]}")
+    return keys
+
+
+def phone_from_description(description: str):
+    match = CONTACT_PATTERN.search(description or '')
+    return canonical_phone(match.group(1)) if match else None
+
+
+def index_event(cursor, event: dict, start_utc: str):
+    """Reindexa um evento (chamado pelo espelho dentro da mesma transação)."""
+    unindex_event(cursor, event['id'])
+    phone = phone_from_description(event.get('description', ''))
+    if not phone:
+        return
+    cursor.executemany(
+        "INSERT OR REPLACE INTO phone_index (phone_key, event_id, start_utc, phone) VALUES (?, ?, ?, ?)",
+        [(key, event['id'], start_utc, phone) for key in phone_keys(phone)]
+    )
+
+
+def unindex_event(cursor, event_id: str):
+    cursor.execute("DELETE FROM phone_index WHERE event_id = ?", (event_id,))
+
+
+def clear_index(cursor):
+    cursor.execute("DELETE FROM phone_index")
+
+
+def find_next_event_id(phone_number: str, start_after: str, start_before: str):
+    """Próximo evento (por horário de início) do telefone informado, entre os limites ISO em UTC."""
+    keys = phone_keys(phone_number)
+    if not keys:
+        return None
+    row = get_connection().execute(
+        f"SELECT event_id FROM phone_index WHERE phone_key IN ({', '.join('?' * len(keys))}) "
+        "AND start_utc >= ? AND start_utc < ? ORDER BY start_utc LIMIT 1",
+        (*keys, start_after, start_before)
+    ).fetchone()
+    digits = canonical_phone(phone_number)
+    if row is None and len(digits) < 8:
+        # Número curto ou parcial: sem chave própria, procura pelo final dos telefones indexados
+        # (varredura só dos agendamentos futuros do espelho).
+        row = get_connection().execute(
+            "SELECT event_id FROM phone_index WHERE phone LIKE ? AND start_utc >= ? AND start_utc < ? "
+            "ORDER BY start_utc LIMIT 1",
+            (f"%{digits}", start_after, start_before)
+        ).fetchone()
+    return row[0] if row else None
+
+
+def get_phone_for_event(event_id: str):
+    """Telefone canônico (dígitos E.164) associado ao evento, ou None se não indexado."""
+    row = get_connection().execute("SELECT phone FROM phone_index WHERE event_id = ? LIMIT 1", (event_id,)).fetchone()
+    return row[0] if row else None
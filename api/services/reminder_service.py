@@ -6,27 +6,99 @@ import threading
 
 import pytz
 
-import re
-
 from datetime import datetime, timedelta
 
 import database_manager
 
-from services.calendar_service import get_calendar_service, update_event_description
+from services.calendar_service import update_event_descriptions
+
+from services import calendar_mirror, phone_index
+
+from connection_manager import get_connection, transaction
 
 from message_queue import queue_message
 
 from message_manager import get_message
 
-from config import CALENDAR_ID, ENDERECO_STUDIO
+from config import ENDERECO_STUDIO, REMINDER_MAX_SLEEP_SEC, REMINDER_ANNOTATE_CALENDAR
 
 import utils # Importa o módulo utils para acessar a função de timeout
 
 
 
-def send_reminder_if_needed(event, hours_before, reminder_tag):
+# Tipos de lembrete: antecedência, marcador (opcional) gravado na descrição do evento e atraso máximo
+
+# aceito para envio atrasado (ex.: bot fora do ar). Passado esse limite o lembrete é descartado.
+
+REMINDER_KINDS = {
+
+    '24h': {'hours': 24, 'tag': 'Lembrete_24h_OK', 'max_late': timedelta(hours=6)},
+
+    '1h': {'hours': 1, 'tag': 'Lembrete_1h_OK', 'max_late': timedelta(minutes=30)},
+
+}
+
+
+
+
+
+def _parse_utc(value):
+
+    return datetime.fromisoformat(value.replace('Z', '+00:00')).astimezone(pytz.utc)
+
+
+
+
+
+def _event_start_utc(event):
+
+    start_time_str = event.get('start', {}).get('dateTime')
+
+    return _parse_utc(start_time_str).isoformat() if start_time_str else None
+
+
+
+
+
+def _sent_reminders(conn, event):
+
+    """(tipo, início UTC) dos lembretes já enviados para o evento, segundo o registro local."""
+
+    start_utc = _event_start_utc(event)
+
+    rows = conn.execute("SELECT kind, start_utc FROM reminder_ledger WHERE event_id = ?", (event['id'],)).fetchall()
+
+    sent = {(row['kind'], row['start_utc']) for row in rows}
+
 
-    description = event.get('description', '')
+
+    # Eventos marcados pela versão antiga (só o marcador na descrição): vale para o horário atual.
+
+    if start_utc:
+
+        for kind, spec in REMINDER_KINDS.items():
+
+            if spec['tag'] in event.get('description', '') and not any(k == kind for k, _ in sent):
+
+                conn.execute(
+
+                    "INSERT OR IGNORE INTO reminder_ledger (event_id, kind, start_utc, sent_at) VALUES (?, ?, ?, ?)",
+
+                    (event['id'], kind, start_utc, 'legado')
+
+                )
+
+                sent.add((kind, start_utc))
+
+    return sent
+
+
+
+
+
+def send_reminder(event, kind, now):
+
+    hours_before = REMINDER_KINDS[kind]['hours']
 
     summary = event.get('summary', 'Seu compromisso')
 
@@ -34,9 +106,9 @@ def send_reminder_if_needed(event, hours_before, reminder_tag):
 
     
 
-    if not start_time_str or reminder_tag in description:
+    if not start_time_str:
 
-        return
+        return False
 
 
 
@@ -44,117 +116,131 @@ def send_reminder_if_needed(event, hours_before, reminder_tag):
 
     start_time = datetime.fromisoformat(start_time_str).astimezone(tz)
 
-    now = datetime.now(tz)
 
-    
 
-    time_to_event = start_time - now
+    try:
+
+        phone_number_jid = get_phone_from_event(event)
 
-    
 
-    lower_bound = timedelta(hours=hours_before) - timedelta(minutes=5)
 
-    upper_bound = timedelta(hours=hours_before) + timedelta(minutes=5)
+        if phone_number_jid:
 
+            user_id = phone_number_jid
 
+            
 
-    if lower_bound < time_to_event < upper_bound:
+            parts = summary.split(' - ')
 
-        try:
+            service_name = parts[1].strip() if len(parts) > 1 else "seu serviço"
 
-            phone_number_jid = get_phone_from_event(event)
+            
 
+            message_key = f'REMINDER_{hours_before}H'
 
+            
 
-            if phone_number_jid:
+            reminder_message = get_message(
 
-                user_id = phone_number_jid
+                message_key, 
 
-                
+                service=service_name,
 
-                parts = summary.split(' - ')
+                start_time=start_time.strftime('%H:%M'),
 
-                service_name = parts[1].strip() if len(parts) > 1 else "seu serviço"
+                address=ENDERECO_STUDIO
 
-                
+            )
 
-                message_key = f'REMINDER_{hours_before}H'
+            
 
-                
+            if not reminder_message or "não foi encontrada" in reminder_message:
 
-                reminder_message = get_message(
+                print(f"⚠️ AVISO: A chave de mensagem '{message_key}' não foi encontrada. Lembrete não enviado.")
 
-                    message_key, 
+                return False
 
-                    service=service_name,
 
-                    start_time=start_time.strftime('%H:%M'),
 
-                    address=ENDERECO_STUDIO
+            # Registra antes de enfileirar: se outro disparo chegar junto, só um deles envia.
 
-                )
+            with transaction() as conn:
 
-                
+                claimed = conn.execute(
 
-                if not reminder_message or "não foi encontrada" in reminder_message:
+                    "INSERT OR IGNORE INTO reminder_ledger (event_id, kind, start_utc, sent_at) VALUES (?, ?, ?, ?)",
 
-                    print(f"⚠️ AVISO: A chave de mensagem '{message_key}' não foi encontrada. Lembrete não enviado.")
+                    (event['id'], kind, _event_start_utc(event), now.isoformat())
 
-                    return
+                ).rowcount
 
+            if not claimed:
 
+                return False
+
+
+
+            try:
 
                 queue_message(user_id, reminder_message)
 
-                
+            except Exception:
 
-                _, data, history = database_manager.get_user_state_and_history(user_id)
+                with transaction() as conn:
 
-                database_manager.set_user_state_and_history(user_id, "AWAITING_REMINDER_CONFIRMATION", data, history)
+                    conn.execute("DELETE FROM reminder_ledger WHERE event_id = ? AND kind = ? AND start_utc = ?",
 
-                
+                                 (event['id'], kind, _event_start_utc(event)))
 
-                new_description = f"{description} | {reminder_tag}"
+                raise
 
-                update_event_description(event['id'], new_description)
+            
 
-                
+            _, data, history = database_manager.get_user_state_and_history(user_id)
 
-                client_name = parts[0].strip() if len(parts) > 0 else "Cliente"
+            database_manager.set_user_state_and_history(user_id, "AWAITING_REMINDER_CONFIRMATION", data, history)
 
-                print(f"✅ Lembrete de {hours_before}h enfileirado para {client_name} ({user_id}) e estado alterado.")
+            
 
-            else:
+            client_name = parts[0].strip() if len(parts) > 0 else "Cliente"
 
-                print(f"⚠️ Lembrete de {hours_before}h para '{summary}' não enviado: Telefone não encontrado na descrição.")
+            print(f"✅ Lembrete de {hours_before}h enfileirado para {client_name} ({user_id}) e estado alterado.")
 
+            return True
 
+        else:
 
-        except Exception as e:
+            print(f"⚠️ Lembrete de {hours_before}h para '{summary}' não enviado: Telefone não encontrado na descrição.")
 
-            print(f"!!! ERRO AO PROCESSAR LEMBRETE DE {hours_before}h para o evento '{summary}': {e}")
 
 
+    except Exception as e:
 
-def get_phone_from_event(event):
+        print(f"!!! ERRO AO PROCESSAR LEMBRETE DE {hours_before}h para o evento '{summary}': {e}")
 
-    description = event.get('description', '')
+    return False
 
-    match = re.search(r'Contato:\s*(\S+)', description)
 
-    
 
-    if not match:
 
-        print(f"AVISO: Não foi possível encontrar o telefone na descrição do evento ID: {event.get('id')}")
 
-        return None
+def get_phone_from_event(event):
+
+    # Primeiro consulta o índice de telefones mantido pelo espelho da agenda.
+
+    phone_digits = phone_index.get_phone_for_event(event.get('id'))
+
+    if not phone_digits:
+
+        description = event.get('description', '')
 
-        
+        if not phone_index.CONTACT_PATTERN.search(description):
 
-    phone_number_raw = match.group(1)
+            print(f"AVISO: Não foi possível encontrar o telefone na descrição do evento ID: {event.get('id')}")
 
-    phone_digits = re.sub(r'[^0-9]', '', phone_number_raw)
+            return None
+
+        phone_digits = phone_index.phone_from_description(description)
 
 
 
@@ -166,63 +252,327 @@ def get_phone_from_event(event):
 
 
 
-    if len(phone_digits) >= 10 and not phone_digits.startswith('55'):
+    return f"{phone_digits}@s.whatsapp.net"
 
-        phone_digits = '55' + phone_digits
 
 
 
-    return f"{phone_digits}@s.whatsapp.net"
 
+def compute_reminders(event, now, sent=()):
 
+    """
 
-def check_reminders():
+    Lembretes ainda devidos para o evento: lista de (tipo, início UTC, horário de disparo UTC).
 
-    print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] Verificando agendamentos para lembretes...")
+    'sent' são os pares (tipo, início UTC em ISO) já enviados, vindos de reminder_ledger.
 
-    service = get_calendar_service()
+    """
 
-    now = datetime.now(pytz.utc)
+    start_time_str = event.get('start', {}).get('dateTime')
 
-    timeMin = now.isoformat()
+    if not start_time_str or event.get('status') == 'cancelled':
 
-    timeMax = (now + timedelta(hours=25)).isoformat()
+        return []
 
-    
+    start_utc = _parse_utc(start_time_str)
 
-    try:
+    if start_utc <= now:
+
+        return []
+
+
+
+    created = _parse_utc(event['created']) if event.get('created') else None
+
+    reminders = []
+
+    for kind, spec in REMINDER_KINDS.items():
+
+        due_at = start_utc - timedelta(hours=spec['hours'])
+
+        if (kind, start_utc.isoformat()) in sent or now - due_at > spec['max_late']:
+
+            continue
+
+        # Agendamento criado depois do horário deste lembrete (ex.: marcado para daqui a 3h): nada a lembrar.
+
+        if created and due_at < created:
+
+            continue
+
+        reminders.append((kind, start_utc, due_at))
+
+    return reminders
+
+
+
+
+
+def annotate_calendar(sent):
+
+    """Grava os marcadores 'Lembrete_XX_OK' nas descrições, num único lote de requisições ao Google."""
+
+    descriptions = {}
+
+    for event, tag in sent:
+
+        current = descriptions.get(event['id'], event.get('description', ''))
+
+        if tag not in current:
+
+            descriptions[event['id']] = f"{current} | {tag}"
+
+    update_event_descriptions(descriptions)
+
+
+
+
+
+class ReminderEngine:
+
+    """
+
+    Motor de lembretes orientado a eventos.
+
+    O horário exato de cada lembrete fica na tabela reminder_schedule, uma fila de prioridade
+
+    persistente ordenada por due_at. A thread dorme até o próximo disparo e só recalcula a
+
+    fila quando o espelho da agenda avisa que algum evento mudou. Ao voltar de uma queda,
+
+    envia os lembretes atrasados que ainda fazem sentido (ver REMINDER_KINDS['max_late']).
+
+    'now_fn' permite rodar com relógio simulado.
+
+    """
+
+
+
+    def __init__(self, now_fn=None):
+
+        self._now = now_fn or (lambda: datetime.now(pytz.utc))
+
+        self._wakeup = threading.Condition()
+
+        self._generation = 0
+
+
+
+    def _schedule_event(self, conn, event, now):
 
-        events_result = service.events().list(
+        conn.execute("DELETE FROM reminder_schedule WHERE event_id = ?", (event['id'],))
 
-            calendarId=CALENDAR_ID, timeMin=timeMin, timeMax=timeMax,
+        conn.executemany(
 
-            singleEvents=True, orderBy='startTime'
+            "INSERT INTO reminder_schedule (event_id, kind, start_utc, due_at) VALUES (?, ?, ?, ?)",
 
-        ).execute()
+            [(event['id'], kind, start.isoformat(), due.isoformat())
 
-        events = events_result.get('items', [])
+             for kind, start, due in compute_reminders(event, now, _sent_reminders(conn, event))]
 
-        
+        )
 
-        for event in events:
 
-            send_reminder_if_needed(event, 24, "Lembrete_24h_OK")
 
-            send_reminder_if_needed(event, 1, "Lembrete_1h_OK")
+    def rebuild(self):
+
+        """Recalcula a fila inteira a partir do espelho (na inicialização e após uma carga completa)."""
+
+        now = self._now()
+
+        events = calendar_mirror.list_events(now, now + timedelta(days=365))
+
+        with transaction() as conn:
+
+            conn.execute("DELETE FROM reminder_schedule")
+
+            conn.execute("DELETE FROM reminder_ledger WHERE start_utc < ?", ((now - timedelta(days=30)).isoformat(),))
+
+            for event in events:
+
+                self._schedule_event(conn, event, now)
+
+        self.wake()
+
+
+
+    def on_calendar_change(self, changes, full_resync):
+
+        """Ouvinte do espelho: reprograma só os eventos criados, remarcados ou removidos."""
+
+        if full_resync:
+
+            self.rebuild()
+
+            return
+
+        now = self._now()
+
+        with transaction() as conn:
+
+            for previous, current in changes:
+
+                if current is None:
+
+                    conn.execute("DELETE FROM reminder_schedule WHERE event_id = ?", (previous['id'],))
+
+                else:
+
+                    self._schedule_event(conn, current, now)
+
+        self.wake()
+
+
+
+    def wake(self):
+
+        with self._wakeup:
+
+            self._generation += 1
+
+            self._wakeup.notify_all()
+
+
+
+    def next_due(self):
+
+        row = get_connection().execute("SELECT MIN(due_at) FROM reminder_schedule").fetchone()
+
+        return _parse_utc(row[0]) if row[0] else None
+
+
+
+    def run_pending(self):
+
+        """Dispara os lembretes vencidos até agora. Retorna quantos foram enviados."""
+
+        now = self._now()
+
+        due_rows = get_connection().execute(
+
+            "SELECT event_id, kind, start_utc, due_at FROM reminder_schedule WHERE due_at <= ? ORDER BY due_at",
+
+            (now.isoformat(),)
+
+        ).fetchall()
+
+
+
+        # Se mais de um lembrete do mesmo evento venceu (ex.: depois de uma queda), só o mais recente vale.
+
+        latest = {row['event_id']: row['kind'] for row in due_rows}
+
+
+
+        sent = []
+
+        for row in due_rows:
+
+            spec = REMINDER_KINDS[row['kind']]
+
+            superseded = latest[row['event_id']] != row['kind']
+
+            too_late = now - _parse_utc(row['due_at']) > spec['max_late'] or _parse_utc(row['start_utc']) <= now
+
+
+
+            if superseded or too_late:
+
+                print(f"Lembrete de {spec['hours']}h do evento {row['event_id']} descartado ({'substituído' if superseded else 'atrasado demais'}).")
+
+            else:
+
+                event = calendar_mirror.get_event(row['event_id'])
+
+                if event and send_reminder(event, row['kind'], now):
+
+                    sent.append((event, spec['tag']))
+
+
+
+            with transaction() as conn:
+
+                conn.execute("DELETE FROM reminder_schedule WHERE event_id = ? AND kind = ?", (row['event_id'], row['kind']))
+
+
+
+        if REMINDER_ANNOTATE_CALENDAR and sent:
+
+            annotate_calendar(sent)
+
+        return len(sent)
+
+
+
+    def run_forever(self):
+
+        try:
+
+            calendar_mirror.ensure_fresh()
+
+        except Exception as e:
+
+            print(f"!!! ERRO AO SINCRONIZAR ESPELHO DA AGENDA: {e}")
+
+        self.rebuild()
+
+
+
+        while True:
+
+            generation = self._generation
+
+            try:
+
+                self.run_pending()
+
+            except Exception as e:
+
+                print(f"!!! ERRO NO MOTOR DE LEMBRETES: {e}")
+
+
+
+            next_due = self.next_due()
+
+            timeout = REMINDER_MAX_SLEEP_SEC
+
+            if next_due:
+
+                timeout = max(0, min(timeout, (next_due - self._now()).total_seconds()))
+
+            with self._wakeup:
+
+                if self._generation == generation:
+
+                    self._wakeup.wait(timeout)
+
+
+
+reminder_engine = ReminderEngine()
+
+
+
+
+
+def sync_calendar_mirror():
+
+    try:
+
+        calendar_mirror.sync_calendar()
 
     except Exception as e:
 
-        print(f"!!! ERRO CRÍTICO AO BUSCAR EVENTOS DA AGENDA: {e}")
+        print(f"!!! ERRO AO SINCRONIZAR ESPELHO DA AGENDA: {e}")
 
 
 
-def run_scheduler():
 
-    # --- AJUSTE APLICADO AQUI ---
 
-    # Agora ambas as funções são agendadas para rodar.
+def run_scheduler():
+
+    # Lembretes saem do motor orientado a eventos; aqui fica só o que é periódico.
 
-    schedule.every(1).minutes.do(check_reminders)
+    schedule.every(1).minutes.do(sync_calendar_mirror)
 
     schedule.every(1).minutes.do(utils.check_state_timeouts) # <-- ADICIONADO
 
@@ -232,14 +582,24 @@ def run_scheduler():
 
         schedule.run_pending()
 
-        time.sleep(60)
+        # Tique curto: com sleep(60) as tarefas de 1 minuto rodavam a cada 60-120 s.
+
+        time.sleep(1)
+
+
 
 
 
 def start_reminder_scheduler():
 
+    calendar_mirror.add_change_listener(reminder_engine.on_calendar_change)
+
+    threading.Thread(target=reminder_engine.run_forever, daemon=True).start()
+
+
+
     scheduler_thread = threading.Thread(target=run_scheduler, daemon=True)
 
     scheduler_thread.start()
 
-    print("--> Agendador de Lembretes e Timeouts (1min) iniciado.") # <-- MENSAGEM ATUALIZADA
+    print("--> Motor de lembretes (orientado a eventos) e agendador de sincronização/timeouts (1min) iniciados.")
\ No newline at end of file
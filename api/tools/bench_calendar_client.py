@@ -0,0 +1,62 @@
+"""
+Micro-benchmark: custo por chamada de get_calendar_service() antes e depois do provedor compartilhado.
+
+Uso (a partir da pasta api/):
+    python -m tools.bench_calendar_client --calls 50
+
+Sem credentials.json, usa credenciais anônimas: mede discovery + build, sem o parse da chave.
+Nenhuma chamada de rede é feita (o discovery usado é o que vem no pacote).
+"""
+import os
+import time
+import argparse
+import statistics
+from google.auth.credentials import AnonymousCredentials
+from google.oauth2.service_account import Credentials
+from googleapiclient.discovery import build
+from config import CREDENTIALS_PATH, SCOPES
+from services import google_client
+
+
+def _legacy_get_calendar_service(use_file: bool):
+    # Implementação anterior: relê as credenciais e reconstrói o cliente a cada chamada.
+    creds = Credentials.from_service_account_file(CREDENTIALS_PATH, scopes=SCOPES) if use_file else AnonymousCredentials()
+    return build('calendar', 'v3', credentials=creds, static_discovery=True)
+
+
+def _measure(fn, calls: int):
+    samples = []
+    for _ in range(calls):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+def _report(label: str, samples):
+    print(f"{label:<28} média {statistics.mean(samples):8.3f} ms | mediana {statistics.median(samples):8.3f} ms | máx {max(samples):8.3f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--calls', type=int, default=50)
+    args = parser.parse_args()
+
+    use_file = os.path.exists(CREDENTIALS_PATH)
+    if not use_file:
+        print("credentials.json não encontrado: usando credenciais anônimas.")
+        google_client._credentials = AnonymousCredentials()
+
+    legacy = _measure(lambda: _legacy_get_calendar_service(use_file), args.calls)
+    first = _measure(lambda: google_client.get_service('calendar', 'v3'), 1)
+    pooled = _measure(lambda: google_client.get_service('calendar', 'v3'), args.calls)
+
+    print(f"{args.calls} chamadas por cenário")
+    _report("antes (build por chamada)", legacy)
+    _report("depois (1ª chamada/thread)", first)
+    _report("depois (reuso)", pooled)
+    print(f"ganho por chamada: {statistics.mean(legacy) / max(statistics.mean(pooled), 1e-6):.0f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+"""
+Corpus e vazão do leitor local de datas e horários (date_parser.py).
+
+Confere date_parser contra tools/date_parser_corpus.jsonl: cada linha traz a mensagem, o "hoje"
+usado na leitura e o esperado ('date', 'time' como devolvido por utils.normalize_time_input e,
+quando presente, 'only_date_time', que decide se o app pode pular a IA). Mostra quantas
+mensagens o parse_natural_date anterior reconhecia e mede a vazão sem e com a memorização.
+
+Uso (a partir da pasta api/):
+    python -m tools.bench_date_parser --repeat 20
+"""
+import os
+import re
+import sys
+import json
+import time
+import datetime
+import argparse
+
+import date_parser
+
+CORPUS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'date_parser_corpus.jsonl')
+
+
+def _legacy_parse_natural_date(date_str, today):
+    """calendar_service.parse_natural_date antes do date_parser, com o 'hoje' como parâmetro."""
+    date_str = date_str.lower().strip()
+    if "hoje" in date_str:
+        return today
+    if "amanhã" in date_str:
+        return today + datetime.timedelta(days=1)
+    weekdays = {"segunda": 0, "terça": 1, "terca": 1, "quarta": 2, "quinta": 3, "sexta": 4, "sábado": 5, "sabado": 5}
+    for day_name, day_index in weekdays.items():
+        if day_name in date_str:
+            days_ahead = day_index - today.weekday()
+            if "próxima" in date_str or "proxima" in date_str or days_ahead <= 0:
+                days_ahead += 7
+            return today + datetime.timedelta(days=days_ahead)
+    try:
+        dia, mes = map(int, re.findall(r'\d+', date_str))
+        ano = today.year
+        if mes < today.month or (mes == today.month and dia < today.day):
+            ano += 1
+        return datetime.date(ano, mes, dia)
+    except (ValueError, IndexError, OverflowError):
+        return None
+
+
+def _check(case, parsed):
+    problems = []
+    got_date = parsed.date.isoformat() if parsed.date else None
+    if got_date != case['date']:
+        problems.append(f"data {got_date} (esperado {case['date']})")
+    got_time = parsed.time or parsed.bare_time
+    if 'time' in case and got_time != case['time']:
+        problems.append(f"horário {got_time} (esperado {case['time']})")
+    if 'only_date_time' in case and parsed.only_date_time != case['only_date_time']:
+        problems.append(f"só data/horário {parsed.only_date_time} (esperado {case['only_date_time']}, sobra {parsed.leftover})")
+    return problems
+
+
+def _time_per_message(fn, cases, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for message, today in cases:
+            fn(message, today)
+    return (time.perf_counter() - start) / (repeat * len(cases)) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    with open(CORPUS_PATH, encoding='utf-8') as f:
+        corpus = [json.loads(line) for line in f if line.strip()]
+    for case in corpus:
+        case['today'] = datetime.date.fromisoformat(case['today'])
+
+    failures = [(case, problems) for case in corpus
+                if (problems := _check(case, date_parser.parse(case['message'], case['today'])))]
+    for case, problems in failures[:20]:
+        print(f"DIVERGE {case['message']!r} (hoje {case['today']}): {'; '.join(problems)}")
+    print(f"corpus: {len(corpus) - len(failures)}/{len(corpus)} mensagens de acordo com o esperado")
+
+    with_date = [case for case in corpus if case['date']]
+    legacy_hits = sum(1 for case in with_date
+                      if (found := _legacy_parse_natural_date(case['message'], case['today'])) and found.isoformat() == case['date'])
+    print(f"datas reconhecidas: antes {legacy_hits}/{len(with_date)}, agora "
+          f"{sum(1 for case in with_date if date_parser.parse(case['message'], case['today']).date)}/{len(with_date)}")
+    skippable = sum(1 for case in corpus if case.get('only_date_time'))
+    print(f"mensagens que são só data/horário (sem chamar a IA nos passos de data e horário): {skippable}/{len(corpus)}")
+
+    cases = [(case['message'], case['today']) for case in corpus]
+    uncached = date_parser._parse.__wrapped__
+    legacy = _time_per_message(_legacy_parse_natural_date, cases, args.repeat)
+    cold = _time_per_message(lambda message, today: uncached(message, today), cases, args.repeat)
+    date_parser._parse.cache_clear()
+    for message, today in cases:
+        date_parser.parse(message, today)
+    warm = _time_per_message(date_parser.parse, cases, args.repeat)
+    print(f"parse_natural_date anterior:   {legacy:7.2f} µs/mensagem")
+    print(f"date_parser sem memorização:   {cold:7.2f} µs/mensagem  ({1e6 / cold:,.0f} mensagens/s)")
+    print(f"date_parser memorizado:        {warm:7.2f} µs/mensagem  ({1e6 / warm:,.0f} mensagens/s, {date_parser.cache_info()})")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+"""
+Benchmark do cliente HTTP compartilhado contra a IA falsa local (fakes/cloudflare_fake.py).
+
+Compara requests.post avulso (uma conexão nova por chamada, sem novas tentativas) com
+http_client.post (pool keep-alive por host, novas tentativas com jitter para chamadas
+idempotentes): primeiro vazão e conexões TCP abertas sem falhas, depois taxa de sucesso
+com falhas simuladas (as novas tentativas custam tempo, mas salvam as chamadas).
+
+Uso (a partir da pasta api/):
+    python -m tools.bench_http_client --requests 300 --threads 4 --latency-ms 5 --failure-rate 0.1
+"""
+import time
+import logging
+import argparse
+import threading
+
+import requests
+
+import http_client
+from fakes.cloudflare_fake import FakeCloudflareAI
+
+
+def _run(label, call, url, total, threads, fake):
+    with fake._lock:
+        fake.connections.clear()
+    counts = {'ok': 0, 'failed': 0}
+    lock = threading.Lock()
+    per_thread = total // threads
+
+    def worker():
+        for _ in range(per_thread):
+            try:
+                call(url)
+                ok = True
+            except requests.exceptions.RequestException:
+                ok = False
+            with lock:
+                counts['ok' if ok else 'failed'] += 1
+
+    start = time.perf_counter()
+    pool = [threading.Thread(target=worker) for _ in range(threads)]
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    elapsed = time.perf_counter() - start
+    done = counts['ok'] + counts['failed']
+    print(f"{label:<36} {done / elapsed:8.1f} req/s | conexões TCP {len(fake.connections):4} | sucesso {counts['ok'] / done:6.1%}")
+
+
+def _plain_post(url):
+    response = requests.post(url, json={"messages": []}, timeout=10)
+    response.raise_for_status()
+
+
+def _pooled_post(url):
+    http_client.post(url, timeout=10, idempotent=True, json={"messages": []})
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=300)
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--latency-ms', type=float, default=5)
+    parser.add_argument('--failure-rate', type=float, default=0.1)
+    args = parser.parse_args()
+    logging.disable(logging.WARNING)
+
+    fake = FakeCloudflareAI(latency_ms=args.latency_ms).start()
+    url = f"{fake.url}/accounts/bench/ai/run/modelo"
+    try:
+        for failure_rate in (0.0, args.failure_rate):
+            fake.failure_rate = failure_rate
+            print(f"--- falhas simuladas: {failure_rate:.0%}")
+            _run("antes (requests.post avulso)", _plain_post, url, args.requests, args.threads, fake)
+            _run("depois (http_client, pool + retries)", _pooled_post, url, args.requests, args.threads, fake)
+        for host, stats in http_client.get_stats().items():
+            print(f"{host}: {stats}")
+    finally:
+        http_client.close_all()
+        fake.stop()
+
+
+if __name__ == '__main__':
+    main()
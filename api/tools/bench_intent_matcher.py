@@ -0,0 +1,58 @@
+"""
+Equivalência e desempenho da detecção local de intenções.
+
+Confere o matcher compilado (ai_agent.detect_local_intent) contra o corpus
+tools/intent_corpus.jsonl, gerado com a implementação anterior (cada linha traz a
+mensagem e o resultado esperado), e compara o tempo por mensagem com o caminho antigo
+(local_confirmation_check + local_intent_check, com duas normalizações e várias varreduras).
+
+Uso (a partir da pasta api/):
+    python -m tools.bench_intent_matcher --repeat 200
+"""
+import os
+import sys
+import json
+import time
+import argparse
+
+import ai_agent
+
+CORPUS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'intent_corpus.jsonl')
+
+
+def _legacy_detect(message):
+    return ai_agent.local_confirmation_check(message) or ai_agent.local_intent_check(message)
+
+
+def _time_per_message(fn, messages, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for message in messages:
+            fn(message)
+    return (time.perf_counter() - start) / (repeat * len(messages)) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=200)
+    args = parser.parse_args()
+
+    with open(CORPUS_PATH, encoding='utf-8') as f:
+        corpus = [json.loads(line) for line in f if line.strip()]
+
+    mismatches = [(case['message'], case['expected'], ai_agent.detect_local_intent(case['message']))
+                  for case in corpus if ai_agent.detect_local_intent(case['message']) != case['expected']]
+    for message, expected, got in mismatches[:20]:
+        print(f"DIVERGE {message!r}: esperado {expected}, obtido {got}")
+    print(f"equivalência: {len(corpus) - len(mismatches)}/{len(corpus)} mensagens iguais ao comportamento anterior")
+
+    messages = [case['message'] for case in corpus]
+    before = _time_per_message(_legacy_detect, messages, args.repeat)
+    after = _time_per_message(ai_agent.detect_local_intent, messages, args.repeat)
+    print(f"antes  (duas normalizações + varreduras): {before:6.2f} µs/mensagem")
+    print(f"depois (matcher compilado):               {after:6.2f} µs/mensagem  ({before / after:.1f}x)")
+    sys.exit(1 if mismatches else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+"""
+Benchmark de concorrência do SQLite: leituras e escritas por segundo sob carga mista.
+
+Compara o acesso antigo (uma conexão nova por operação, journal padrão) com o
+connection_manager (conexão por thread, WAL, synchronous=NORMAL, busy timeout).
+
+Uso (a partir da pasta api/):
+    python -m tools.bench_sqlite --threads 8 --seconds 5 --write-ratio 0.3
+"""
+import os
+import json
+import time
+import random
+import sqlite3
+import argparse
+import tempfile
+import threading
+
+import config
+import connection_manager
+import database_manager
+
+
+def _legacy_read(db_path, user_id):
+    conn = sqlite3.connect(db_path, check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+    conn.execute("SELECT state, data, history FROM conversations WHERE user_id = ?", (user_id,)).fetchone()
+    conn.close()
+
+
+def _legacy_write(db_path, user_id):
+    conn = sqlite3.connect(db_path, check_same_thread=False)
+    conn.execute("INSERT OR REPLACE INTO conversations (user_id, state, data, history) VALUES (?, ?, ?, ?)",
+                 (user_id, 'AWAITING_DATE', json.dumps({'k': user_id}), '[]'))
+    conn.commit()
+    conn.close()
+
+
+def _managed_read(db_path, user_id):
+    database_manager.get_user_state_and_history(user_id)
+
+
+def _managed_write(db_path, user_id):
+    database_manager.set_user_state_and_history(user_id, 'AWAITING_DATE', {'k': user_id}, [])
+
+
+def _prepare(journal_mode):
+    db_path = os.path.join(tempfile.mkdtemp(prefix='glassy-bench-'), 'bench.db')
+    for module in (config, connection_manager, database_manager):
+        module.DB_PATH = db_path
+    database_manager.setup_database()
+    connection_manager.close_connection(db_path)
+    conn = sqlite3.connect(db_path)
+    conn.execute(f"PRAGMA journal_mode={journal_mode}")
+    conn.close()
+    return db_path
+
+
+def _run(label, read_fn, write_fn, db_path, threads, seconds, write_ratio, users):
+    counts = {'read': 0, 'write': 0, 'errors': 0}
+    lock = threading.Lock()
+    deadline = time.perf_counter() + seconds
+
+    def worker():
+        local = {'read': 0, 'write': 0, 'errors': 0}
+        while time.perf_counter() < deadline:
+            user_id = f"user-{random.randrange(users)}"
+            is_write = random.random() < write_ratio
+            try:
+                (write_fn if is_write else read_fn)(db_path, user_id)
+                local['write' if is_write else 'read'] += 1
+            except sqlite3.OperationalError:
+                local['errors'] += 1
+        with lock:
+            for key, value in local.items():
+                counts[key] += value
+
+    pool = [threading.Thread(target=worker) for _ in range(threads)]
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    print(f"{label:<34} leituras {counts['read'] / seconds:9.0f}/s | escritas {counts['write'] / seconds:8.0f}/s | erros de trava {counts['errors']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--write-ratio', type=float, default=0.3)
+    parser.add_argument('--users', type=int, default=200)
+    args = parser.parse_args()
+
+    common = (args.threads, args.seconds, args.write_ratio, args.users)
+    _run("antes (conexão por operação)", _legacy_read, _legacy_write, _prepare('DELETE'), *common)
+    _run("depois (connection_manager + WAL)", _managed_read, _managed_write, _prepare('WAL'), *common)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,238 @@
+"""
+Teste de carga do /webhook: N usuários virtuais percorrem a máquina de estados real por HTTP,
+da saudação (WELCOME) até AWAITING_POLICY_CONFIRM, contra o app servido pelo waitress.
+
+A IA, a agenda e o gateway do WhatsApp são falsos e locais; o gateway registra cada entrega.
+A latência medida vai do POST no /webhook até a resposta chegar ao gateway. Depois de cada
+resposta o usuário confere o estado em /check-state. Ao final mostra a vazão, os percentis
+de latência (geral e por estado), as respostas do webhook por ação, as mensagens perdidas
+(sem resposta no prazo ou 'ignored_due_to_lock') e os erros de banco travado.
+
+Uso (a partir da pasta api/):
+    python -m tools.load_webhook --users 200 --llm-latency-ms 300 --mode async
+    python -m tools.load_webhook --users 200 --mode sync --threads 4 --ramp-sec 5
+"""
+import os
+import sys
+import time
+import json
+import random
+import logging
+import argparse
+import tempfile
+import threading
+from collections import Counter, defaultdict
+from datetime import date, timedelta
+
+import requests
+
+from fakes.cloudflare_fake import FakeCloudflareAI
+from fakes.gateway_fake import FakeGateway
+
+SERVICES = ['alongamento', 'manutenção', 'banho de gel', 'esmaltação em gel']
+FIRST_NAMES = ['Ana', 'Beatriz', 'Carla', 'Daniela', 'Eduarda', 'Fernanda', 'Gabriela', 'Helena']
+LAST_NAMES = ['Souza', 'Lima', 'Mendes', 'Rocha', 'Castro', 'Alves', 'Pereira', 'Costa']
+
+
+class _LockErrorCounter(logging.Handler):
+    """Conta os registros de log com 'database is locked' (e repassa ao console com --verbose)."""
+
+    def __init__(self, verbose):
+        super().__init__(logging.DEBUG if verbose else logging.WARNING)
+        self.verbose = verbose
+        self.lock_errors = 0
+
+    def emit(self, record):
+        message = record.getMessage()
+        if 'database is locked' in message or 'database is locked' in str(record.exc_info and record.exc_info[1]):
+            self.lock_errors += 1
+        if self.verbose:
+            print(f"{record.levelname} - {message}", file=sys.stderr)
+
+
+class _Deliveries:
+    def __init__(self):
+        self.by_user = defaultdict(list)
+        self._cond = threading.Condition()
+
+    def __call__(self, delivery):
+        with self._cond:
+            self.by_user[delivery['to']].append(time.perf_counter())
+            self._cond.notify_all()
+
+    def wait(self, user_id, count, timeout):
+        """Instante da entrega de número 'count' para o usuário, ou None se não chegar no prazo."""
+        with self._cond:
+            if self._cond.wait_for(lambda: len(self.by_user[user_id]) >= count, timeout):
+                return self.by_user[user_id][count - 1]
+        return None
+
+
+def _script(user_index, day):
+    """Passos do usuário virtual: (mensagem, resposta da IA ou None, estado esperado depois)."""
+    service = SERVICES[user_index % len(SERVICES)]
+    name = f"{FIRST_NAMES[user_index % len(FIRST_NAMES)]} {LAST_NAMES[(user_index // len(FIRST_NAMES)) % len(LAST_NAMES)]} {user_index}"
+    date_str = day.strftime('%d/%m')
+    return [
+        ('oi', None, 'INITIAL'),
+        (f"quero marcar {service} dia {date_str}", {"intent": "schedule", "service": service, "date_str": date_str}, 'AWAITING_TIME'),
+        ('10:00', None, 'AWAITING_SERVICE'),
+        (service, {"intent": "schedule", "service": service}, 'AWAITING_NAME'),
+        (name, {"intent": "unknown"}, 'AWAITING_OBS'),
+        ('não', None, 'AWAITING_POLICY_CONFIRM'),
+    ]
+
+
+def _percentiles(values):
+    if not values:
+        return None
+    ordered = sorted(values)
+    pick = lambda q: ordered[min(len(ordered) - 1, int(len(ordered) * q))]
+    return {'n': len(ordered), 'p50': pick(0.50), 'p95': pick(0.95), 'p99': pick(0.99), 'max': ordered[-1]}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=100)
+    parser.add_argument('--mode', choices=['async', 'sync'], default=os.getenv('INGEST_MODE', 'async'), help="INGEST_MODE do app")
+    parser.add_argument('--threads', type=int, default=4, help="threads do waitress (o padrão do serve() é 4)")
+    parser.add_argument('--ramp-sec', type=float, default=2.0, help="tempo para todos os usuários começarem")
+    parser.add_argument('--think-ms', type=float, default=200, help="pausa do usuário entre receber a resposta e mandar a próxima")
+    parser.add_argument('--reply-timeout', type=float, default=30, help="prazo (s) para a resposta chegar ao gateway")
+    parser.add_argument('--llm-latency-ms', type=float, default=0)
+    parser.add_argument('--calendar-latency-ms', type=float, default=0)
+    parser.add_argument('--gateway-latency-ms', type=float, default=0)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--verbose', action='store_true', help="mostra os logs do bot")
+    args = parser.parse_args()
+
+    cloudflare = FakeCloudflareAI(latency_ms=args.llm_latency_ms).start()
+    gateway = FakeGateway(latency_ms=args.gateway_latency_ms).start()
+    deliveries = _Deliveries()
+    gateway.add_listener(deliveries)
+    workdir = tempfile.mkdtemp(prefix='glassy-load-')
+    os.environ.update({
+        'DB_PATH': os.path.join(workdir, 'load.db'),
+        'CALENDAR_BACKEND': 'fake',
+        'CLOUDFLARE_API_BASE': cloudflare.url,
+        'GATEWAY_URL': gateway.url,
+        'INGEST_MODE': args.mode,
+        'INTENT_CLASSIFIER_PATH': os.path.join(workdir, 'sem-modelo.json'),
+    })
+    os.environ.setdefault('TRACE_FILE', os.path.join(workdir, 'traces.jsonl'))
+    # Antes de importar o app: o log vai para o contador, não para o bot.log.
+    counter = _LockErrorCounter(args.verbose)
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.WARNING, handlers=[counter])
+
+    from waitress import create_server
+    import app
+    import database_manager
+    import inbound_queue
+    from message_manager import load_messages
+    from message_queue import start_queue_worker, stop_queue_worker
+    from services.calendar_service import get_calendar_service
+
+    load_messages()
+    database_manager.setup_database()
+    get_calendar_service().latency_ms = args.calendar_latency_ms
+
+    day = date.today() + timedelta(days=3)
+    if day.weekday() == 6:
+        day += timedelta(days=1)
+    scripts = [_script(i, day) for i in range(args.users)]
+    replies = {message.lower(): reply for script in scripts for message, reply, _ in script if reply}
+    cloudflare.responder = lambda messages: json.dumps(replies.get(messages[-1]['content'].strip().lower(), {"intent": "unknown"}))
+
+    stdout = sys.stdout
+    if not args.verbose:
+        sys.stdout = open(os.devnull, 'w')
+    start_queue_worker()
+    if args.mode == 'async':
+        inbound_queue.start_inbox_workers(app.handle_inbound_message, app.can_merge_message)
+    server = create_server(app.app, host='127.0.0.1', port=0, threads=args.threads)
+    threading.Thread(target=server.run, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.effective_port}"
+
+    latencies = []
+    by_state = defaultdict(list)
+    actions = Counter()
+    problems = Counter()
+    results_lock = threading.Lock()
+    rng = random.Random(args.seed)
+    start_delays = sorted(rng.uniform(0, args.ramp_sec) for _ in range(args.users))
+
+    def virtual_user(index):
+        user_id = f"5537998{index:06d}@s.whatsapp.net"
+        session = requests.Session()
+        time.sleep(start_delays[index])
+        state = 'INITIAL'
+        for step, (message, _, expected_state) in enumerate(scripts[index], start=1):
+            sent_at = time.perf_counter()
+            try:
+                response = session.post(f"{base_url}/webhook", json={'userId': user_id, 'message': message}, timeout=args.reply_timeout)
+                action = response.json().get('action', f"http_{response.status_code}") if response.ok else f"http_{response.status_code}"
+            except requests.exceptions.RequestException as e:
+                action = e.__class__.__name__
+            with results_lock:
+                actions[action] += 1
+            if action not in ('accepted', 'queued', 'buffered'):   # 'ignored_due_to_lock', erro HTTP ou de conexão
+                with results_lock:
+                    problems['dropped'] += 1
+                return
+            delivered_at = deliveries.wait(user_id, step, args.reply_timeout)
+            if delivered_at is None:
+                with results_lock:
+                    problems['dropped'] += 1
+                return
+            with results_lock:
+                latencies.append((delivered_at - sent_at) * 1000)
+                by_state[state].append((delivered_at - sent_at) * 1000)
+            state = session.post(f"{base_url}/check-state", json={'userId': user_id}, timeout=args.reply_timeout).json().get('state')
+            if state != expected_state:
+                with results_lock:
+                    problems['wrong_state'] += 1
+                return
+            time.sleep(args.think_ms / 1000)
+        with results_lock:
+            problems['completed'] += 1
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=virtual_user, args=(i,), daemon=True) for i in range(args.users)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    stats = inbound_queue.get_ingest_stats()
+    server.close()
+    if args.mode == 'async':
+        inbound_queue.stop_inbox_workers()
+    stop_queue_worker()
+    cloudflare.stop()
+    gateway.stop()
+    if sys.stdout is not stdout:
+        sys.stdout.close()
+    sys.stdout = stdout
+
+    mode = f"async, rajadas juntadas após {inbound_queue.COALESCE_DEBOUNCE_MS} ms de silêncio" if args.mode == 'async' else args.mode
+    print(f"{args.users} usuários | modo {mode} | {args.threads} threads no waitress | "
+          f"IA {args.llm_latency_ms:.0f} ms, agenda {args.calendar_latency_ms:.0f} ms, gateway {args.gateway_latency_ms:.0f} ms")
+    print(f"duração {elapsed:.1f}s | {len(latencies)} respostas entregues ({len(latencies) / elapsed:.1f}/s) | "
+          f"{sum(actions.values()) / elapsed:.1f} req/s no /webhook")
+    print(f"conversas até AWAITING_POLICY_CONFIRM: {problems['completed']}/{args.users} | "
+          f"perdidas: {problems['dropped']} | estado inesperado: {problems['wrong_state']} | "
+          f"erros de banco travado: {counter.lock_errors}")
+    print(f"respostas do /webhook: {dict(actions)} | juntadas na fila de entrada: {stats['coalesced']}")
+    print(f"traces: python -m tools.trace_waterfall --file {os.environ['TRACE_FILE']} --last 3")
+    overall = _percentiles(latencies)
+    if overall:
+        print(f"\n{'mensagem -> entrega (ms)':<28} {'n':>6} {'p50':>9} {'p95':>9} {'p99':>9} {'máx':>9}")
+        for label, values in [('geral', latencies)] + sorted(by_state.items()):
+            p = _percentiles(values)
+            print(f"{label:<28} {p['n']:>6} {p['p50']:>9.1f} {p['p95']:>9.1f} {p['p99']:>9.1f} {p['max']:>9.1f}")
+    sys.exit(1 if problems['dropped'] or problems['wrong_state'] or counter.lock_errors else 0)
+
+
+if __name__ == '__main__':
+    main()
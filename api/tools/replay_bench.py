@@ -0,0 +1,365 @@
+"""
+Benchmark ponta a ponta: reproduz conversas roteirizadas (ou capturadas do banco) em app.process_message
+com agenda, IA e gateway falsos, e mede p50/p95/p99 por etapa e por estado da conversa.
+
+Etapas medidas: turno inteiro (process_message + resposta na fila), leitura/gravação de estado, extração de intenção,
+chamada à IA, agenda, enfileiramento da resposta, entrega ao gateway, disparo de lembrete e
+varredura de timeouts. Cada rodada usa números de telefone e datas próprios, então as conversas
+seguem sempre o mesmo caminho. O resultado pode ser gravado em JSON e comparado com outro commit.
+
+Uso (a partir da pasta api/):
+    python -m tools.replay_bench --rounds 20 --llm-latency-ms 300 --calendar-latency-ms 80 --out antes.json
+    python -m tools.replay_bench --rounds 20 --llm-latency-ms 300 --calendar-latency-ms 80 --compare antes.json
+    python -m tools.replay_bench --compare antes.json depois.json
+    python -m tools.replay_bench --from-db ../database/conversations.db   (conversas capturadas)
+
+Roteiro (JSON): lista de conversas {"name", "book"?, "steps"}. Cada passo é {"say": texto, "llm"?: resposta
+da IA}, {"reminder": "24h"|"1h"} ou {"timeout": true}. Placeholders: {date}, {slot}, {phone}, {name}.
+"""
+import os
+import sys
+import json
+import time
+import logging
+import sqlite3
+import argparse
+import tempfile
+import threading
+import subprocess
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from fakes.cloudflare_fake import FakeCloudflareAI
+from fakes.gateway_fake import FakeGateway
+
+DEFAULT_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'replay_conversations.json')
+STAGES = ['turn', 'state_load', 'state_save', 'intent', 'llm', 'calendar', 'enqueue', 'delivery', 'reminder', 'timeout']
+NAMES = ['Ana Paula Souza', 'Beatriz Lima', 'Carla Mendes', 'Daniela Rocha', 'Eduarda Castro', 'Fernanda Alves']
+
+
+class _Recorder:
+    """Tempos por etapa. Dentro de um turno, chamadas repetidas da mesma etapa são somadas (uma amostra por turno)."""
+
+    def __init__(self):
+        self.samples = defaultdict(list)
+        self.by_state = defaultdict(list)
+        self._turn = None
+        self._lock = threading.Lock()
+
+    def begin_turn(self):
+        self._turn = defaultdict(float)
+
+    def end_turn(self, state, elapsed):
+        turn, self._turn = self._turn, None
+        for stage, total in turn.items():
+            self.add(stage, total)
+        self.add('turn', elapsed)
+        self.by_state[state].append(elapsed * 1000)
+
+    def record(self, stage, elapsed):
+        if self._turn is not None and threading.current_thread() is threading.main_thread():
+            self._turn[stage] += elapsed
+        else:
+            self.add(stage, elapsed)
+
+    def add(self, stage, elapsed):
+        with self._lock:
+            self.samples[stage].append(elapsed * 1000)
+
+
+def _instrument(recorder, module, name, stage):
+    """Troca a função por uma versão cronometrada em todos os módulos que a importaram."""
+    original = getattr(module, name)
+
+    def timed(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return original(*args, **kwargs)
+        finally:
+            recorder.record(stage, time.perf_counter() - start)
+
+    for loaded in list(sys.modules.values()):
+        if getattr(loaded, name, None) is original:
+            setattr(loaded, name, timed)
+
+
+def _percentiles(values):
+    ordered = sorted(values)
+    pick = lambda q: round(ordered[min(len(ordered) - 1, int(len(ordered) * q))], 3)
+    return {'n': len(ordered), 'p50': pick(0.50), 'p95': pick(0.95), 'p99': pick(0.99),
+            'mean': round(sum(ordered) / len(ordered), 3)}
+
+
+def _fill(value, placeholders):
+    if isinstance(value, str):
+        for key, replacement in placeholders.items():
+            value = value.replace(f"{{{key}}}", replacement)
+        return value
+    if isinstance(value, dict):
+        return {key: _fill(item, placeholders) for key, item in value.items()}
+    return value
+
+
+def _load_captured(db_path):
+    """Conversas capturadas: mensagens dos usuários em conversation_turns; respostas da IA vindas de intent_labels."""
+    conn = sqlite3.connect(db_path)
+    conn.row_factory = sqlite3.Row
+    labels = {row['message'].strip().lower(): json.loads(row['result'])
+              for row in conn.execute("SELECT message, result FROM intent_labels ORDER BY id")}
+    conversations = defaultdict(list)
+    for row in conn.execute("SELECT user_id, content FROM conversation_turns WHERE role = 'user' ORDER BY id"):
+        step = {'say': row['content']}
+        if row['content'].strip().lower() in labels:
+            step['llm'] = labels[row['content'].strip().lower()]
+        conversations[row['user_id']].append(step)
+    return [{'name': f"capturada {i + 1}", 'steps': steps} for i, steps in enumerate(conversations.values())]
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+
+def _run(args, conversations):
+    cloudflare = FakeCloudflareAI(latency_ms=args.llm_latency_ms).start()
+    gateway = FakeGateway(latency_ms=args.gateway_latency_ms).start()
+    workdir = tempfile.mkdtemp(prefix='glassy-replay-')
+    os.environ.update({
+        'DB_PATH': os.path.join(workdir, 'replay.db'),
+        'CALENDAR_BACKEND': 'fake',
+        'CLOUDFLARE_API_BASE': cloudflare.url,
+        'GATEWAY_URL': gateway.url,
+        'INTENT_CACHE_PERSIST': 'false',
+        'INTENT_CLASSIFIER_PATH': os.path.join(workdir, 'sem-modelo.json'),
+    })
+    # Silencia o log do bot (o app configura bot.log só se ninguém tiver configurado antes).
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.CRITICAL, format='%(levelname)s - %(message)s')
+
+    import pytz
+    import app
+    import ai_agent
+    import intent_cache
+    import database_manager
+    import message_queue
+    import utils
+    from config import HORARIOS_FIXOS
+    from connection_manager import transaction, get_connection
+    from message_manager import load_messages
+    from services import calendar_service, calendar_mirror, reminder_service
+
+    load_messages()
+    database_manager.setup_database()
+    calendar_service.get_calendar_service().latency_ms = args.calendar_latency_ms
+
+    replies = {}
+    cloudflare.responder = lambda messages: json.dumps(replies.get(messages[-1]['content'].strip().lower(), {"intent": "unknown"}))
+
+    recorder = _Recorder()
+    for module, name, stage in [
+        (database_manager, 'get_user_state_and_history', 'state_load'),
+        (database_manager, 'set_user_state_and_history', 'state_save'),
+        (database_manager, 'append_turn', 'state_save'),
+        (ai_agent, 'extract_intent', 'intent'),
+        (ai_agent, '_query_cloudflare_ai', 'llm'),
+        (calendar_service, 'get_available_slots', 'calendar'),
+        (calendar_service, 'create_event', 'calendar'),
+        (calendar_service, 'find_event_to_cancel', 'calendar'),
+        (calendar_service, 'confirm_cancel_event', 'calendar'),
+    ]:
+        _instrument(recorder, module, name, stage)
+
+    # Entrega: do enfileiramento até o gateway receber a mensagem.
+    enqueued = defaultdict(list)
+    pending = {'count': 0}
+    original_queue_message = message_queue.queue_message
+
+    def queue_message(user_id, text, *rest, **kwargs):
+        start = time.perf_counter()
+        enqueued[(user_id, text)].append(start)
+        pending['count'] += 1
+        try:
+            return original_queue_message(user_id, text, *rest, **kwargs)
+        finally:
+            recorder.record('enqueue', time.perf_counter() - start)
+
+    for loaded in list(sys.modules.values()):
+        if getattr(loaded, 'queue_message', None) is original_queue_message:
+            loaded.queue_message = queue_message
+
+    def on_delivery(delivery):
+        times = enqueued.get((delivery['to'], delivery['payload'].get('text')))
+        if times:
+            recorder.add('delivery', time.perf_counter() - times.pop(0))
+            pending['count'] -= 1
+
+    gateway.add_listener(on_delivery)
+
+    tz = pytz.timezone('America/Sao_Paulo')
+    fake_calendar = calendar_service.get_calendar_service()
+    first_day = datetime.now(tz).date() + timedelta(days=3)
+    days = [first_day + timedelta(days=offset) for offset in range(400) if (first_day + timedelta(days=offset)).weekday() != 6]
+
+    def current_state(user_id):
+        row = get_connection().execute("SELECT state FROM conversations WHERE user_id = ?", (user_id,)).fetchone()
+        return row['state'] if row else 'INITIAL'
+
+    stdout = sys.stdout
+    if not args.verbose:
+        sys.stdout = open(os.devnull, 'w')
+    turns = 0
+    message_queue.start_queue_worker(args.workers)
+    started = time.perf_counter()
+    try:
+        for round_index in range(args.rounds):
+            if not args.warm_cache:
+                intent_cache.clear()
+            for index, conversation in enumerate(conversations):
+                phone = f"5537990{round_index:03d}{index:03d}"
+                user_id = f"{phone}@s.whatsapp.net"
+                day = days[(round_index * len(conversations) + index) % len(days)]
+                placeholders = {'date': day.strftime('%d/%m'), 'slot': HORARIOS_FIXOS[1], 'phone': phone,
+                                'name': NAMES[(round_index + index) % len(NAMES)]}
+
+                book = conversation.get('book')
+                if book:
+                    if 'hours_from_now' in book:
+                        start = (datetime.now(tz) + timedelta(hours=book['hours_from_now'])).replace(second=0, microsecond=0)
+                    else:
+                        hour, minute = map(int, _fill(book['time'], placeholders).split(':'))
+                        start = tz.localize(datetime.combine(day, datetime.min.time()).replace(hour=hour, minute=minute))
+                    event = fake_calendar.add_event(f"{placeholders['name']} - Alongamento", start,
+                                                    description=f"Contato: {phone} | Observações: Nenhuma")
+                    calendar_mirror.upsert_event(event)
+
+                for step in conversation['steps']:
+                    if 'say' in step:
+                        text = _fill(step['say'], placeholders)
+                        if 'llm' in step:
+                            replies[text.strip().lower()] = _fill(step['llm'], placeholders)
+                        state = current_state(user_id)
+                        recorder.begin_turn()
+                        start = time.perf_counter()
+                        app.handle_inbound_message(user_id, text)
+                        recorder.end_turn(state, time.perf_counter() - start)
+                        turns += 1
+                    elif 'reminder' in step:
+                        event_id = calendar_service.find_event_to_cancel(phone)[2]
+                        event = calendar_mirror.get_event(event_id) if event_id else None
+                        if event:
+                            start = time.perf_counter()
+                            reminder_service.send_reminder(event, step['reminder'], datetime.now(pytz.utc))
+                            recorder.add('reminder', time.perf_counter() - start)
+                    elif step.get('timeout'):
+                        stale = (datetime.now() - timedelta(minutes=11)).isoformat()
+                        with transaction() as conn:
+                            conn.execute("UPDATE conversations SET state_timestamp = ? WHERE user_id = ? AND state_timestamp IS NOT NULL",
+                                         (stale, user_id))
+                        start = time.perf_counter()
+                        utils.check_state_timeouts()
+                        recorder.add('timeout', time.perf_counter() - start)
+        elapsed = time.perf_counter() - started
+
+        deadline = time.monotonic() + 30
+        while pending['count'] > 0 and time.monotonic() < deadline:
+            time.sleep(0.02)
+        message_queue.stop_queue_worker()
+    finally:
+        if sys.stdout is not stdout:
+            sys.stdout.close()
+        sys.stdout = stdout
+        cloudflare.stop()
+        gateway.stop()
+
+    return {
+        'meta': {
+            'commit': _git_commit(),
+            'created_at': datetime.now().isoformat(timespec='seconds'),
+            'conversations': len(conversations),
+            'rounds': args.rounds,
+            'turns': turns,
+            'turns_per_sec': round(turns / elapsed, 1) if elapsed else None,
+            'undelivered': pending['count'],
+            'llm_latency_ms': args.llm_latency_ms,
+            'calendar_latency_ms': args.calendar_latency_ms,
+            'gateway_latency_ms': args.gateway_latency_ms,
+            'warm_cache': args.warm_cache,
+        },
+        'stages': {stage: _percentiles(recorder.samples[stage]) for stage in STAGES if recorder.samples[stage]},
+        'states': {state: _percentiles(values) for state, values in sorted(recorder.by_state.items())},
+    }
+
+
+def _print_report(result):
+    meta = result['meta']
+    print(f"commit {meta['commit'] or '?'} | {meta['conversations']} conversas x {meta['rounds']} rodadas = {meta['turns']} turnos "
+          f"({meta['turns_per_sec']} turnos/s) | latência IA {meta['llm_latency_ms']} ms, agenda {meta['calendar_latency_ms']} ms, "
+          f"gateway {meta['gateway_latency_ms']} ms")
+    if meta['undelivered']:
+        print(f"ATENÇÃO: {meta['undelivered']} mensagens não chegaram ao gateway.")
+    for title, table in (('etapa', result['stages']), ('estado', result['states'])):
+        print(f"\n{title:<34} {'n':>6} {'p50 ms':>10} {'p95 ms':>10} {'p99 ms':>10}")
+        for name, stats in table.items():
+            print(f"{name:<34} {stats['n']:>6} {stats['p50']:>10.2f} {stats['p95']:>10.2f} {stats['p99']:>10.2f}")
+
+
+def _print_comparison(base, current):
+    print(f"comparação: {base['meta']['commit'] or 'base'} -> {current['meta']['commit'] or 'atual'} (Δ% do p50 / p95 / p99)")
+    for title, key in (('etapa', 'stages'), ('estado', 'states')):
+        print(f"\n{title:<34} {'p50 ms':>18} {'p95 ms':>18} {'p99 ms':>18}")
+        for name in list(dict.fromkeys(list(base[key]) + list(current[key]))):
+            old, new = base[key].get(name), current[key].get(name)
+            if not old or not new:
+                print(f"{name:<34} {'só em ' + ('base' if old else 'atual'):>18}")
+                continue
+            cells = []
+            for q in ('p50', 'p95', 'p99'):
+                delta = (new[q] - old[q]) / old[q] * 100 if old[q] else 0
+                cells.append(f"{new[q]:>8.2f} ({delta:+5.0f}%)")
+            print(f"{name:<34} " + ' '.join(f"{cell:>18}" for cell in cells))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--script', default=DEFAULT_SCRIPT, help="arquivo JSON com as conversas")
+    parser.add_argument('--from-db', help="reproduz as conversas gravadas neste banco em vez do roteiro")
+    parser.add_argument('--rounds', type=int, default=10)
+    parser.add_argument('--llm-latency-ms', type=float, default=0)
+    parser.add_argument('--calendar-latency-ms', type=float, default=0)
+    parser.add_argument('--gateway-latency-ms', type=float, default=0)
+    parser.add_argument('--workers', type=int, default=2, help="workers da fila de envio")
+    parser.add_argument('--warm-cache', action='store_true', help="não limpa o cache de intenções entre rodadas")
+    parser.add_argument('--out', help="grava o resultado em JSON")
+    parser.add_argument('--compare', nargs='+', metavar='JSON', help="compara com um resultado anterior (ou dois arquivos, sem rodar)")
+    parser.add_argument('--verbose', action='store_true', help="mostra os logs e prints do bot")
+    args = parser.parse_args()
+
+    if args.compare and len(args.compare) == 2:
+        with open(args.compare[0], encoding='utf-8') as f_base, open(args.compare[1], encoding='utf-8') as f_current:
+            _print_comparison(json.load(f_base), json.load(f_current))
+        return
+
+    if args.from_db:
+        conversations = _load_captured(args.from_db)
+    else:
+        with open(args.script, encoding='utf-8') as f:
+            conversations = json.load(f)
+    if not conversations:
+        print("Nenhuma conversa para reproduzir.")
+        sys.exit(1)
+
+    result = _run(args, conversations)
+    _print_report(result)
+    if args.out:
+        with open(args.out, 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+        print(f"\nResultado gravado em {args.out}")
+    if args.compare:
+        with open(args.compare[0], encoding='utf-8') as f:
+            print()
+            _print_comparison(json.load(f), result)
+
+
+if __name__ == '__main__':
+    main()
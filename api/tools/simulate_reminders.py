@@ -0,0 +1,124 @@
+"""
+Simulação do motor de lembretes com relógio simulado, agenda falsa e banco temporário.
+
+Percorre ~90 horas em passos de 1 minuto, incluindo remarcações de horário e duas quedas
+do bot, e confere que cada lembrete saiu exatamente uma vez (ou foi descartado quando
+deveria), inclusive a recuperação dos lembretes que venceram durante a queda.
+Com --annotate, os marcadores na agenda são gravados em lote e as chamadas à API são contadas.
+
+Uso (a partir da pasta api/):
+    python -m tools.simulate_reminders [--annotate]
+"""
+import os
+import sys
+import tempfile
+import argparse
+from datetime import datetime, timedelta
+
+os.environ['CALENDAR_BACKEND'] = 'fake'
+os.environ['DB_PATH'] = os.path.join(tempfile.mkdtemp(prefix='glassy-sim-'), 'sim.db')
+
+import pytz
+
+import database_manager
+from message_manager import load_messages
+from connection_manager import get_connection
+from services import calendar_mirror, reminder_service
+from services.calendar_service import get_calendar_service
+from services.reminder_service import ReminderEngine
+
+TZ = pytz.timezone('America/Sao_Paulo')
+
+# (nome, início relativo a T0, criado relativo a T0) -> lembretes esperados (tipo, horário de envio relativo a T0)
+SCENARIO = [
+    ('comum', timedelta(hours=30), timedelta(days=-1), [('24h', timedelta(hours=6)), ('1h', timedelta(hours=29))]),
+    ('marcado em cima da hora', timedelta(hours=3), timedelta(0), [('1h', timedelta(hours=2))]),
+    ('24h já vencido', timedelta(hours=10), timedelta(days=-2), [('1h', timedelta(hours=9))]),
+    ('remarcado', timedelta(hours=26), timedelta(days=-2), [('24h', timedelta(hours=26)), ('1h', timedelta(hours=49))]),
+    ('remarcado após lembrete', timedelta(hours=28), timedelta(days=-2),
+     [('24h', timedelta(hours=4)), ('24h', timedelta(hours=28)), ('1h', timedelta(hours=51))]),
+    ('marcado pela versão antiga', timedelta(hours=20), timedelta(days=-2), [('1h', timedelta(hours=19))]),
+    ('vence na queda 1', timedelta(hours=40), timedelta(days=-2), [('24h', timedelta(hours=18)), ('1h', timedelta(hours=39))]),
+    ('começa na queda 1', timedelta(hours=17, minutes=20), timedelta(days=-2), []),
+    ('vence tudo na queda 2', timedelta(hours=85), timedelta(days=-2), [('1h', timedelta(hours=84, minutes=10))]),
+]
+# (nome, quando remarca, novo início), relativos a T0
+MOVES = [('remarcado', timedelta(hours=1), timedelta(hours=50)), ('remarcado após lembrete', timedelta(hours=5), timedelta(hours=52))]
+LEGACY = {'marcado pela versão antiga': ' | Lembrete_24h_OK'}
+OUTAGES = [(timedelta(hours=15), timedelta(hours=18)), (timedelta(hours=60), timedelta(hours=84, minutes=10))]
+DURATION = timedelta(hours=90)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--verbose', action='store_true', help="mostra os logs do motor")
+    parser.add_argument('--annotate', action='store_true', help="grava os marcadores na agenda (REMINDER_ANNOTATE_CALENDAR)")
+    args = parser.parse_args()
+    reminder_service.REMINDER_ANNOTATE_CALENDAR = args.annotate
+
+    load_messages()
+    database_manager.setup_database()
+    fake = get_calendar_service()
+
+    t0 = datetime.now(pytz.utc).replace(second=0, microsecond=0)
+    clock = {'now': t0}
+    engine = ReminderEngine(now_fn=lambda: clock['now'])
+    calendar_mirror.add_change_listener(engine.on_calendar_change)
+
+    event_ids, phones, expected = {}, {}, {}
+    for i, (name, start, created, reminders) in enumerate(SCENARIO):
+        phone = f"55379999{i:05d}"
+        event = fake.add_event(f"Cliente {i} - Alongamento", (t0 + start).astimezone(TZ),
+                               description=f"Contato: {phone} | Observações: Nenhuma{LEGACY.get(name, '')}", created=t0 + created)
+        event_ids[name], phones[f"{phone}@s.whatsapp.net"] = event['id'], name
+        expected[name] = [(kind, t0 + offset) for kind, offset in reminders]
+
+    stdout = sys.stdout
+    if not args.verbose:
+        sys.stdout = open(os.devnull, 'w')
+    try:
+        calendar_mirror.sync_calendar()
+        engine.rebuild()
+        calls_before = dict(fake.calls)
+        sent = {name: [] for name in expected}
+        seen = 0
+        was_down = False
+        while clock['now'] <= t0 + DURATION:
+            now = clock['now']
+            for name, at, new_start in MOVES:
+                if now == t0 + at:
+                    fake.move_event(event_ids[name], (t0 + new_start).astimezone(TZ))
+                    calendar_mirror.sync_calendar()
+
+            down = any(begin <= now - t0 < end for begin, end in OUTAGES)
+            if not down:
+                if was_down:
+                    engine.rebuild()   # reinício do bot
+                engine.run_pending()
+                rows = get_connection().execute(
+                    "SELECT id, user_id, message_text FROM outbound_queue WHERE id > ? ORDER BY id", (seen,)).fetchall()
+                for row in rows:
+                    kind = '24h' if '*amanhã*' in row['message_text'] else '1h'
+                    sent[phones[row['user_id']]].append((kind, now))
+                    seen = row['id']
+            was_down = down
+            clock['now'] = now + timedelta(minutes=1)
+    finally:
+        if sys.stdout is not stdout:
+            sys.stdout.close()
+        sys.stdout = stdout
+
+    failures = 0
+    for name, wanted in expected.items():
+        ok = sent[name] == wanted
+        failures += not ok
+        got = ', '.join(f"{kind}@T0+{(at - t0) / timedelta(hours=1):.2f}h" for kind, at in sent[name]) or '-'
+        print(f"{'PASS' if ok else 'FAIL'}  {name:<26} enviados: {got}")
+    api_calls = {method: count - calls_before.get(method, 0) for method, count in fake.calls.items()
+                 if method in ('patch', 'batch') and count > calls_before.get(method, 0)}
+    print(f"\n{len(expected) - failures}/{len(expected)} cenários OK | escritas na agenda: {api_calls or 'nenhuma'}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+"""
+Mostra em cascata (waterfall) os spans de uma mensagem gravados por tracing.py.
+
+Cada linha é uma etapa: início relativo ao primeiro span do trace, duração e uma barra na
+escala do trace inteiro, com os spans filhos indentados sob o pai. Lê também os arquivos
+rotacionados (traces.jsonl.1, .2, ...).
+
+Uso (a partir da pasta api/):
+    python -m tools.trace_waterfall                     (último trace)
+    python -m tools.trace_waterfall 3f2a9c              (trace pelo começo do id)
+    python -m tools.trace_waterfall --user 5537999990000 --last 5
+"""
+import os
+import json
+import argparse
+from datetime import datetime
+from collections import defaultdict
+
+import config
+
+BAR_WIDTH = 40
+
+
+def _load_spans(path):
+    files = [f"{path}.{i}" for i in range(config.TRACE_BACKUP_COUNT, 0, -1)] + [path]
+    spans = []
+    for file_path in files:
+        if not os.path.exists(file_path):
+            continue
+        with open(file_path, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    spans.append(json.loads(line))
+                except ValueError:
+                    continue  # linha cortada por uma rotação no meio da escrita
+    return spans
+
+
+def _group(spans):
+    traces = defaultdict(list)
+    for span in spans:
+        traces[span['trace_id']].append(span)
+    return sorted(traces.values(), key=lambda trace: min(span['start'] for span in trace))
+
+
+def _user_of(trace):
+    for span in trace:
+        user_id = span.get('attrs', {}).get('user_id')
+        if user_id:
+            return user_id
+    return None
+
+
+def _ordered_with_depth(trace):
+    """Spans em ordem de início, cada filho logo abaixo do pai."""
+    ids = {span['span_id'] for span in trace}
+    children = defaultdict(list)
+    for span in trace:
+        children[span['parent_id'] if span['parent_id'] in ids else None].append(span)
+    for siblings in children.values():
+        siblings.sort(key=lambda span: span['start'])
+
+    ordered = []
+
+    def visit(parent_id, depth):
+        for span in children.get(parent_id, []):
+            ordered.append((span, depth))
+            visit(span['span_id'], depth + 1)
+
+    visit(None, 0)
+    return ordered
+
+
+def _print_trace(trace):
+    begin = min(span['start'] for span in trace)
+    end = max(span['start'] + span['duration_ms'] / 1000 for span in trace)
+    total_ms = max((end - begin) * 1000, 0.001)
+    print(f"trace {trace[0]['trace_id']} | {_user_of(trace) or 'usuário ?'} | "
+          f"{datetime.fromtimestamp(begin):%d/%m %H:%M:%S} | {total_ms:.1f} ms | {len(trace)} spans")
+    print(f"{'início ms':>10} {'duração ms':>11}  {'':<{BAR_WIDTH}}  etapa")
+    for span, depth in _ordered_with_depth(trace):
+        offset_ms = (span['start'] - begin) * 1000
+        first = int(offset_ms / total_ms * BAR_WIDTH)
+        width = max(1, round(span['duration_ms'] / total_ms * BAR_WIDTH))
+        bar = (' ' * first + '█' * width)[:BAR_WIDTH].ljust(BAR_WIDTH)
+        attrs = {key: value for key, value in span.get('attrs', {}).items() if key != 'user_id'}
+        details = ' ' + ' '.join(f"{key}={value}" for key, value in attrs.items()) if attrs else ''
+        print(f"{offset_ms:>10.1f} {span['duration_ms']:>11.1f}  {bar}  {'  ' * depth}{span['name']}{details}")
+    print()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('trace_id', nargs='?', help="id do trace (ou o começo dele)")
+    parser.add_argument('--file', default=config.TRACE_FILE)
+    parser.add_argument('--user', help="só traces deste usuário (número ou parte do id do WhatsApp)")
+    parser.add_argument('--last', type=int, default=1, help="quantos traces mostrar (os mais recentes)")
+    args = parser.parse_args()
+
+    traces = _group(_load_spans(args.file))
+    if args.trace_id:
+        traces = [trace for trace in traces if trace[0]['trace_id'].startswith(args.trace_id)]
+    if args.user:
+        traces = [trace for trace in traces if args.user in (_user_of(trace) or '')]
+    if not traces:
+        print(f"Nenhum trace encontrado em {args.file}.")
+        return
+    for trace in traces[-args.last:]:
+        _print_trace(trace)
+
+
+if __name__ == '__main__':
+    main()
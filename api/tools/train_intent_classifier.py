@@ -0,0 +1,112 @@
+"""
+Treina o classificador local de intenções com os rótulos que a IA devolveu (tabela intent_labels).
+
+Separa uma parte das mensagens para teste (agrupando mensagens iguais, para não vazar),
+mostra acurácia por intenção, cobertura e acerto no limiar de confiança e a latência
+de predição; depois treina com tudo e grava o modelo versionado.
+
+Uso (a partir da pasta api/):
+    python -m tools.train_intent_classifier [--threshold 0.9] [--dry-run]
+"""
+import sys
+import time
+import random
+import argparse
+from collections import Counter, defaultdict
+
+import config
+import intent_classifier
+from ai_agent import normalize_text
+from connection_manager import get_connection
+
+
+def _load_samples(db_path, without_history):
+    query = "SELECT message, label FROM intent_labels"
+    if without_history:
+        query += " WHERE has_history = 0"
+    rows = get_connection(db_path).execute(query).fetchall()
+    return [(normalize_text(row['message']), row['label']) for row in rows]
+
+
+def _split(samples, test_ratio, seed):
+    by_text = defaultdict(list)
+    for text, label in samples:
+        by_text[text].append((text, label))
+    texts = sorted(by_text)
+    random.Random(seed).shuffle(texts)
+    cut = int(len(texts) * test_ratio)
+    test = [s for text in texts[:cut] for s in by_text[text]]
+    train = [s for text in texts[cut:] for s in by_text[text]]
+    return train, test
+
+
+def _evaluate(model, test, threshold):
+    per_label = defaultdict(lambda: {'total': 0, 'correct': 0})
+    answered = answered_correct = 0
+    latencies = []
+    for text, label in test:
+        start = time.perf_counter()
+        predicted, confidence = model.predict(text)
+        latencies.append((time.perf_counter() - start) * 1e6)
+        per_label[label]['total'] += 1
+        per_label[label]['correct'] += predicted == label
+        if confidence >= threshold and predicted.partition(':')[0] not in intent_classifier.NEVER_ANSWER:
+            answered += 1
+            answered_correct += predicted == label
+
+    latencies.sort()
+    correct = sum(stats['correct'] for stats in per_label.values())
+    return {
+        'n_test': len(test),
+        'accuracy': round(correct / len(test), 4),
+        'coverage': round(answered / len(test), 4),
+        'answered_accuracy': round(answered_correct / answered, 4) if answered else None,
+        'latency_us_p50': round(latencies[len(latencies) // 2], 1),
+        'latency_us_p95': round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))], 1),
+        'per_label': {label: stats for label, stats in sorted(per_label.items())},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--db', default=config.DB_PATH)
+    parser.add_argument('--out', default=config.INTENT_CLASSIFIER_PATH)
+    parser.add_argument('--threshold', type=float, default=config.INTENT_CLASSIFIER_THRESHOLD)
+    parser.add_argument('--test-ratio', type=float, default=0.2)
+    parser.add_argument('--alpha', type=float, default=0.1)
+    parser.add_argument('--min-per-label', type=int, default=5, help="rótulos com menos exemplos são ignorados")
+    parser.add_argument('--without-history', action='store_true', help="usa só mensagens classificadas sem histórico")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--dry-run', action='store_true', help="só mostra o relatório, não grava o modelo")
+    args = parser.parse_args()
+
+    samples = _load_samples(args.db, args.without_history)
+    label_counts = Counter(label for _, label in samples)
+    samples = [(text, label) for text, label in samples if label_counts[label] >= args.min_per_label]
+    if len({label for _, label in samples}) < 2:
+        print(f"Dados insuficientes: {len(samples)} exemplos rotulados ({dict(label_counts)}). Deixe o bot registrar mais respostas da IA.")
+        sys.exit(1)
+
+    train, test = _split(samples, args.test_ratio, args.seed)
+    print(f"{len(samples)} exemplos ({len(train)} treino / {len(test)} teste), {len(label_counts)} rótulos")
+
+    metrics = None
+    if test:
+        metrics = _evaluate(intent_classifier.train(train, args.alpha), test, args.threshold)
+        print(f"acurácia: {metrics['accuracy']:.1%} | no limiar {args.threshold}: cobre {metrics['coverage']:.1%} "
+              f"das mensagens com {metrics['answered_accuracy'] or 0:.1%} de acerto")
+        print(f"latência de predição: p50 {metrics['latency_us_p50']} µs | p95 {metrics['latency_us_p95']} µs")
+        for label, stats in metrics['per_label'].items():
+            print(f"  {label:<22} {stats['correct']:>5}/{stats['total']:<5} {stats['correct'] / stats['total']:.1%}")
+
+    model = intent_classifier.train(samples, args.alpha)
+    model.metrics = dict(metrics or {}, n_train=len(samples), threshold=args.threshold)
+    if args.dry_run:
+        print(f"(dry-run) modelo {model.version} não gravado.")
+        return
+    intent_classifier.save_model(model, args.out)
+    print(f"Modelo {model.version} gravado em {args.out}")
+
+
+if __name__ == '__main__':
+    main()
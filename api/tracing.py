@@ -0,0 +1,104 @@
+# --- Conteúdo do arquivo: api/tracing.py ---
+import re
+import json
+import time
+import uuid
+import logging
+import contextvars
+from functools import wraps
+from contextlib import contextmanager
+from logging.handlers import RotatingFileHandler
+from config import TRACING_ENABLED, TRACE_FILE, TRACE_MAX_BYTES, TRACE_BACKUP_COUNT
+
+# Rastreamento leve de uma mensagem de ponta a ponta:
+#   bot.js -> /check-state -> /webhook -> fila de entrada -> process_message -> handlers
+#   -> fila de envio -> /send-message
+# O trace id vem do gateway (cabeçalho X-Trace-Id ou campo traceId) ou é criado no /webhook,
+# viaja nas linhas das filas e volta para o gateway no envio. Cada etapa é um span, gravado
+# como uma linha JSON em TRACE_FILE. Sem trace ativo (ex.: lembretes), span() não faz nada.
+
+TRACE_HEADER = 'X-Trace-Id'
+_VALID_TRACE_ID = re.compile(r'^[A-Za-z0-9_-]{8,64}$')
+
+_trace_id = contextvars.ContextVar('trace_id', default=None)
+_span_id = contextvars.ContextVar('span_id', default=None)
+
+_logger = logging.getLogger('glassy.trace')
+_logger.propagate = False
+
+def _writer():
+    if not _logger.handlers:
+        handler = RotatingFileHandler(TRACE_FILE, maxBytes=TRACE_MAX_BYTES, backupCount=TRACE_BACKUP_COUNT, encoding='utf-8', delay=True)
+        handler.setFormatter(logging.Formatter('%(message)s'))
+        _logger.addHandler(handler)
+        _logger.setLevel(logging.INFO)
+    return _logger
+
+def new_trace_id():
+    return uuid.uuid4().hex
+
+def accept_trace_id(value):
+    """O trace id recebido de fora, se tiver formato válido; senão None."""
+    return value if isinstance(value, str) and _VALID_TRACE_ID.match(value) else None
+
+def current_trace_id():
+    return _trace_id.get()
+
+@contextmanager
+def start_trace(trace_id):
+    """Torna 'trace_id' o trace corrente neste contexto (thread/requisição). Com None, roda sem trace."""
+    trace_token = _trace_id.set(trace_id)
+    span_token = _span_id.set(None)
+    try:
+        yield _trace_id.get()
+    finally:
+        _span_id.reset(span_token)
+        _trace_id.reset(trace_token)
+
+def _write(trace_id, span_id, parent_id, name, start, duration_ms, attrs):
+    record = {'trace_id': trace_id, 'span_id': span_id, 'parent_id': parent_id, 'name': name,
+              'start': round(start, 6), 'duration_ms': round(duration_ms, 3)}
+    if attrs:
+        record['attrs'] = attrs
+    try:
+        _writer().info(json.dumps(record, ensure_ascii=False, default=str))
+    except Exception as e:
+        logging.warning(f"Não foi possível gravar o span '{name}': {e}")
+
+def record_span(name, start, end, trace_id=None, **attrs):
+    """Grava um span já medido (start/end em epoch, segundos), como a espera de uma linha na fila."""
+    trace_id = trace_id or _trace_id.get()
+    if TRACING_ENABLED and trace_id:
+        _write(trace_id, uuid.uuid4().hex[:16], _span_id.get() if trace_id == _trace_id.get() else None, name, start, (end - start) * 1000, attrs)
+
+@contextmanager
+def span(name, **attrs):
+    """Mede o bloco como um span filho do span corrente. Sem trace ativo, não faz nada."""
+    if not TRACING_ENABLED or _trace_id.get() is None:
+        yield
+        return
+    span_id = uuid.uuid4().hex[:16]
+    parent_id = _span_id.get()
+    token = _span_id.set(span_id)
+    start = time.time()
+    perf_start = time.perf_counter()
+    try:
+        yield
+    except BaseException as e:
+        attrs['error'] = e.__class__.__name__
+        raise
+    finally:
+        _span_id.reset(token)
+        _write(_trace_id.get(), span_id, parent_id, name, start, (time.perf_counter() - perf_start) * 1000, attrs)
+
+def traced(name=None):
+    """Decorador: cada chamada vira um span (por padrão 'módulo.função')."""
+    def decorator(fn):
+        span_name = name or f"{fn.__module__}.{fn.__name__}"
+
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(span_name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
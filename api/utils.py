@@ -10,15 +10,13 @@ from datetime import datetime, timedelta
 
 from config import AGENT_WHATSAPP_NUMBER
 
-from message_queue import queue_message
+from message_queue import queue_message, notify_queue_worker
 
 from message_manager import get_message
 
-import sqlite3
+import database_manager
 
-import json
-
-from config import DB_PATH
+import date_parser
 
 
 
@@ -30,43 +28,13 @@ def normalize_time_input(time_str: str) -> str:
 
     Normaliza a entrada de tempo do usuário para o formato HH:MM.
 
-    Exemplos: "7h" -> "07:00", "10" -> "10:00", "1330" -> "13:30"
-
-    """
-
-    if "manhã" in time_str.lower() or "manha" in time_str.lower():
-
-        return "09:00"
-
-
-
-    digits = re.sub(r'\D', '', time_str)
-
-
-
-    if len(digits) == 1:
-
-        return f"0{digits}:00"
-
-    if len(digits) == 2:
-
-        if int(digits) < 24:
-
-            return f"{digits}:00"
-
-    if len(digits) == 3:
-
-        return f"0{digits[0]}:{digits[1:]}"
-
-    if len(digits) == 4:
+    Exemplos: "7h" -> "07:00", "10" -> "10:00", "1330" -> "13:30", "3 da tarde" -> "15:00"
 
-        return f"{digits[:2]}:{digits[2:]}"
-
-
-
-    return ""
+    A leitura fica em date_parser.py; retorna "" se não houver horário.
 
+    """
 
+    return date_parser.parse_time(time_str)
 
 
 
@@ -226,9 +194,11 @@ def check_state_timeouts(timeout_minutes: int = 10):
 
     """
 
-    Verifica sessões inativas e as encerra se o tempo desde a última
+    Encerra, em uma única operação no banco, todas as sessões cujo último
+
+    estado foi salvo há mais de 'timeout_minutes' e enfileira o aviso de timeout.
 
-    atualização de estado ultrapassar 'timeout_minutes'.
+    O custo depende só da quantidade de sessões expiradas (consulta pelo índice de state_timestamp).
 
     """
 
@@ -236,98 +206,21 @@ def check_state_timeouts(timeout_minutes: int = 10):
 
     try:
 
-        conn = sqlite3.connect(DB_PATH, check_same_thread=False)
-
-        conn.row_factory = sqlite3.Row
-
-        cursor = conn.cursor()
-
-        
-
-        # --- AJUSTE APLICADO AQUI ---
-
-        # A query agora ignora também o estado de lembrete.
-
-        cursor.execute("SELECT user_id, data FROM conversations WHERE state NOT IN ('INITIAL', 'HUMAN_ATTENDANCE', 'AWAITING_REMINDER_CONFIRMATION')")
-
-        rows = cursor.fetchall()
-
-
-
-        now = datetime.now()
-
-        timeout_delta = timedelta(minutes=timeout_minutes)
-
+        cutoff = (datetime.now() - timedelta(minutes=timeout_minutes)).isoformat()
 
+        expired_users = database_manager.expire_inactive_sessions(cutoff, get_message('SESSION_TIMEOUT'))
 
-        for row in rows:
 
-            user_id = row['user_id']
 
-            
+        if expired_users:
 
-            # Pula se o campo 'data' for nulo ou vazio
+            notify_queue_worker()
 
-            if not row['data']:
-
-                continue
-
-
-
-            data = json.loads(row['data'])
-
-            timestamp_str = data.get('state_timestamp')
-
-
-
-            # Pula este usuário se, por algum motivo, ele não tiver um timestamp
-
-            if not timestamp_str:
-
-                continue
-
-
-
-            try:
-
-                last_update = datetime.fromisoformat(timestamp_str)
-
-                inactive_time = now - last_update
-
-
-
-                if inactive_time > timeout_delta:
-
-                    logging.info(
-
-                        f"Encerrando sessão de {user_id}. "
-
-                        f"Tempo inativo: {inactive_time} (maior que {timeout_delta})"
-
-                    )
-
-                    from database_manager import set_user_state_and_history
-
-                    set_user_state_and_history(user_id, "INITIAL", {}, [])
-
-                    queue_message(user_id, get_message('SESSION_TIMEOUT'))
-
-            
-
-            except (ValueError, TypeError):
-
-                # Ignora o registro se o timestamp estiver mal formatado
-
-                logging.warning(f"Timestamp inválido para o usuário {user_id}. Pulando verificação de timeout.")
-
-                continue
-
-
-
-        conn.close()
+            logging.info(f"Sessões encerradas por inatividade (> {timeout_minutes} min): {', '.join(expired_users)}")
 
 
 
     except Exception as e:
 
         logging.error(f"Erro CRÍTICO ao verificar timeouts de sessão: {e}", exc_info=True)
+
@@ -25,6 +25,10 @@ const fs = require('fs');
 
 
 
+const crypto = require('crypto');
+
+
+
 
 
 
@@ -121,6 +125,22 @@ app.post('/send-message', async (req, res) => {
 
 
 
+    // Trace id da mensagem que originou este envio (vem da fila de envio da API)
+
+
+
+    const traceId = req.get('X-Trace-Id') || req.body.traceId || '';
+
+
+
+    if (traceId) res.set('X-Trace-Id', traceId);
+
+
+
+    const startedAt = Date.now();
+
+
+
     if (!sock) {
 
 
@@ -213,7 +233,11 @@ app.post('/send-message', async (req, res) => {
 
 
 
-                res.status(200).json({ status: 'success', message: 'Mídia enviada' });
+                logger.info(`[Gateway] Mídia enviada para ${number} em ${Date.now() - startedAt} ms${traceId ? ` (trace ${traceId})` : ''}`);
+
+
+
+                res.status(200).json({ status: 'success', message: 'Mídia enviada', traceId: traceId || undefined });
 
 
 
@@ -225,7 +249,11 @@ app.post('/send-message', async (req, res) => {
 
 
 
-                res.status(200).json({ status: 'success', message: 'Texto enviado' });
+                logger.info(`[Gateway] Texto enviado para ${number} em ${Date.now() - startedAt} ms${traceId ? ` (trace ${traceId})` : ''}`);
+
+
+
+                res.status(200).json({ status: 'success', message: 'Texto enviado', traceId: traceId || undefined });
 
 
 
@@ -253,7 +281,7 @@ app.post('/send-message', async (req, res) => {
 
 
 
-        logger.error(err, 'Falha ao enviar mensagem via /send-message');
+        logger.error(err, `Falha ao enviar mensagem via /send-message${traceId ? ` (trace ${traceId})` : ''}`);
 
 
 
@@ -589,6 +617,18 @@ async function connectToWhatsApp() {
 
 
 
+        // Trace id desta mensagem: acompanha o /check-state, o /webhook e volta no /send-message da resposta.
+
+
+
+        const traceId = crypto.randomUUID().replace(/-/g, '');
+
+
+
+        const traceHeaders = { headers: { 'X-Trace-Id': traceId } };
+
+
+
 
 
 
@@ -601,7 +641,7 @@ async function connectToWhatsApp() {
 
 
 
-            logger.info(`[Gateway] Comando '${messageText}' detectado do ${sender} na conversa ${userId}`);
+            logger.info(`[Gateway] Comando '${messageText}' detectado do ${sender} na conversa ${userId} (trace ${traceId})`);
 
 
 
@@ -609,7 +649,7 @@ async function connectToWhatsApp() {
 
 
 
-                await axios.post(API_WEBHOOK_URL, { userId: userId, message: messageText });
+                await axios.post(API_WEBHOOK_URL, { userId: userId, message: messageText, traceId: traceId }, traceHeaders);
 
 
 
@@ -649,7 +689,7 @@ async function connectToWhatsApp() {
 
 
 
-            const stateResponse = await axios.post(`${API_WEBHOOK_URL.replace('/webhook', '')}/check-state`, { userId: userId });
+            const stateResponse = await axios.post(`${API_WEBHOOK_URL.replace('/webhook', '')}/check-state`, { userId: userId }, traceHeaders);
 
 
 
@@ -713,11 +753,11 @@ async function connectToWhatsApp() {
 
 
 
-            logger.info(`[Gateway] Mensagem recebida de ${userId}: "${messageText}"`);
+            logger.info(`[Gateway] Mensagem recebida de ${userId}: "${messageText}" (trace ${traceId})`);
 
 
 
-            await axios.post(API_WEBHOOK_URL, { userId: userId, message: messageText });
+            await axios.post(API_WEBHOOK_URL, { userId: userId, message: messageText, traceId: traceId }, traceHeaders);
 
 
 
@@ -729,7 +769,7 @@ async function connectToWhatsApp() {
 
 
 
-                logger.error(`[Gateway] Erro ao comunicar com a API: ${error.response.status} - ${JSON.stringify(error.response.data)}`);
+                logger.error(`[Gateway] Erro ao comunicar com a API: ${error.response.status} - ${JSON.stringify(error.response.data)} (trace ${traceId})`);
 
 
 
@@ -1,43 +1,37 @@
+import os
+import sys
 import streamlit as st
-import sqlite3
 import pandas as pd
 import json
 from streamlit_autorefresh import st_autorefresh # type: ignore
 
+# Usa a mesma camada de conexão da API (WAL, busy timeout, conexão reaproveitada por thread).
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'api'))
+from connection_manager import get_connection, transaction
+
 DB_PATH = r"C:\Users\Daniel\OneDrive\Documentos\Projetos\glassy-bot-cwai-termux\database\conversations.db"
 
 # -------------------
 # Funções de DB
 # -------------------
 def load_conversations():
-    conn = sqlite3.connect(DB_PATH, check_same_thread=False)
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
-    cursor.execute("SELECT user_id, state, data FROM conversations")
-    rows = cursor.fetchall()
-    conn.close()
-    return rows
+    cursor = get_connection(DB_PATH).execute("SELECT user_id, state, data, state_timestamp FROM conversations")
+    return cursor.fetchall()
 
 def get_bot_paused():
-    conn = sqlite3.connect(DB_PATH, check_same_thread=False)
-    cursor = conn.cursor()
-    cursor.execute("CREATE TABLE IF NOT EXISTS bot_control (id INTEGER PRIMARY KEY, paused INTEGER)")
-    cursor.execute("SELECT paused FROM bot_control WHERE id=1")
-    row = cursor.fetchone()
-    if row is None:
-        cursor.execute("INSERT INTO bot_control (id, paused) VALUES (1, 0)")
-        conn.commit()
-        conn.close()
-        return False
-    conn.close()
-    return bool(row[0])
+    with transaction(db_path=DB_PATH) as conn:
+        cursor = conn.cursor()
+        cursor.execute("CREATE TABLE IF NOT EXISTS bot_control (id INTEGER PRIMARY KEY, paused INTEGER)")
+        cursor.execute("SELECT paused FROM bot_control WHERE id=1")
+        row = cursor.fetchone()
+        if row is None:
+            cursor.execute("INSERT INTO bot_control (id, paused) VALUES (1, 0)")
+            return False
+        return bool(row[0])
 
 def set_bot_paused(value: bool):
-    conn = sqlite3.connect(DB_PATH, check_same_thread=False)
-    cursor = conn.cursor()
-    cursor.execute("UPDATE bot_control SET paused=? WHERE id=1", (1 if value else 0,))
-    conn.commit()
-    conn.close()
+    with transaction(db_path=DB_PATH) as conn:
+        conn.execute("UPDATE bot_control SET paused=? WHERE id=1", (1 if value else 0,))
 
 # -------------------
 # Auto-refresh
@@ -78,12 +72,11 @@ else:
     data = []
     for row in convs:
         user_id, state, data_json = row["user_id"], row["state"], row["data"]
+        timestamp = row["state_timestamp"] or ""
         try:
             data_dict = json.loads(data_json) if data_json else {}
-            timestamp = data_dict.get("state_timestamp", "")
             error = data_dict.get("error", "")
         except Exception:
-            timestamp = ""
             error = ""
         data.append((user_id, state, timestamp, error))
 